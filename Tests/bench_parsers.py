@@ -0,0 +1,176 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+import xml_output_parser as xop
+import tabulate_outs as to
+import tensor_output_reader as tor
+import synthetic_outputs as so
+
+parser = argparse.ArgumentParser(
+    description="""
+    Benchmark the output parsers and tensor converters on synthetic Molpro
+    outputs of increasing size. Reports the best and mean wall time and the
+    peak (traced) memory of every parser per size.
+    """
+)
+parser.add_argument('--orbitals', nargs='+', type=int, default=[5, 10, 15],
+                    help='orbital counts for the tensor benchmarks')
+parser.add_argument('--jobsteps', nargs='+', type=int, default=[5, 50],
+                    help='number of jobsteps in the XML benchmarks')
+parser.add_argument('--xml-orbitals', type=int, default=20,
+                    help='orbitals printed per jobstep in the XML benchmarks')
+parser.add_argument('--mb', nargs='+', type=float, default=[1, 10],
+                    help='file sizes (MB) for the XG output benchmarks')
+parser.add_argument('--repeat', '-r', type=int, default=3,
+                    help='number of timed repetitions per benchmark')
+parser.add_argument('--only', nargs='+', default=None,
+                    help='run only these benchmarks (see --list)')
+parser.add_argument('--list', action='store_true',
+                    help='list the benchmarks and exit')
+parser.add_argument('--save', default=None,
+                    help='save results to this JSON file, e.g. a baseline')
+parser.add_argument('--compare', default=None,
+                    help='JSON file with baseline results to compare against')
+parser.add_argument('--threshold', type=float, default=1.25,
+                    help='slowdown ratio w.r.t. the baseline reported as a regression')
+parser.add_argument('--workdir', default=None,
+                    help='folder for the generated files (default: temporary folder)')
+
+def bench_xmlener(workdir, n_jobsteps, n_orbitals):
+    path = os.path.join(workdir, f'bench_{n_jobsteps}_{n_orbitals}.xml')
+    so.write_xml_output(path, n_jobsteps=n_jobsteps, n_orbitals=n_orbitals)
+    return path, lambda: xop.get_xmlener(path)
+
+def bench_xg_energy_lines(workdir, size_mb):
+    path = os.path.join(workdir, f'bench_{size_mb}MB.out')
+    so.write_xg_output(path, size_mb=size_mb)
+    return path, lambda: to.get_xg_energy_lines(path)
+
+def bench_grab_def(workdir, n_orbitals):
+    path = os.path.join(workdir, f'bench_def_{n_orbitals}.out')
+    so.write_fortran_tensor(path, 'vmat', n_orbitals)
+    return path, lambda: tor.grab_tensor_from_def(path, 'vmat')
+
+def bench_grab_std(workdir, n_orbitals):
+    path = os.path.join(workdir, f'bench_std_{n_orbitals}.out')
+    so.write_cpp_tensor(path, 'VF[mnij]', n_orbitals)
+    return path, lambda: tor.grab_tensor_from_std(path, 'VF[mnij]')
+
+def bench_convert_to_full(workdir, n_orbitals):
+    path = os.path.join(workdir, f'bench_def_{n_orbitals}.out')
+    def_tensor = so.write_fortran_tensor(path, 'vmat', n_orbitals)
+    shape = (n_orbitals,) * 4
+    return None, lambda: tor.convert_to_full(def_tensor, shape)
+
+def get_benchmarks(args):
+    '''Returns list of (name, size_label, size, setup) for the requested sizes.'''
+    benchmarks = []
+    for n in args.jobsteps:
+        benchmarks.append(('get_xmlener', 'jobsteps', n,
+                           lambda w, n=n: bench_xmlener(w, n, args.xml_orbitals)))
+    for mb in args.mb:
+        benchmarks.append(('get_xg_energy_lines', 'MB', mb,
+                           lambda w, mb=mb: bench_xg_energy_lines(w, mb)))
+    for n in args.orbitals:
+        benchmarks.append(('grab_tensor_from_def', 'orbitals', n,
+                           lambda w, n=n: bench_grab_def(w, n)))
+        benchmarks.append(('grab_tensor_from_std', 'orbitals', n,
+                           lambda w, n=n: bench_grab_std(w, n)))
+        benchmarks.append(('convert_to_full', 'orbitals', n,
+                           lambda w, n=n: bench_convert_to_full(w, n)))
+    if args.only:
+        benchmarks = [b for b in benchmarks if b[0] in args.only]
+    return benchmarks
+
+def time_and_trace(func, repeat):
+    '''Returns (best, mean) wall time in s over `repeat` runs and the traced peak memory in MB.'''
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(times), sum(times) / len(times), peak / 1024**2
+
+def run_benchmarks(args, workdir):
+    results = []
+    for name, size_label, size, setup in get_benchmarks(args):
+        path, func = setup(workdir)
+        file_mb = os.path.getsize(path) / 1024**2 if path else 0.0
+        best, mean, peak = time_and_trace(func, args.repeat)
+        result = dict(
+            bench=name, size_label=size_label, size=size, file_mb=round(file_mb, 3),
+            best_s=best, mean_s=mean, peak_mb=round(peak, 3),
+        )
+        print(f"{name:22s} {size_label:>9s}={size:<8g} file={file_mb:9.3f} MB "
+              f"best={best:10.5f} s  mean={mean:10.5f} s  peak={peak:9.3f} MB")
+        results.append(result)
+    return results
+
+def compare_to_baseline(results, baseline_file, threshold):
+    '''Print time ratios w.r.t. a baseline and return the list of regressions.'''
+    with open(baseline_file, 'r') as f:
+        baseline = json.load(f)
+    base = {(r['bench'], r['size']): r for r in baseline['results']}
+    regressions = []
+    print(f"\nComparison to {baseline_file} (ratio = new / baseline):")
+    for r in results:
+        key = (r['bench'], r['size'])
+        if key not in base:
+            continue
+        ratio = r['best_s'] / base[key]['best_s']
+        mem_ratio = r['peak_mb'] / base[key]['peak_mb'] if base[key]['peak_mb'] else float('nan')
+        flag = ''
+        if ratio > threshold:
+            flag = '  <-- REGRESSION'
+            regressions.append(r)
+        print(f"{r['bench']:22s} {r['size_label']:>9s}={r['size']:<8g} "
+              f"time x{ratio:6.2f}  memory x{mem_ratio:6.2f}{flag}")
+    return regressions
+
+def main(args):
+    if args.list:
+        for name in sorted({b[0] for b in get_benchmarks(args)}):
+            print(name)
+        return 0
+
+    if args.workdir:
+        os.makedirs(args.workdir, exist_ok=True)
+        results = run_benchmarks(args, args.workdir)
+    else:
+        with tempfile.TemporaryDirectory() as workdir:
+            results = run_benchmarks(args, workdir)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(dict(
+                python=platform.python_version(),
+                machine=platform.machine(),
+                node=platform.node(),
+                time=time.strftime("%Y-%m-%d %H:%M:%S"),
+                results=results,
+            ), f, indent=1)
+        print(f"Saved results to {args.save}")
+
+    if args.compare:
+        regressions = compare_to_baseline(results, args.compare, args.threshold)
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    sys.exit(main(args))
@@ -0,0 +1,181 @@
+'''
+Generators of synthetic Molpro outputs, used for benchmarking and testing the
+parsers without having to run Molpro. The layout of the generated files
+follows real outputs (see `comp_between_default_and_standard_cu/`), the
+numbers are random.
+'''
+import numpy as np
+
+XML_HEADER = '''<?xml version="1.0"?>
+<molpro xmlns="http://www.molpro.net/schema/molpro-output"
+  xmlns:xsd="http://www.w3.org/1999/XMLSchema"
+  xmlns:cml="http://www.xml-cml.org/schema"
+  xmlns:stm="http://www.xml-cml.org/schema"
+  xmlns:xhtml="http://www.w3.org/1999/xhtml">
+ <job>
+'''
+
+XML_FOOTER = ''' </job>
+</molpro>
+'''
+
+FILLER_LINE = " Variables initialized (1064), CPU time= 0.01 sec  -- synthetic filler line\n"
+
+def _xml_orbitals(n_orbitals, rng):
+    lines = ['   <orbitals method="RHF" type="canonical" basis="AO">\n']
+    for n in range(n_orbitals):
+        coeffs = ' '.join(f'{c:.10f}' for c in rng.standard_normal(n_orbitals))
+        lines.append(
+            f'    <orbital symmetryID="1" energy="{-n * 0.1:.6f}" occupation="2.0">'
+            f'{coeffs}</orbital>\n'
+        )
+    lines.append('   </orbitals>\n')
+    return ''.join(lines)
+
+def _xml_jobstep(command, method, energies, n_orbitals, rng):
+    lines = [f'  <jobstep command="{command}" commandset="SYNTHETIC">\n']
+    for name, value in energies.items():
+        lines.append(
+            f'   <property name="{name}" method="{method}" principal="true"'
+            f' stateSymmetry="1" stateNumber="1" value="{value:.12f}"/>\n'
+        )
+    if n_orbitals:
+        lines.append(_xml_orbitals(n_orbitals, rng))
+    lines.append('   <time start="00:00:00" end="00:00:01" cpu="0.5" system="0.1" real="0.6"/>\n')
+    lines.append('  </jobstep>\n')
+    return ''.join(lines)
+
+def write_xml_output(path, n_jobsteps=3, n_f12=1, n_orbitals=0, seed=0, variables=None):
+    '''Write a Molpro-like XML output.
+
+    Arguments:
+        path: <str> file to write
+        n_jobsteps: <int> number of DF-HF/DF-MP2 jobsteps preceding the F12 ones
+        n_f12: <int> number of DF-MP2-F12 jobsteps (1 for a single point output)
+        n_orbitals: <int> number of orbitals printed per jobstep (controls file size)
+        variables: <dict> name -> list of values written to the <variables> section
+
+    Returns:
+        energies: <list of dict> 'total energy' and 'correlation energy' of each
+            DF-MP2-F12 jobstep, in order
+    '''
+    rng = np.random.default_rng(seed)
+    f12_energies = []
+    with open(path, 'w') as out:
+        out.write(XML_HEADER)
+        for n in range(n_jobsteps):
+            command, method = ('DF-HF', 'RHF') if n % 2 == 0 else ('DF-MP2', 'DF-MP2')
+            out.write(_xml_jobstep(
+                command, method, {'Energy': -128.5 + 0.01 * rng.random()}, n_orbitals, rng
+            ))
+        for n in range(n_f12):
+            corr = -0.3 - 0.01 * rng.random()
+            energies = {'total energy': -128.5 + corr, 'correlation energy': corr}
+            f12_energies.append(energies)
+            out.write(_xml_jobstep('DF-MP2-F12', 'DF-MP2-F12', energies, n_orbitals, rng))
+        if variables:
+            out.write('  <variables>\n')
+            for name, values in variables.items():
+                out.write(f'   <variable name="{name}" type="xsd:double" length="{len(values)}">\n')
+                out.write(''.join(f'    <value>{v}</value>\n' for v in values))
+                out.write('   </variable>\n')
+            out.write('  </variables>\n')
+        out.write(XML_FOOTER)
+    return f12_energies
+
+def write_xg_output(path, size_mb=0.1, terminated=True, seed=0):
+    '''Write a Molpro-like XG `.out` file of roughly `size_mb` MB.
+
+    Returns:
+        energies: <dict> 'total energy' and 'correlation energy' printed in the file
+    '''
+    rng = np.random.default_rng(seed)
+    corr = -0.5 - 0.1 * rng.random()
+    energies = {'total energy': -1639.0 + corr, 'correlation energy': corr}
+    n_filler = max(int(size_mb * 1024**2 / len(FILLER_LINE)) // 2, 1)
+    with open(path, 'w') as out:
+        out.write(FILLER_LINE * n_filler)
+        out.write(" Printing Energies step by step\n")
+        out.write(f"  MP2-F12 correlation energy           {energies['correlation energy']:.12f}\n")
+        out.write(f" !MP2-F12 total energy              {energies['total energy']:.12f}\n")
+        out.write(" F12-XG CALCULATIONS END\n")
+        out.write(FILLER_LINE * n_filler)
+        if terminated:
+            out.write(" Molpro calculation terminated\n")
+    return energies
+
+def write_fortran_tensor(path, tensor_name, n_orbitals, seed=0, mode='w'):
+    '''Write a tensor as printed by the FORTRAN code (`BEGIN TENSOR PRINT`),
+    with dims nij x nkl x 2 where nij = nkl = n(n+1)/2.
+
+    Returns:
+        tensor: <np.3darray> the tensor as read by `grab_tensor_from_def`, (nz, ny, nx)
+    '''
+    rng = np.random.default_rng(seed)
+    npair = n_orbitals * (n_orbitals + 1) // 2
+    tensor = rng.standard_normal((2, npair, npair)).round(10)
+    with open(path, mode) as out:
+        out.write(f"BEGIN TENSOR PRINT: {tensor_name}\n")
+        out.write(f"dims: {npair:5d} {npair:5d} {2:2d}\n")
+        for z in range(2):
+            for y in range(npair):
+                out.write(''.join(
+                    f"{x + 1:5d} {y + 1:5d} {z + 1:2d} {tensor[z, y, x]:19.10f}\n"
+                    for x in range(npair)
+                ))
+        out.write(f"END TENSOR PRINT: {tensor_name}\n")
+    return tensor
+
+def write_cpp_tensor(path, tensor_name, n_orbitals, seed=0, mode='w'):
+    '''Write a 4-index tensor as dumped by the C++ code (`Dump of tensor`),
+    one `Block [ i j k l ]` per (k, l) with l the slow index.
+
+    Returns:
+        tensor: <np.4darray> the tensor as read by `grab_tensor_from_std`
+    '''
+    n = n_orbitals
+    rng = np.random.default_rng(seed)
+    tensor = rng.standard_normal((n, n, n, n)).round(8)
+    with open(path, mode) as out:
+        out.write("\n ===========================================\n")
+        out.write(f" Dump of tensor: df_mp2-f12_synthetic::{tensor_name}\n")
+        out.write(f" Properties: {{ rk: 4 dim: ({n} x {n} x {n} x {n}) sym: ( 1 , [ [0,1] , [2,3] ] )  irp : 0 }}\n")
+        out.write(f" Provided Range = [0,{n})x[0,{n})x[0,{n})x[0,{n})\n")
+        header = ' ' * 14 + ''.join(f"{j:14d}" for j in range(n)) + '\n'
+        for l in range(n):
+            for k in range(n):
+                out.write(f"   IrrepBlock ir(0)=0 ir(1)=0, SlowIdx blocks: {k:4d} {l:3d}\n")
+                out.write(f"   Sizes in current block: {n:8d} {n:7d} {1:7d} {1:7d}   -- offsets: {0:8d} {0:7d} {k:7d} {l:7d}\n")
+                out.write(f"\n Block  [    i    j {k:3d} {l:3d} ]\n")
+                out.write(header)
+                for i in range(n):
+                    out.write(f"{i:9d}   " + ''.join(f"{v:14.8f}" for v in tensor[i, :, k, l]) + '\n')
+        out.write("\n ===========================================\n")
+    return tensor
+
+
+def write_sweep(folder, meta, template='memory,100,m\n! {full_file_prefix}\n', reference_template=None):
+    '''Write `metadata.json` and the template(s) of a sweep into `folder` and
+    generate its inputs with `generate_inputs_and_folders.py`.
+
+    Returns:
+        metadata_path: <str>
+    '''
+    import os
+    import json
+    from argparse import Namespace
+    from systems import generate_inputs_and_folders as giaf
+
+    os.makedirs(folder, exist_ok=True)
+    meta = dict(meta, template='sweep.tinp')
+    with open(os.path.join(folder, 'sweep.tinp'), 'w') as f:
+        f.write(template)
+    if reference_template is not None:
+        meta['reference_template'] = 'reference.tinp'
+        with open(os.path.join(folder, 'reference.tinp'), 'w') as f:
+            f.write(reference_template)
+    metadata_path = os.path.join(folder, 'metadata.json')
+    with open(metadata_path, 'w') as f:
+        json.dump(meta, f, indent=4)
+    giaf.write_generated_files(Namespace(metadata_path=metadata_path, dry_run=False, output=None), meta)
+    return metadata_path
@@ -1,5 +1,9 @@
-import numpy as np
+import os
+import json
+import struct
 import itertools
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 
 def grab_tensor_from_def(outfile, tensor_name):
     '''Read tensor `tensor_name` from a given `outfile` in which 
@@ -156,5 +160,384 @@ def convert_to_full(def_tensor, shape):
         
     return full_tensor
 
-                        
-                
\ No newline at end of file
+
+def load_tensors(outfiles, tensor_name, fmt='std', max_workers=None):
+    '''Read the same tensor from several output files, concurrently in a thread pool.
+
+    Arguments: as for `load_tensor_stack`
+
+    Returns:
+        tensors: <list of numpy.ndarray> one per output file, in order
+    '''
+    grab = {'std': grab_tensor_from_std, 'def': grab_tensor_from_def, 'bin': read_tensor_binary}[fmt]
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(lambda outfile: grab(outfile, tensor_name), outfiles))
+
+def load_tensor_stack(outfiles, tensor_name, fmt='std', max_workers=None):
+    '''Read the same tensor from several output files into one stacked array.
+    The files are read concurrently in a thread pool (see `load_tensors`).
+
+    Arguments:
+        outfiles: <list of str> paths to output files, e.g. one per gamma_set
+        tensor_name: <str> name of the tensor, e.g. `VF[mnij]` (C++) or `vmat` (FORTRAN)
+        fmt: <str> 'std' for C++ tensor dumps, 'def' for FORTRAN prints, 'bin' for binary dumps
+        max_workers: <int> number of threads, default as in ThreadPoolExecutor
+
+    Returns:
+        stack: <numpy.ndarray> of shape (len(outfiles), *tensor.shape)
+    '''
+    tensors = load_tensors(outfiles, tensor_name, fmt=fmt, max_workers=max_workers)
+    shapes = {tensor.shape for tensor in tensors}
+    if len(shapes) > 1:
+        raise ValueError(f"Tensor '{tensor_name}' has different shapes in the outputs: {sorted(shapes)}")
+    return np.stack(tensors)
+
+def _deviation(stack, reference):
+    '''stack - reference, with `reference` an index into the stack or an array.'''
+    if np.ndim(reference) == 0:
+        reference = stack[reference]
+    return stack - reference
+
+def stack_spread(stack):
+    '''Per-element spread (max - min) and standard deviation over the stack.
+
+    Returns:
+        spread, std: <numpy.ndarray> each of the shape of a single tensor
+    '''
+    return np.ptp(stack, axis=0), np.std(stack, axis=0)
+
+def max_deviation(stack, reference=0):
+    '''Largest absolute deviation of every tensor of the stack from the reference,
+    and where it occurs.
+
+    Arguments:
+        stack: <numpy.ndarray> as returned by `load_tensor_stack()`
+        reference: <int> index of the reference tensor in the stack, or a tensor
+
+    Returns:
+        values: <numpy.ndarray> shape (N,), max |T_n - T_ref|
+        locations: <numpy.ndarray> shape (N, ndim), index (i,j,k,l) of the maximum
+    '''
+    dev = np.abs(_deviation(stack, reference)).reshape(len(stack), -1)
+    flat = np.argmax(dev, axis=1)
+    values = dev[np.arange(len(stack)), flat]
+    locations = np.stack(np.unravel_index(flat, stack.shape[1:]), axis=-1)
+    return values, locations
+
+def block_rms(stack, reference=0, block_axes=2):
+    '''RMS deviation from the reference per block, a block being labelled by the
+    last `block_axes` indices (e.g. (k,l) of `Block [ i j k l ]` in C++ dumps).
+
+    Returns:
+        rms: <numpy.ndarray> shape (N, *tensor.shape[-block_axes:])
+    '''
+    dev = _deviation(stack, reference)
+    inner = tuple(range(1, stack.ndim - block_axes))
+    return np.sqrt(np.mean(dev**2, axis=inner))
+
+def top_blocks(rms, n=10):
+    '''The `n` blocks with the largest RMS deviation over all tensors of the stack.
+
+    Arguments:
+        rms: <numpy.ndarray> as returned by `block_rms()`
+
+    Returns:
+        blocks: <numpy.ndarray> shape (n, block_axes), block indices, largest first
+        values: <numpy.ndarray> shape (n,), their largest RMS over the stack
+    '''
+    worst = rms.max(axis=0)
+    order = np.argsort(worst, axis=None)[::-1][:n]
+    blocks = np.stack(np.unravel_index(order, worst.shape), axis=-1)
+    return blocks, worst.ravel()[order]
+
+
+def iter_blocks_from_std(outfile, tensor_name):
+    '''Stream the tensor `tensor_name` of a C++ dump (see `grab_tensor_from_std`)
+    one `Block [ i j k l ]` at a time, without allocating the full tensor.
+
+    Arguments:
+        outfile: <str> path to output file
+        tensor_name: <str> name of tensor as printed out in C++ script. E.g. `VF[mnij]`
+
+    Yields:
+        offsets: <tuple of int> index of the first element of the block in the full tensor
+        block: <numpy.ndarray> the block, with the same number of dimensions as the tensor
+            (size 1 along the fixed indices), i.e.
+            `tensor[tuple(slice(o, o + s) for o, s in zip(offsets, block.shape))] = block`
+    '''
+    def finish(fixed, j_offset, rows, values):
+        # rows are printed with their index in the full tensor, as read by grab_tensor_from_std
+        block = np.array(values).reshape((len(rows), len(values[0])) + (1,) * len(fixed))
+        return (rows[0], j_offset) + tuple(fixed), block
+
+    with open(outfile, 'r') as inp:
+        dims = None
+        fixed = None
+        j_offset = 0
+        rows, values = [], []
+        for line in inp:
+            if dims is None:
+                if 'Dump of tensor' in line and tensor_name in line:
+                    dims = [int(x) for x in next(inp).split('dim: (')[1].split(') sym:')[0].split('x')]
+                continue
+
+            words = line.split()
+            if fixed is not None:
+                try:
+                    rows.append(int(words[0]))
+                    values.append([float(x) for x in words[1:]])
+                    continue
+                except (ValueError, IndexError):
+                    if rows:
+                        yield finish(fixed, j_offset, rows, values)
+                        if fixed == [d - 1 for d in dims[2:]]:
+                            return
+                    fixed, rows, values = None, [], []
+                    if not words:
+                        continue
+
+            if '-- offsets:' in line:
+                j_offset = int(line.split('-- offsets:')[1].split()[1])
+            elif line.startswith(' Block'):
+                # fixed (slow) indices of `Block [ i j k l ]`
+                fixed = [int(x) for x in line.split('[')[1].split(']')[0].split()[2:]]
+                # header of column indices
+                next(inp)
+            elif line.startswith(' ====') or 'Dump of tensor' in line:
+                return
+        if fixed is not None and rows:
+            yield finish(fixed, j_offset, rows, values)
+
+def iter_blocks_from_def(outfile, tensor_name):
+    '''Stream the tensor `tensor_name` printed by the FORTRAN code (see
+    `grab_tensor_from_def`) one z-slice at a time. The print is expected
+    in the order of the FORTRAN loops, i.e. with z the slowest index.
+
+    Yields:
+        offsets: <tuple of int> (z, 0, 0)
+        block: <numpy.ndarray> shape (1, ny, nx), the slice `tensor[z:z+1, :, :]`
+    '''
+    with open(outfile, 'r') as inp:
+        read = False
+        z_slice, z_current = None, None
+        for line in inp:
+            if not read:
+                if f'BEGIN TENSOR PRINT: {tensor_name}' in line:
+                    read = True
+                    nx, ny, _ = [int(d) for d in next(inp).lstrip('dims: ').split()]
+                continue
+            if 'END TENSOR PRINT' in line:
+                break
+
+            words = line.split()
+            x, y, z = [int(c)-1 for c in words[:-1]]
+            if z != z_current:
+                if z_slice is not None:
+                    yield (z_current, 0, 0), z_slice[None]
+                z_slice, z_current = np.zeros((ny, nx)), z
+            z_slice[y, x] = float(words[-1])
+        if z_slice is not None:
+            yield (z_current, 0, 0), z_slice[None]
+
+def iter_tensor_blocks(outfile, tensor_name, fmt='std'):
+    '''`iter_blocks_from_std` for fmt 'std' (C++ dumps), `iter_blocks_from_def` for 'def' (FORTRAN),
+    `iter_blocks_from_bin` for 'bin' (binary dumps).'''
+    if fmt == 'std':
+        return iter_blocks_from_std(outfile, tensor_name)
+    if fmt == 'bin':
+        return iter_blocks_from_bin(outfile, tensor_name)
+    return iter_blocks_from_def(outfile, tensor_name)
+
+def stream_norms(blocks):
+    '''Frobenius norm and max |T| of a tensor given as a stream of (offsets, block).
+
+    Returns:
+        norm: <float>
+        max_abs: <float>
+        location: <tuple of int> index of max |T| in the full tensor
+        size: <int> number of elements streamed
+    '''
+    sum_sq, max_abs, location, size = 0.0, 0.0, None, 0
+    for offsets, block in blocks:
+        sum_sq += np.sum(block**2)
+        size += block.size
+        if not block.size:
+            continue
+        flat = np.argmax(np.abs(block))
+        value = abs(block.flat[flat])
+        if location is None or value > max_abs:
+            max_abs = value
+            location = tuple(int(o + i) for o, i in zip(offsets, np.unravel_index(flat, block.shape)))
+    return np.sqrt(sum_sq), max_abs, location, size
+
+def stream_max_abs_diff(blocks, other_blocks):
+    '''max |T - U| of two tensors streamed block by block, e.g. the same tensor
+    from two outputs. Both streams must have the same blocks in the same order.
+
+    Returns:
+        value: <float> max |T - U|
+        location: <tuple of int> its index in the full tensor
+    '''
+    value, location = 0.0, None
+    for (offsets, block), (other_offsets, other) in itertools.zip_longest(
+            blocks, other_blocks, fillvalue=(None, None)):
+        if offsets is None or other_offsets is None:
+            raise ValueError("Tensor streams have different numbers of blocks")
+        if tuple(offsets) != tuple(other_offsets) or block.shape != other.shape:
+            raise ValueError(
+                f"Blocks differ: {block.shape} at {offsets} vs {other.shape} at {other_offsets}"
+            )
+        if not block.size:
+            continue
+        diff = np.abs(block - other)
+        flat = np.argmax(diff)
+        if location is None or diff.flat[flat] > value:
+            value = diff.flat[flat]
+            location = tuple(int(o + i) for o, i in zip(offsets, np.unravel_index(flat, block.shape)))
+    return value, location
+
+def stream_histogram(blocks, bins=np.arange(-16, 5), log=True):
+    '''Histogram of a tensor streamed block by block, with fixed bin edges.
+
+    Arguments:
+        blocks: iterable of (offsets, block)
+        bins: <array> bin edges; the default are decades of |T| for log=True
+        log: <bool> histogram log10|T| instead of T. Values outside the edges
+            (incl. exact zeros for log=True) are counted in the first/last bin.
+
+    Returns:
+        counts: <numpy.ndarray> shape (len(bins) - 1,)
+        bins: <numpy.ndarray> the bin edges
+    '''
+    bins = np.asarray(bins, dtype=float)
+    counts = np.zeros(len(bins) - 1, dtype=np.int64)
+    for _, block in blocks:
+        values = block.ravel()
+        if log:
+            with np.errstate(divide='ignore'):
+                values = np.log10(np.abs(values))
+        values = np.clip(values, bins[0], bins[-1])
+        counts += np.histogram(values, bins=bins)[0]
+    return counts, bins
+
+
+# Binary tensor dumps (`.tensor`), version 1. All integers little-endian.
+#
+#   bytes 0-7    magic b'XGTENSOR'
+#   bytes 8-11   uint32 format version (1)
+#   bytes 12-15  uint32 length of the JSON header in bytes
+#   bytes 16-    JSON header (UTF-8), e.g.
+#                {"name": "VF[mnij]", "dims": [5, 5, 5, 5], "dtype": "<f8",
+#                 "order": "C", "symmetry": "( 1 , [ [0,1] , [2,3] ] )",
+#                 "data_offset": 192}
+#   data_offset  the raw data, dims in C order, at a multiple of TENSOR_ALIGN
+TENSOR_MAGIC = b'XGTENSOR'
+TENSOR_VERSION = 1
+TENSOR_ALIGN = 64
+
+def write_tensor_header(f, name, dims, symmetry='', dtype='<f8', **extra):
+    '''Write the header of a binary tensor dump to the binary file `f`,
+    including the padding up to the data. Returns the header (dict).'''
+    header = dict(name=name, dims=[int(d) for d in dims], dtype=np.dtype(dtype).str,
+                  order='C', symmetry=symmetry, **extra)
+    # data_offset is part of the header, so fix it with a padded placeholder first
+    header['data_offset'] = 0
+    size = 16 + len(json.dumps(header).encode()) + 20
+    header['data_offset'] = -(-size // TENSOR_ALIGN) * TENSOR_ALIGN
+    encoded = json.dumps(header).encode()
+
+    f.write(TENSOR_MAGIC)
+    f.write(struct.pack('<II', TENSOR_VERSION, len(encoded)))
+    f.write(encoded)
+    f.write(b'\0' * (header['data_offset'] - 16 - len(encoded)))
+    return header
+
+def write_tensor_binary(path, tensor, name, symmetry='', **extra):
+    '''Write `tensor` as a binary tensor dump (float64, see TENSOR_MAGIC).
+
+    Arguments:
+        path: <str> file to write, by convention `*.tensor`
+        tensor: <numpy.ndarray>
+        name: <str> name of the tensor, e.g. `VF[mnij]`
+        symmetry: <str> symmetry as printed in the C++ dump, if any
+        extra: further header entries (JSON serializable), e.g. source=outfile
+    '''
+    tensor = np.ascontiguousarray(tensor, dtype='<f8')
+    with open(path, 'wb') as f:
+        write_tensor_header(f, name, tensor.shape, symmetry, **extra)
+        tensor.tofile(f)
+
+def read_tensor_header(path):
+    '''Header (dict) of a binary tensor dump. Raises ValueError if `path` is not one.'''
+    with open(path, 'rb') as f:
+        magic = f.read(len(TENSOR_MAGIC))
+        if magic != TENSOR_MAGIC:
+            raise ValueError(f"{path} is not a binary tensor dump")
+        version, length = struct.unpack('<II', f.read(8))
+        if version != TENSOR_VERSION:
+            raise ValueError(f"{path}: unsupported tensor dump version {version}")
+        return json.loads(f.read(length))
+
+def read_tensor_binary(path, tensor_name=None, mmap=True):
+    '''Read a binary tensor dump without parsing: a read-only `np.memmap`
+    of the data (no copy, pages are read on access) or, with mmap=False,
+    an array read with `np.fromfile`.
+
+    Arguments:
+        path: <str> binary tensor dump
+        tensor_name: <str> if given, must be contained in the name in the header
+        mmap: <bool> memory-map instead of reading the data
+
+    Returns:
+        tensor: <numpy.ndarray> of the dims in the header
+    '''
+    header = read_tensor_header(path)
+    if tensor_name and tensor_name not in header['name']:
+        raise ValueError(f"{path} holds tensor '{header['name']}', not '{tensor_name}'")
+    dims = tuple(header['dims'])
+    if mmap:
+        return np.memmap(path, dtype=header['dtype'], mode='r', offset=header['data_offset'], shape=dims)
+    return np.fromfile(path, dtype=header['dtype'], offset=header['data_offset'],
+                       count=int(np.prod(dims))).reshape(dims)
+
+def iter_blocks_from_bin(path, tensor_name=None):
+    '''Stream a binary tensor dump in slices of the first index, like the
+    other `iter_blocks_from_*`: ((i, 0, ...), tensor[i:i+1]).'''
+    tensor = read_tensor_binary(path, tensor_name)
+    for i in range(len(tensor)):
+        yield (i,) + (0,) * (tensor.ndim - 1), tensor[i:i + 1]
+
+def read_dump_properties(outfile, tensor_name, fmt='std'):
+    '''dims (in the order of the tensor as read by `grab_tensor_from_*`) and
+    symmetry of a tensor in a text dump, reading only up to its header.'''
+    with open(outfile, 'r') as inp:
+        for line in inp:
+            if fmt == 'std' and 'Dump of tensor' in line and tensor_name in line:
+                line = next(inp)
+                dims = [int(x) for x in line.split('dim: (')[1].split(') sym:')[0].split('x')]
+                symmetry = line.split(') sym:')[1].split('irp')[0].strip()
+                return dims, symmetry
+            if fmt == 'def' and f'BEGIN TENSOR PRINT: {tensor_name}' in line:
+                nx, ny, nz = [int(d) for d in next(inp).lstrip('dims: ').split()]
+                return [nz, ny, nx], ''
+    raise ValueError(f"Tensor '{tensor_name}' not found in {outfile}")
+
+def convert_text_dump(outfile, tensor_name, path, fmt='std'):
+    '''Convert a tensor of a text dump (C++ 'std' or FORTRAN 'def') to a
+    binary tensor dump at `path`. The blocks are streamed into a memory
+    map of the new file, so the tensor is never held in memory as a whole.
+    Values keep the precision of the text dump.
+
+    Returns:
+        header: <dict> header of the written dump
+    '''
+    dims, symmetry = read_dump_properties(outfile, tensor_name, fmt)
+    with open(path, 'wb') as f:
+        header = write_tensor_header(f, tensor_name, dims, symmetry, source=os.path.basename(outfile), text_format=fmt)
+        f.truncate(header['data_offset'] + 8 * int(np.prod(dims)))
+    tensor = np.memmap(path, dtype='<f8', mode='r+', offset=header['data_offset'], shape=tuple(dims))
+    for offsets, block in iter_tensor_blocks(outfile, tensor_name, fmt=fmt):
+        tensor[tuple(slice(o, o + s) for o, s in zip(offsets, block.shape))] = block
+    tensor.flush()
+    del tensor
+    return header
@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from systems import cbs_extrapolation as cbs
+
+
+def test_basis_cardinal():
+    for basis, cardinal in [('cc-pVDZ-F12', 2), ('cc-pVTZ-F12', 3), ('aug-cc-pVQZ', 4),
+                            ('cc-pV(T+d)Z', 3), ('avtz', 3), ('cc-pV5Z', 5)]:
+        assert cbs.basis_cardinal(basis) == cardinal
+    with pytest.raises(ValueError):
+        cbs.basis_cardinal('def2-TZVPP')
+
+
+def test_cbs_extrapolates_correlation_only():
+    bases = ['cc-pVDZ-F12', 'cc-pVTZ-F12', 'cc-pVQZ-F12']
+    hf = [-128.48, -128.53, -128.54]
+    e_cbs, a = -0.40, 0.3
+    corr = [e_cbs + a * x**-7.0 for x in (2, 3, 4)]
+    df = pd.DataFrame({
+        'bases': bases, 'distances': 9999.0,
+        'total energy': np.add(hf, corr), 'correlation energy': corr,
+    })
+    out = cbs.extrapolate_correlation(df, 'correlation energy', 'total energy', exponent=7.0)
+    assert np.isclose(out['CBS_34'].iloc[0], e_cbs)
+    assert np.isclose(out['HF'].iloc[0], hf[-1])
+    assert np.isclose(out['CBS_34_total'].iloc[0], hf[-1] + e_cbs)
+    with pytest.raises(ValueError):
+        cbs.extrapolate_correlation(df, 'total energy')
+
+
+def test_natural_spline_matches_scipy():
+    from scipy.interpolate import CubicSpline
+    from systems import pec_analysis as pa
+    rng = np.random.default_rng(0)
+    x = np.sort(rng.uniform(1.5, 6.0, 9))
+    y = rng.normal(size=(3, 9))
+    a, b, c, d = pa.natural_spline_coefficients(x, y)
+    for g in range(3):
+        ref = CubicSpline(x, y[g], bc_type='natural').c
+        assert np.allclose(np.stack([d[g], c[g], b[g], a[g]]), ref)
+
+
+def test_fit_morse_recovers_parameters():
+    from systems import pec_analysis as pa
+    x = np.linspace(1.6, 5.0, 12)
+    De, a, Re = np.array([5.0, 12.0]), np.array([1.3, 0.9]), np.array([2.1, 2.6])
+    y = pa.morse(x, De, a, Re)
+    fit = pa.fit_morse(x, y, De * 0.8, a * 1.2, Re + 0.1)
+    assert np.allclose(fit[0], De) and np.allclose(fit[1], a) and np.allclose(fit[2], Re)
+    assert np.all(fit[3] < 1e-8)
+
+    pec = pa.pec_table(pd.DataFrame({
+        'distances': np.append(x, 9999.0), 'total energy': np.append(y[0], 0.0),
+    }), unit='hartree', morse_fit=True)
+    assert np.isclose(pec['morse_a_fit'].iloc[0], a[0]) and np.isclose(pec['morse_De'].iloc[0], De[0])
+
+
+def test_optimal_gammas(tmp_path):
+    from systems.optimize_gamma_by_element import analyse_methods as am
+    gammas = np.round(np.arange(0.8, 1.81, 0.2), 2)
+    # an interior minimum at 1.13 and one at the edge of the grid
+    for atom, g0 in (('Ne', 1.13), ('Ar', 2.5)):
+        pd.DataFrame({'GEM_BETA': gammas, 'E': -128.9 + 0.01 * (gammas - g0)**2}).to_csv(
+            tmp_path / f'table_{atom}_0_cc-pVDZ-F12.csv', index=False)
+    (tmp_path / 'notes.csv').write_text('ignored\n')
+
+    data = am.read_all_tables(str(tmp_path))
+    assert sorted(data['atom'].unique()) == ['ar', 'ne'] and len(data) == 2 * len(gammas)
+    opt = am.optimal_gammas(data)
+    ne, ar = opt.loc[('ne', 0, 'cc-pVDZ-F12')], opt.loc[('ar', 0, 'cc-pVDZ-F12')]
+    assert ne['gamma_grid'] == 1.2 and not ne['at_edge']
+    assert np.isclose(ne['gamma_opt'], 1.13) and np.isclose(ne['E_opt'], -128.9)
+    assert ar['at_edge'] and ar['gamma_opt'] == ar['gamma_grid'] == 1.8
+
+
+def test_cbs_f12_exponents():
+    df = pd.DataFrame({
+        'bases': ['cc-pVDZ-F12', 'cc-pVTZ-F12'] * 2,
+        'ansatz': ['3C', '3C', '3C(FIX)', '3C(FIX)'],
+        'distances': 9999.0,
+        'correlation energy': [-0.30, -0.35, -0.31, -0.36],
+    })
+    out = cbs.extrapolate_correlation(df, 'correlation energy', exponent=cbs.CBS_F12_EXPONENTS)
+    # E_T + (E_T - E_D) 2^p / (3^p - 2^p) with p = 3.09
+    assert np.allclose(out.loc[('3C', 9999.0), 'CBS_23'], -0.3699965, atol=1e-7)
+    assert np.isclose(out.loc[('3C(FIX)', 9999.0), 'CBS_23'], -0.3699965 - 0.01)
+
+    # parameters not known to the pivot still make rows of their own
+    with pytest.raises(ValueError):
+        cbs.pivot_bases(df.drop(columns='ansatz'), 'correlation energy')
+    with pytest.raises(ValueError):
+        cbs.extrapolate_correlation(df.replace('cc-pVTZ-F12', 'cc-pVQZ-F12'), 'correlation energy',
+                                    exponent=cbs.CBS_F12_EXPONENTS)
@@ -0,0 +1,58 @@
+import os
+from argparse import Namespace
+
+import numpy as np
+import pandas as pd
+
+from systems import cost_model as cm
+from systems import run_inputs_and_folders as riaf
+
+OUTFILE = os.path.join(os.path.dirname(__file__), 'comp_between_default_and_standard_cu',
+                       'standard_check_for_cpp_printing.165082-20251203.out')
+
+
+def test_read_costs_real_output(tmp_path):
+    costs = cm.read_costs(OUTFILE)
+    # memory,1000,m: Molpro allocates 1000 MW = 8 GB, it needs 1.35 MW of them
+    assert costs['memory_gb'] == 8.0
+    assert np.isclose(costs['needed_gb'], 1.35 * cm.MW_TO_GB)
+    assert costs['wall_time'] == 4.85 and costs['disk_mb'] == 130.66
+    assert costs['n_atoms'] == 1 and costs['basis'] == 'AUG-CC-PVTZ'
+
+    # without the memory summary, the memory card of the echoed input
+    with open(OUTFILE) as f:
+        lines = [line for line in f if 'memory per' not in line.lower()]
+    outfile = tmp_path / 'no_summary.out'
+    outfile.write_text(''.join(lines))
+    assert cm.read_costs(str(outfile))['memory_gb'] == 8.0
+
+    outfile.write_text(''.join(line for line in lines if 'terminated' not in line))
+    assert cm.read_costs(str(outfile)) is None
+
+
+def test_predict_at_least_input_memory(tmp_path):
+    inp = tmp_path / 'big.inp'
+    inp.write_text('memory,2,g\n')
+    assert cm.input_memory_gb(str(inp)) == 16.0
+    assert np.isnan(cm.input_memory_gb(str(tmp_path / 'missing.inp')))
+
+    features = dict(calc_type='xg', basis='AUG-CC-PVTZ', n_atoms=1, settings='{}')
+    history = pd.DataFrame([dict(cm.read_costs(OUTFILE), **features, done=True)])
+    pending = pd.DataFrame([dict(features, input_memory_gb=16.0), dict(features, input_memory_gb=np.nan)])
+    prediction = cm.CostModel(history).predict(pending)
+    assert list(prediction['memory_gb']) == [16.0, 8.0]
+    assert (prediction['level'] == 0).all()
+    assert cm.CostModel(history.iloc[:0]).predict(pending)['memory_gb'].iloc[0] == 16.0
+
+
+def test_auto_memory_does_not_grow():
+    # the margin goes on the needed memory only, so requesting the
+    # prediction and learning from the result keeps the same request
+    predictions = pd.DataFrame(
+        dict(done=False, predicted_wall_time=1.0, predicted_memory_gb=8.0, predicted_needed_gb=[0.01, 6.0]),
+        index=['a.inp', 'b.inp'],
+    )
+    args = Namespace(longest_first=False, auto_memory=True, memory_margin=1.5)
+    items = [('a.inp', '.', None, {}), ('b.inp', '.', None, {})]
+    _, memories = riaf.plan_inputs(items, predictions, args)
+    assert memories == {'a.inp': 8, 'b.inp': 9}
@@ -0,0 +1,74 @@
+from argparse import ArgumentTypeError, Namespace
+
+import pandas as pd
+import pytest
+
+from systems import generate_inputs_and_folders as giaf
+from Tests import synthetic_outputs as so
+
+META = {
+    'calc_type': 'xg',
+    'template': 'sweep.tinp',
+    'file_prefix': 'xg',
+    'bases': {'iterable': True, 'subfolder': True, 'values': ['avdz', 'avtz']},
+    'distances': {'iterable': True, 'values': [1.8, 1.9, 2.0, 9999.0], 'format': '06.3f',
+                  'prefix': '_r_{value}'},
+}
+
+
+def items(meta=META):
+    return list(giaf.generate_file_paths(Namespace(metadata_path='sweep/metadata.json'), meta))
+
+
+def test_parse_shard():
+    assert giaf.parse_shard('1/4') == (1, 4)
+    for spec in ('4/4', '-1/4', '1', 'a/b'):
+        with pytest.raises(ArgumentTypeError):
+            giaf.parse_shard(spec)
+
+
+def test_shards_partition_the_sweep():
+    all_items = items()
+    shards = [list(giaf.filter_shard(all_items, (i, 3))) for i in range(3)]
+    files = [item[0] for shard in shards for item in shard]
+    assert sorted(files) == sorted(item[0] for item in all_items)
+    assert list(giaf.filter_shard(all_items, None)) == all_items
+
+    # stable: from the formatted parameters only, not the order or the folder
+    for file_path, _, _, kwargs in all_items:
+        shard = giaf.shard_of(kwargs, 3)
+        assert file_path in [item[0] for item in shards[shard]]
+        assert giaf.shard_of(dict(reversed(list(kwargs.items())), full_file_prefix='other'), 3) == shard
+    assert giaf.shard_of({'bases': 'avdz', 'distances': '01.900'}, 3) == \
+        giaf.shard_of({'distances': '01.900', 'bases': 'avdz'}, 3)
+
+
+BATCH_TEMPLATE = """{batch_do}
+geometry={Cu; N,Cu,{distances}}
+tot_ener({batch_index})=energy
+{batch_enddo}
+{batch_table}
+"""
+
+
+def test_batched_input(tmp_path):
+    meta = dict(META, distances=dict(META['distances'], batched=True))
+    metadata_path = so.write_sweep(str(tmp_path / 'xg'), meta, template=BATCH_TEMPLATE)
+    all_items = items(meta)
+    assert [kwargs['bases'] for _, _, _, kwargs in all_items] == ['avdz', 'avtz']
+
+    with open(tmp_path / 'xg' / 'avdz' / 'xg.inp') as f:
+        assert f.read() == (
+            "distances=[01.800,01.900,02.000,9999.000]\n"
+            "do ibatch=1,#distances\n"
+            "geometry={Cu; N,Cu,distances(ibatch)}\n"
+            "tot_ener(ibatch)=energy\n"
+            "enddo\n"
+            "table,distances,tot_ener,corr_ener;save,file='xg.csv'\n"
+        )
+
+    # Molpro upper-cases the columns and prints the values as numbers
+    table = pd.DataFrame({'DISTANCES': [1.9, 9999.0], 'TOT_ENER': [-1.0, -2.0]})
+    table = giaf.unbatch_table(table, giaf.read_metadata(metadata_path))
+    assert list(table.columns) == ['distances', 'TOT_ENER']
+    assert list(table['distances']) == ['01.900', '9999.000']
@@ -0,0 +1,93 @@
+import os
+from argparse import Namespace
+
+import pandas as pd
+import pytest
+
+from systems import generate_inputs_and_folders as giaf
+from systems import merge_shards as ms
+from Tests import synthetic_outputs as so
+
+META = {
+    'calc_type': 'xg',
+    'file_prefix': 'xg',
+    'bases': {'iterable': True, 'subfolder': True, 'values': ['avdz', 'avtz']},
+    'gamma_set': {'iterable': True, 'subfolder': True, 'values': ['1.00', '1.40'],
+                  'prefix': 'gamma_set_{value}'},
+    'distances': {'iterable': True, 'values': [1.9, 9999.0], 'format': '06.3f', 'prefix': '_r_{value}'},
+}
+
+
+@pytest.fixture
+def sweep(tmp_path):
+    """metadata path and the table of all inputs with (shard, energies), in sweep order"""
+    metadata_path = so.write_sweep(str(tmp_path / 'cu_nh3' / 'xg'), META)
+    meta = giaf.read_metadata(metadata_path)
+    keys, _ = ms.expected_params(meta, metadata_path)
+    rows = [
+        dict({key: kwargs[key] for key in keys}, shard=giaf.shard_of(kwargs, 2), **{'total energy': -1.0 - n})
+        for n, (_, _, _, kwargs) in enumerate(giaf.generate_file_paths(Namespace(metadata_path=metadata_path), meta))
+    ]
+    return metadata_path, pd.DataFrame(rows)
+
+
+def merge(metadata_path, *argv):
+    return ms.main(ms.parser.parse_args([metadata_path, *argv]))
+
+
+def write_csv_shards(metadata_path, table, shards=(0, 1)):
+    for i in shards:
+        path = os.path.join(os.path.dirname(metadata_path), f'data.shard-{i}-of-2.csv')
+        table[table['shard'] == i].drop(columns='shard').to_csv(path, index=False)
+
+
+def test_merge_csv_shards(sweep, capsys):
+    metadata_path, table = sweep
+    assert set(table['shard']) == {0, 1}
+    write_csv_shards(metadata_path, table)
+    assert merge(metadata_path) == 0
+    merged = pd.read_csv(os.path.join(os.path.dirname(metadata_path), 'data.csv'), dtype=str)
+    assert list(merged['distances']) == list(table['distances'])
+    assert list(merged['total energy'].astype(float)) == list(table['total energy'])
+
+    os.remove(os.path.join(os.path.dirname(metadata_path), 'data.shard-1-of-2.csv'))
+    assert merge(metadata_path, '-o', 'unused.csv') == 1
+    out = capsys.readouterr().out
+    assert 'Missing shard files for shards [1]' in out
+    assert f"{(table['shard'] == 1).sum()} of {len(table)} inputs missing" in out
+    outfile = os.path.join(os.path.dirname(metadata_path), 'partial.csv')
+    assert merge(metadata_path, '--allow-missing', '-o', outfile) == 0
+    assert len(pd.read_csv(outfile)) == (table['shard'] == 0).sum()
+
+
+def test_merge_csv_duplicates(sweep, capsys):
+    metadata_path, table = sweep
+    write_csv_shards(metadata_path, pd.concat([table, table[table['shard'] == 0].head(1)]))
+    assert merge(metadata_path) == 1
+    assert '2 rows of duplicated inputs' in capsys.readouterr().out
+    assert merge(metadata_path, '--drop-duplicates') == 0
+    assert len(pd.read_csv(os.path.join(os.path.dirname(metadata_path), 'data.csv'))) == len(table)
+
+
+def test_merge_parquet_shards(sweep, capsys):
+    pytest.importorskip('pyarrow')
+    from systems import result_store as rs
+    metadata_path, table = sweep
+    root = rs.default_store_path(metadata_path)
+    # a partition without gamma_set, listed before the xg one
+    rs.write_store(table.drop(columns=['gamma_set', 'shard']), root, 'cu_nh3', 'standard')
+    for i in (0, 1):
+        rs.write_store(table[table['shard'] == i].drop(columns='shard'), root, 'cu_nh3', 'xg', shard=(i, 2))
+    assert merge(metadata_path, '--outformat', 'parquet') == 0
+    assert 'Partition complete' in capsys.readouterr().out
+
+    # a shard written twice with append duplicates its rows
+    rs.write_store(table[table['shard'] == 1].drop(columns='shard'), root, 'cu_nh3', 'xg', append=True, shard=(1, 2))
+    assert merge(metadata_path, '--outformat', 'parquet') == 1
+    assert 'duplicated inputs' in capsys.readouterr().out
+
+    for path in os.listdir(rs.partition_path(root, 'cu_nh3', 'xg')):
+        if path.startswith('shard-1-'):
+            os.remove(os.path.join(rs.partition_path(root, 'cu_nh3', 'xg'), path))
+    assert merge(metadata_path, '--outformat', 'parquet') == 1
+    assert 'Missing shard files for shards [1]' in capsys.readouterr().out
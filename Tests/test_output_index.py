@@ -0,0 +1,39 @@
+import os
+
+import pytest
+
+from systems.output_index import OutputIndex, output_prefix
+
+
+def touch(path, mtime):
+    path.write_text('')
+    os.utime(path, (mtime, mtime))
+
+
+def test_output_prefix():
+    assert output_prefix('xg_r_01.900.3.out', 'out') == 'xg_r_01.900'
+    assert output_prefix('xg_r_01.900.inp', 'out') is None
+    assert output_prefix('name.out', 'out') is None
+
+
+def test_output_index_latest(tmp_path):
+    touch(tmp_path / 'xg_r_01.900.2.out', 200)
+    touch(tmp_path / 'xg_r_01.900.1.out', 100)
+    touch(tmp_path / 'xg_r_01.900.1.xml', 300)
+    touch(tmp_path / 'xg_r_1.900.1.out', 400)
+    infile = str(tmp_path / 'xg_r_01.900.inp')
+
+    index = OutputIndex()
+    with pytest.warns(UserWarning, match='Multiple output files'):
+        assert index.latest(infile, 'out') == str(tmp_path / 'xg_r_01.900.2.out')
+    assert index.latest(infile, 'xml') == str(tmp_path / 'xg_r_01.900.1.xml')
+    assert index.getmtime(str(tmp_path / 'xg_r_01.900.1.out')) == 100
+    with pytest.raises(FileNotFoundError):
+        index.latest(str(tmp_path / 'other.inp'), 'out')
+    assert index.matches(str(tmp_path / 'missing' / 'name'), 'out') == []
+
+    # the listing is kept until refresh
+    touch(tmp_path / 'xg_r_01.900.3.out', 500)
+    assert len(index.matches(str(tmp_path / 'xg_r_01.900'), 'out')) == 2
+    index.refresh()
+    assert index.matches(str(tmp_path / 'xg_r_01.900'), 'out')[-1] == str(tmp_path / 'xg_r_01.900.3.out')
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('pyarrow')
+from systems import result_store as rs
+
+
+def sweep_table(bases, energy=-1639.5):
+    return pd.DataFrame({
+        'bases': bases,
+        'distances': ['01.900'] * len(bases),
+        'total energy': [energy] * len(bases),
+        'outfile': [f'{b}/xg_r_01.900.1.out' for b in bases],
+    })
+
+
+def read(root, **kwargs):
+    # categories are in the order of the files, sort by value
+    df = rs.read_store(str(root), **kwargs)
+    return df.sort_values(['calc_type', 'bases'], key=lambda col: col.astype(str), ignore_index=True)
+
+
+def test_write_store_replace_and_append(tmp_path):
+    rs.write_store(sweep_table(['b1', 'b2']), str(tmp_path), 'cu_nh3', 'xg')
+    rs.write_store(sweep_table(['b1']), str(tmp_path), 'cu_nh3', 'standard')
+    df = read(tmp_path)
+    assert list(df['calc_type']) == ['standard', 'xg', 'xg']
+    assert df['total energy'].dtype == np.float64 and isinstance(df['bases'].dtype, pd.CategoricalDtype)
+
+    # replacing the partition does not duplicate rows, nor touch other partitions
+    rs.write_store(sweep_table(['b1', 'b2'], energy=-1640.0), str(tmp_path), 'cu_nh3', 'xg')
+    df = read(tmp_path, calc_type='xg')
+    assert len(df) == 2 and (df['total energy'] == -1640.0).all()
+    assert len(read(tmp_path, calc_type='standard')) == 1
+
+    rs.write_store(sweep_table(['b3']), str(tmp_path), 'cu_nh3', 'xg', append=True)
+    df = read(tmp_path, columns=['bases', 'calc_type'], system='cu_nh3', calc_type='xg')
+    assert list(df['bases']) == ['b1', 'b2', 'b3'] and list(df.columns) == ['bases', 'calc_type']
+
+
+def test_write_store_shards(tmp_path):
+    rs.write_store(sweep_table(['b1', 'b2', 'b3']), str(tmp_path), 'cu_nh3', 'xg')
+    rs.write_store(sweep_table(['b1']), str(tmp_path), 'cu_nh3', 'xg', shard=(0, 2))
+    rs.write_store(sweep_table(['b2', 'b3']), str(tmp_path), 'cu_nh3', 'xg', shard=(1, 2))
+    # rewriting a shard replaces only its own rows
+    rs.write_store(sweep_table(['b1'], energy=-1640.0), str(tmp_path), 'cu_nh3', 'xg', shard=(0, 2))
+    df = read(tmp_path)
+    assert list(df['bases']) == ['b1', 'b2', 'b3']
+    assert list(df['total energy']) == [-1640.0, -1639.5, -1639.5]
+    assert sorted(rs.partition_shards(str(tmp_path), 'cu_nh3', 'xg')) == [(0, 2), (1, 2)]
+
+
+def test_read_store_partitions_with_different_columns(tmp_path):
+    # standard has no gamma_set and is listed before xg
+    rs.write_store(sweep_table(['b1']), str(tmp_path), 'cu_nh3', 'standard')
+    rs.write_store(sweep_table(['b1', 'b2']).assign(gamma_set='1.00_1.00_1.00'), str(tmp_path), 'cu_nh3', 'xg')
+
+    xg = read(tmp_path, calc_type='xg')
+    assert (xg['gamma_set'] == '1.00_1.00_1.00').all()
+    xg = read(tmp_path, columns=['bases', 'gamma_set', 'calc_type'], calc_type='xg')
+    assert list(xg.columns) == ['bases', 'gamma_set', 'calc_type'] and len(xg) == 2
+
+    standard = read(tmp_path, calc_type='standard')
+    assert 'gamma_set' not in standard and len(standard) == 1
+    standard = read(tmp_path, columns=['bases', 'total energy', 'calc_type'], calc_type='standard')
+    assert list(standard['total energy']) == [-1639.5]
+
+    both = read(tmp_path, columns=['bases', 'gamma_set', 'calc_type'])
+    assert both['gamma_set'].isna().tolist() == [True, False, False]
@@ -0,0 +1,101 @@
+import os
+import subprocess
+
+from systems import run_inputs_and_folders as riaf
+from Tests import synthetic_outputs as so
+
+META = {
+    'calc_type': 'xg',
+    'file_prefix': 'xg',
+    'bases': {'iterable': True, 'subfolder': True, 'values': ['avdz']},
+    'gamma_set': {'iterable': True, 'subfolder': True, 'f12_only': True, 'values': ['1.00', '1.40'],
+                  'prefix': 'gamma_set_{value}'},
+    'distances': {'iterable': True, 'values': [1.9, 9999.0], 'format': '06.3f', 'prefix': '_r_{value}'},
+}
+
+# qmolpro queues the job and returns: references are left running,
+# dependents terminate right away
+STUB_QMOLPRO = '''#!/bin/bash
+echo "$PWD $*" >> {calls}
+inp=${{@: -1}}
+if [[ $PWD != */reference ]]; then
+    printf ' Molpro calculation terminated\\n' > ${{inp%.inp}}.1.out
+fi
+'''
+
+
+def write_stub(tmp_path, script):
+    stub = tmp_path / 'qmolpro'
+    stub.write_text(script.format(calls=tmp_path / 'calls.log'))
+    stub.chmod(0o755)
+    return str(stub)
+
+
+def calls(tmp_path):
+    with open(tmp_path / 'calls.log') as f:
+        return [line.split() for line in f]
+
+
+def test_run_with_references(tmp_path, capsys):
+    metadata_path = so.write_sweep(str(tmp_path / 'xg'), META, reference_template='memory,100,m\n')
+    args = riaf.parser.parse_args([metadata_path, '--qmolpro-path', write_stub(tmp_path, STUB_QMOLPRO)])
+    reference = tmp_path / 'xg' / 'avdz' / 'reference'
+
+    # references are run first, dependents wait for them to terminate
+    riaf.main(args)
+    assert [(cwd, argv[-1]) for cwd, *argv in calls(tmp_path)] == [
+        (str(reference), 'xg_r_01.900.inp'), (str(reference), 'xg_r_9999.000.inp')
+    ]
+    assert all('-W .' in ' '.join(argv) for argv in calls(tmp_path))
+    assert '4 inputs still wait for their reference wavefunction' in capsys.readouterr().out
+
+    # the reference jobs end: one terminated normally, one with an error
+    so.write_xg_output(str(reference / 'xg_r_01.900.1.out'), size_mb=0.01)
+    (reference / 'xg_r_01.900.wfu').write_text('wavefunction')
+    (reference / 'xg_r_9999.000.1.out').write_text(' ? Error\n Molpro calculation terminated\n')
+
+    riaf.main(args)
+    dependents = calls(tmp_path)[2:]
+    assert sorted((os.path.basename(cwd), argv[-1]) for cwd, *argv in dependents) == [
+        ('gamma_set_1.00', 'xg_r_01.900.inp'), ('gamma_set_1.40', 'xg_r_01.900.inp')
+    ]
+    for gamma_set in ['gamma_set_1.00', 'gamma_set_1.40']:
+        folder = tmp_path / 'xg' / 'avdz' / gamma_set
+        assert (folder / 'xg_r_01.900.wfu').read_text() == 'wavefunction'
+        assert not (folder / 'xg_r_9999.000.wfu').exists()
+    out = capsys.readouterr().out
+    assert f"Reference {reference / 'xg_r_9999.000.inp'} failed, skipped 2 inputs" in out
+
+
+def test_pack_and_submit(tmp_path, capsys):
+    meta = dict(META, bases={'iterable': True, 'subfolder': True, 'values': ['avdz', 'avtz']},
+                memory={'avtz': 60})
+    del meta['gamma_set']
+    metadata_path = so.write_sweep(str(tmp_path / 'xg'), meta)
+    submit_cmd = f'echo "{{name}} {{ntasks}} {{memory}}" >> {tmp_path / "calls.log"}; echo "Submitted batch job 42"'
+    argv = [metadata_path, '--pack', '--submit-cmd', submit_cmd, '--task-cmd', 'echo {input} {memory_mw} > task.out']
+    riaf.main(riaf.parser.parse_args(argv))
+
+    # one array job per basis, with the memory of the metadata or -M
+    assert calls(tmp_path) == [['avdz_45G_000', '2', '45'], ['avtz_60G_000', '2', '60']]
+    pack_dir, = (tmp_path / 'xg' / riaf.PACK_FOLDER).iterdir()
+    manifest = pack_dir / 'avdz_45G_000.manifest'
+    folder = tmp_path / 'xg' / 'avdz'
+    assert manifest.read_text() == f'{folder}\txg_r_01.900.inp\t45\n{folder}\txg_r_9999.000.inp\t45\n'
+    with open(pack_dir / riaf.SUBMITTED_LOG) as f:
+        assert [line.strip().split(',')[1:] for line in f] == [
+            [str(manifest), '42'], [str(pack_dir / 'avtz_60G_000.manifest'), '42']
+        ]
+
+    # a task runs its line of the manifest in the folder and logs it
+    subprocess.run(['bash', str(pack_dir / 'run_task.sh'), str(manifest), '2'], check=True)
+    assert (folder / 'task.out').read_text() == 'xg_r_9999.000.inp 5625\n'
+    assert riaf.get_completed_files(str(folder / 'runs.log')) == {'xg_r_9999.000.inp'}
+
+    # submitted inputs are not submitted again, unless --resubmit
+    capsys.readouterr()
+    riaf.main(riaf.parser.parse_args(argv))
+    assert len(calls(tmp_path)) == 2
+    assert '3 inputs were submitted before' in capsys.readouterr().out
+    riaf.main(riaf.parser.parse_args(argv + ['--resubmit']))
+    assert calls(tmp_path)[2:] == [['avdz_45G_000', '1', '45'], ['avtz_60G_000', '2', '60']]
@@ -0,0 +1,134 @@
+import numpy as np
+
+import tabulate_outs as TO
+import xml_output_parser as xop
+from Tests import synthetic_outputs as so
+from Tests import tensor_output_reader as tor
+
+
+def test_xmlener_synthetic(tmp_path):
+    xmlfile = str(tmp_path / 'single.xml')
+    energies, = so.write_xml_output(xmlfile, n_jobsteps=4, n_orbitals=3)
+    for enertype, ener in energies.items():
+        assert np.isclose(xop.get_xmlener(xmlfile, enertype=enertype), ener)
+
+
+def test_xg_ener_synthetic(tmp_path):
+    outfile = str(tmp_path / 'xg.out')
+    energies = so.write_xg_output(outfile, size_mb=0.01)
+    for enertype, ener in energies.items():
+        assert np.isclose(TO.get_ener(outfile, enertype=enertype, out_type='xg'), ener)
+
+    so.write_xg_output(outfile, size_mb=0.01, terminated=False)
+    assert TO.get_ener(outfile, out_type='xg') is None
+
+
+def test_tensor_grabbers_synthetic(tmp_path):
+    outfile = str(tmp_path / 'tensors.out')
+    def_tensor = so.write_fortran_tensor(outfile, 'vmat', 3)
+    std_tensor = so.write_cpp_tensor(outfile, 'VF[mnij]', 3, mode='a')
+    assert np.allclose(tor.grab_tensor_from_def(outfile, 'vmat'), def_tensor)
+    assert np.allclose(tor.grab_tensor_from_std(outfile, 'VF[mnij]'), std_tensor)
+
+
+def test_xmlener_all_multijob(tmp_path):
+    xmlfile = str(tmp_path / 'multi.xml')
+    betas = [0.5, 0.6, 0.7]
+    energies = so.write_xml_output(xmlfile, n_f12=3, variables={'GEM_BETA': betas})
+    steps = xop.get_xmlener_all(xmlfile)
+    assert [step['jobstep'] for step in steps] == [0, 1, 2]
+    assert [step['GEM_BETA'] for step in steps] == betas
+    for step, ener in zip(steps, energies):
+        assert np.isclose(step['total energy'], ener['total energy'])
+
+
+def test_tensor_stack_reductions(tmp_path):
+    outfiles = [str(tmp_path / f'gamma_{i}.out') for i in range(3)]
+    tensors = [so.write_cpp_tensor(f, 'VF[mnij]', 3, seed=i) for i, f in enumerate(outfiles)]
+    stack = tor.load_tensor_stack(outfiles, 'VF[mnij]')
+    assert stack.shape == (3, 3, 3, 3, 3)
+    assert np.allclose(stack, tensors)
+
+    spread, _ = tor.stack_spread(stack)
+    assert np.allclose(spread, np.max(tensors, axis=0) - np.min(tensors, axis=0))
+
+    values, locations = tor.max_deviation(stack)
+    assert values[0] == 0
+    for n in (1, 2):
+        diff = np.abs(tensors[n] - tensors[0])
+        assert np.isclose(values[n], diff.max())
+        assert diff[tuple(locations[n])] == diff.max()
+
+    rms = tor.block_rms(stack)
+    assert rms.shape == (3, 3, 3)
+    assert np.isclose(rms[1, 2, 0], np.sqrt(np.mean((tensors[1] - tensors[0])[:, :, 2, 0]**2)))
+    blocks, worst = tor.top_blocks(rms, n=4)
+    assert blocks.shape == (4, 2) and np.all(np.diff(worst) <= 0)
+
+
+
+def test_tensor_block_streams(tmp_path):
+    outfile = str(tmp_path / 'tensors.out')
+    def_tensor = so.write_fortran_tensor(outfile, 'vmat', 3)
+    std_tensor = so.write_cpp_tensor(outfile, 'VF[mnij]', 3, mode='a')
+    for fmt, name, tensor in (('def', 'vmat', def_tensor), ('std', 'VF[mnij]', std_tensor)):
+        assembled = np.zeros(tensor.shape)
+        for offsets, block in tor.iter_tensor_blocks(outfile, name, fmt=fmt):
+            assembled[tuple(slice(o, o + s) for o, s in zip(offsets, block.shape))] = block
+        assert np.allclose(assembled, tensor)
+
+        norm, max_abs, location, size = tor.stream_norms(tor.iter_tensor_blocks(outfile, name, fmt=fmt))
+        assert size == tensor.size and np.isclose(norm, np.linalg.norm(tensor))
+        assert abs(tensor[location]) == max_abs == np.abs(tensor).max()
+
+        counts, _ = tor.stream_histogram(tor.iter_tensor_blocks(outfile, name, fmt=fmt))
+        assert counts.sum() == tensor.size
+
+    other = str(tmp_path / 'other.out')
+    other_tensor = so.write_cpp_tensor(other, 'VF[mnij]', 3, seed=1)
+    value, location = tor.stream_max_abs_diff(
+        tor.iter_blocks_from_std(outfile, 'VF[mnij]'), tor.iter_blocks_from_std(other, 'VF[mnij]')
+    )
+    diff = np.abs(std_tensor - other_tensor)
+    assert np.isclose(value, diff.max()) and diff[location] == diff.max()
+
+
+def test_binary_tensor_dumps(tmp_path):
+    outfile = str(tmp_path / 'tensors.out')
+    def_tensor = so.write_fortran_tensor(outfile, 'vmat', 3)
+    std_tensor = so.write_cpp_tensor(outfile, 'VF[mnij]', 3, mode='a')
+    for fmt, name, tensor in (('def', 'vmat', def_tensor), ('std', 'VF[mnij]', std_tensor)):
+        path = str(tmp_path / f'{fmt}.tensor')
+        header = tor.convert_text_dump(outfile, name, path, fmt=fmt)
+        assert header['dims'] == list(tensor.shape) and header['data_offset'] % tor.TENSOR_ALIGN == 0
+
+        mapped = tor.read_tensor_binary(path, name)
+        assert isinstance(mapped, np.memmap) and np.allclose(mapped, tensor)
+        assert np.array_equal(tor.read_tensor_binary(path, mmap=False), mapped)
+
+    path = str(tmp_path / 'exact.tensor')
+    tor.write_tensor_binary(path, std_tensor / 3, 'VF[mnij]')
+    assert np.array_equal(tor.load_tensor_stack([path], 'VF[mnij]', fmt='bin')[0], std_tensor / 3)
+
+
+def test_output_scanner_statuses(tmp_path):
+    import output_scanner
+    markers = {
+        'ok': '',
+        'incomplete': None,
+        'no_convergence': ' NO CONVERGENCE IN CPHF\n',
+        'fit_failed': ' NO CONVERGENCE IN GEMINAL FIT\n',
+        'no_memory': ' Insufficient memory to allocate a new array\n',
+        'error': ' ? Error\n GLOBAL ERROR fehler on processor   0\n',
+    }
+    for status, marker in markers.items():
+        outfile = str(tmp_path / f'{status}.out')
+        so.write_xg_output(outfile, size_mb=0.01, terminated=marker is not None)
+        if marker:
+            with open(outfile, 'a') as out:
+                out.write(marker)
+        row = output_scanner.scan_file(outfile)
+        assert row['status'] == status
+    assert row['message'] == '? Error'
+    assert output_scanner.scan_file(str(tmp_path / 'fit_failed.out'))['no_convergence'] == 0
+    assert output_scanner.scan_file(str(tmp_path / 'missing.out'))['status'] == 'error'
@@ -0,0 +1,106 @@
+import os
+from argparse import Namespace
+
+import pandas as pd
+import pytest
+
+from systems import generate_inputs_and_folders as giaf
+from systems import tabulate_outputs_and_folders as taf
+from Tests import synthetic_outputs as so
+import output_scanner
+
+META = {
+    'calc_type': 'xg',
+    'file_prefix': 'xg',
+    'bases': {'iterable': True, 'subfolder': True, 'values': ['avdz']},
+    'distances': {'iterable': True, 'values': [1.8, 1.9, 2.0, 2.1], 'format': '06.3f', 'prefix': '_r_{value}'},
+}
+
+
+def infiles(metadata_path, meta):
+    args_ns = Namespace(metadata_path=metadata_path, dry_run=False, output=None)
+    return [infile for infile, _, _, _ in giaf.generate_file_paths(args_ns, meta)]
+
+
+def test_poll_states(tmp_path, monkeypatch):
+    metadata_path = so.write_sweep(str(tmp_path / 'xg'), META)
+    meta = giaf.read_metadata(metadata_path)
+    done, running, failed, _missing = [os.path.splitext(f)[0] + '.1.out' for f in infiles(metadata_path, meta)]
+    so.write_xg_output(done, size_mb=0.01)
+    so.write_xg_output(running, size_mb=0.01, terminated=False)
+    # terminated with an error, but the energies were printed
+    so.write_xg_output(failed, size_mb=0.01)
+    with open(failed, 'a') as f:
+        f.write(' ? Error\n')
+
+    scans = []
+    scan_file = output_scanner.scan_file
+    monkeypatch.setattr(output_scanner, 'scan_file', lambda path: scans.append(path) or scan_file(path))
+
+    args = Namespace(metadata_path=metadata_path, outtype='*.out', enertypes=None, multijob=False, shard=None)
+    state, cache = {}, {}
+    changed, progress = taf.poll(args, meta, state, cache)
+    assert changed and progress == {'avdz': {'done': 1, 'running': 1, 'failed': 1, 'missing': 1}}
+    assert state[infiles(metadata_path, meta)[2]][2] is None
+
+    # nothing changed: neither parsed nor scanned again
+    scans.clear()
+    changed, progress = taf.poll(args, meta, state, cache)
+    assert not changed and scans == []
+
+    so.write_xg_output(running, size_mb=0.01)
+    os.utime(running, (os.path.getmtime(running) + 10,) * 2)
+    changed, progress = taf.poll(args, meta, state, cache)
+    assert changed and scans == [running]
+    assert progress['avdz'] == {'done': 2, 'running': 0, 'failed': 1, 'missing': 1}
+
+
+BATCHED_META = {
+    'calc_type': 'xg',
+    'file_prefix': 'xg',
+    'bases': {'iterable': True, 'subfolder': True, 'values': ['avdz', 'avtz']},
+    'gamma_set': {'iterable': True, 'values': ['1.00', '1.40'], 'prefix': '_g_{value}'},
+    'distances': {'iterable': True, 'batched': True, 'values': [1.9, 9999.0], 'format': '06.3f'},
+}
+
+
+def sweep_tables(metadata_path, meta):
+    """(infile, csv table, kwargs) of every input"""
+    args_ns = Namespace(metadata_path=metadata_path, dry_run=False, output=None)
+    return [
+        (infile, taf.get_csvfile(folder_path, kwargs), kwargs)
+        for infile, folder_path, _, kwargs in giaf.generate_file_paths(args_ns, meta)
+    ]
+
+
+def test_read_tables_matches_rows(tmp_path):
+    metadata_path = so.write_sweep(str(tmp_path / 'xg'), BATCHED_META)
+    meta = giaf.read_metadata(metadata_path)
+    tables = sweep_tables(metadata_path, meta)
+    taf.check_csv_collisions([(infile, csvfile) for infile, csvfile, _ in tables])
+    for n, (_, csvfile, _) in enumerate(tables):
+        # as saved by Molpro, the last job stopped after the first distance
+        rows = ''.join(f'   {d:.1f}, {-1.0 - n - d / 1e4:.10f}, {-0.5 - n:.10f}\n' for d in [1.9, 9999.0])
+        with open(csvfile, 'w') as f:
+            f.write('  DISTANCES,     TOT_ENER,    CORR_ENER\n' + (rows if n < 3 else rows.splitlines(True)[0]))
+
+    sources = [csvfile for _, csvfile, _ in tables]
+    kwargs_list = [kwargs for _, _, kwargs in tables]
+    bulk = taf.read_tables(sources, kwargs_list, meta, max_workers=2)
+    args = Namespace(outtype='csv', enertypes=None)
+    rows = pd.concat([taf.tabulate_input(src, kw, args, meta) for src, kw in zip(sources, kwargs_list)],
+                     ignore_index=True)
+    assert len(bulk) == 7 and sorted(bulk.columns) == sorted(rows.columns)
+    pd.testing.assert_frame_equal(bulk, rows[bulk.columns])
+    assert list(bulk['distances'][:2]) == ['01.900', '9999.000']
+
+
+def test_check_csv_collisions(tmp_path):
+    # Molpro keeps only the first 32 characters of the table name
+    meta = dict(BATCHED_META, file_prefix='cu_nh3_f12_xg_gamma_scan_long')
+    metadata_path = so.write_sweep(str(tmp_path / 'xg'), meta)
+    tables = sweep_tables(metadata_path, giaf.read_metadata(metadata_path))
+    with pytest.raises(ValueError, match='collide after truncation') as error:
+        taf.check_csv_collisions([(infile, csvfile) for infile, csvfile, _ in tables])
+    # one collision per basis folder, each claimed by both gamma sets
+    assert str(error.value).count(' <- ') == 2
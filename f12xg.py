@@ -0,0 +1,185 @@
+'''
+Single entry point for the scripts in this repository:
+
+    python f12xg.py <subcommand> [arguments of the subcommand]
+
+Each subcommand runs the corresponding script with the remaining arguments
+(use `python f12xg.py <subcommand> -h` for its help). Modules are imported
+only by the subcommand that needs them, so e.g. tabulating a few files does
+not pay for plotting or sweep machinery.
+'''
+import os
+import sys
+import runpy
+import argparse
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+import profiling
+
+# subcommand: (module run as a script, help)
+SCRIPTS = {
+    'generate': ('systems.generate_inputs_and_folders',
+                 'Generate folders and inputs from metadata'),
+    'run': ('systems.run_inputs_and_folders',
+            'Run inputs generated by `generate`'),
+    'tabulate': ('tabulate_outs',
+                 'Tabulate energies of output files (also from stdin with --stdin)'),
+    'sweep': ('systems.tabulate_outputs_and_folders',
+              'Tabulate the outputs of a sweep using metadata'),
+    'table': ('systems.get_table',
+              'Get table of energies vs distance of an outputs folder'),
+    'merge': ('systems.merge_shards',
+              'Merge the tables of `sweep --shard i/N` into data.csv'),
+    'cost': ('systems.cost_model',
+             'Predict wall time and memory of pending inputs from completed outputs'),
+    'scan': ('output_scanner',
+             'Status table (ok/incomplete/no_convergence/...) of outputs, scanned in parallel'),
+}
+
+tensors_parser = argparse.ArgumentParser(
+    prog='f12xg.py tensors',
+    description="""
+    Print a summary of a tensor printed in one or more output files.
+    With several files, the maximum absolute difference w.r.t. the first
+    file is printed as well.
+    """
+)
+tensors_parser.add_argument('outfiles', nargs='*',
+                            help='output files containing the tensor print')
+tensors_parser.add_argument('--name', '-n', required=True,
+                            help='tensor name, e.g. vmat (FORTRAN) or VF[mnij] (C++)')
+tensors_parser.add_argument('--format', '-f', choices=['std', 'def', 'bin'], default='std',
+                            help="'std' for C++ tensor dumps, 'def' for FORTRAN prints, 'bin' for binary dumps (*.tensor)")
+tensors_parser.add_argument('--stdin', action='store_true',
+                            help='read output files from stdin, one per line (or NUL separated with -0)')
+tensors_parser.add_argument('-0', '--null', action='store_true',
+                            help='file names on stdin are separated by NUL characters')
+tensors_parser.add_argument('--blocks', type=int, default=0, metavar='N',
+                            help='also print the N (k,l) blocks deviating most from the first file (RMS)')
+tensors_parser.add_argument('--stream', action='store_true',
+                            help='read the tensors block by block with bounded memory (norms and max|T-T0| only, '
+                                 'each file is read twice)')
+tensors_parser.add_argument('--convert', action='store_true',
+                            help='convert the tensor of every (text) output file to a binary dump '
+                                 '<output>.<name>.tensor next to it, instead of summarizing it')
+tensors_parser.add_argument('--histogram', action='store_true',
+                            help='also print the number of elements per decade of |T|')
+profiling.add_arguments(tensors_parser)
+
+def tensors(argv):
+    args = tensors_parser.parse_args(argv)
+    profiling.run(args, summarize_tensors, args)
+
+def summarize_tensors(args):
+    import numpy as np
+    from Tests import tensor_output_reader as tor
+
+    outfiles = list(args.outfiles)
+    if args.stdin:
+        from tabulate_outs import read_file_list
+        outfiles += read_file_list(sys.stdin, null=args.null)
+    if not outfiles:
+        tensors_parser.error("At least one output file must be provided")
+
+    if args.convert:
+        return convert_tensors(args, outfiles)
+    if args.stream:
+        return stream_tensors(args, outfiles)
+
+    with profiling.stage('tensor.read', label=f"{len(outfiles)} files",
+                         nbytes=sum(os.path.getsize(f) for f in outfiles)):
+        tensors = tor.load_tensors(outfiles, args.name, fmt=args.format)
+    reference = None
+    for outfile, tensor in zip(outfiles, tensors):
+        line = (f"{outfile}: shape={tensor.shape} norm={np.linalg.norm(tensor):.10e} "
+                f"max|T|={np.abs(tensor).max():.10e}")
+        if reference is None:
+            reference = tensor
+        elif reference.shape == tensor.shape:
+            line += f" max|T-T0|={np.abs(tensor - reference).max():.10e}"
+        print(line)
+        if args.histogram:
+            print_histogram(*tor.stream_histogram([((0,) * tensor.ndim, tensor)]))
+
+    if args.blocks and len(tensors) > 1 and len({t.shape for t in tensors}) == 1:
+        stack = np.stack(tensors)
+        _, locations = tor.max_deviation(stack)
+        for outfile, location in zip(outfiles[1:], locations[1:]):
+            print(f"{outfile}: max|T-T0| at {tuple(int(i) for i in location)}")
+        blocks, worst = tor.top_blocks(tor.block_rms(stack), n=args.blocks)
+        print("blocks with the largest RMS(T-T0):")
+        for block, rms in zip(blocks, worst):
+            print(f"  {tuple(int(i) for i in block)}: {rms:.10e}")
+
+def print_histogram(counts, bins):
+    # values outside the bins are counted in the first/last one
+    for n, (low, high, count) in enumerate(zip(bins[:-1], bins[1:], counts)):
+        if not count:
+            continue
+        if n == 0:
+            print(f"  |T| < 1e{high:+03.0f}: {count}")
+        elif n == len(counts) - 1:
+            print(f"  |T| >= 1e{low:+03.0f}: {count}")
+        else:
+            print(f"  1e{low:+03.0f} <= |T| < 1e{high:+03.0f}: {count}")
+
+def convert_tensors(args, outfiles):
+    from Tests import tensor_output_reader as tor
+    from systems.generate_inputs_and_folders import clean_filename
+
+    if args.format == 'bin':
+        tensors_parser.error("--convert needs text dumps (--format std or def)")
+    for outfile in outfiles:
+        path = f"{os.path.splitext(outfile)[0]}.{clean_filename(args.name).replace('[', '_').replace(']', '')}.tensor"
+        with profiling.stage('tensor.convert', path=outfile):
+            header = tor.convert_text_dump(outfile, args.name, path, fmt=args.format)
+        print(f"{outfile}: {header['name']} {tuple(header['dims'])} -> {path}")
+
+def stream_tensors(args, outfiles):
+    from Tests import tensor_output_reader as tor
+
+    def blocks(outfile):
+        return tor.iter_tensor_blocks(outfile, args.name, fmt=args.format)
+
+    for n, outfile in enumerate(outfiles):
+        with profiling.stage('tensor.stream', path=outfile):
+            norm, max_abs, location, size = tor.stream_norms(blocks(outfile))
+            line = f"{outfile}: size={size} norm={norm:.10e} max|T|={max_abs:.10e} at {location}"
+            if n:
+                try:
+                    diff, diff_location = tor.stream_max_abs_diff(blocks(outfile), blocks(outfiles[0]))
+                    line += f" max|T-T0|={diff:.10e} at {diff_location}"
+                except ValueError as e:
+                    line += f" (not comparable: {e})"
+            print(line)
+            if args.histogram:
+                print_histogram(*tor.stream_histogram(blocks(outfile)))
+
+def print_usage():
+    print("usage: f12xg.py <subcommand> [args ...]\n\nsubcommands:")
+    for name, (_, help_str) in SCRIPTS.items():
+        print(f"  {name:10s} {help_str}")
+    print(f"  {'tensors':10s} Summarize/compare a tensor printed in output files")
+
+def main(argv):
+    if not argv or argv[0] in ('-h', '--help'):
+        print_usage()
+        return 0 if argv else 1
+
+    command, rest = argv[0], argv[1:]
+    if command == 'tensors':
+        tensors(rest)
+        return 0
+    if command not in SCRIPTS:
+        print(f"Unknown subcommand: {command}\n")
+        print_usage()
+        return 1
+
+    module, _ = SCRIPTS[command]
+    sys.argv = [f"f12xg.py {command}"] + rest
+    runpy.run_module(module, run_name='__main__', alter_sys=False)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
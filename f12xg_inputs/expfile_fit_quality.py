@@ -0,0 +1,179 @@
+'''
+Rank expfiles by how well the Gaussian expansion of every gamma reproduces
+its Slater geminal.
+
+Each block of an expfile (one gamma, its exponents alpha_k and coefficients
+c_k) is compared on a shared r12 grid with the target in Molpro's
+coefficient convention,
+
+    sum_k c_k exp(-alpha_k r^2)  ~  -(1/gamma) exp(-gamma r),
+
+weighted as in the geminal fit, w(r) = r exp(-0.5 (pi gamma^2)^(1/3) r).
+All blocks of all files are evaluated in one broadcasted computation
+(blocks x alphas x grid):
+
+    python expfile_fit_quality.py                  # all expfile_*.txt next to this script
+    python expfile_fit_quality.py --per-set --top 10
+'''
+import os
+import sys
+import glob
+import argparse
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import profiling
+
+parser = argparse.ArgumentParser(
+    description="Fit quality of the Gaussian expansions in expfiles w.r.t. their Slater geminals"
+)
+parser.add_argument('expfiles', nargs='*',
+                    help='expfiles, default all expfile_*.txt in the folder of this script')
+parser.add_argument('--rmax', type=float, default=4.0,
+                    help='end of the r12 grid (default 4.0)')
+parser.add_argument('--npoints', type=int, default=1000,
+                    help='number of r12 grid points (default 1000)')
+parser.add_argument('--per-set', action='store_true',
+                    help='one row per gamma_set (its worst block) instead of one row per block')
+parser.add_argument('--sort', default='rss',
+                    help='column to sort by, worst first (default rss)')
+parser.add_argument('--top', type=int, default=None,
+                    help='print only the first TOP rows')
+parser.add_argument('-o', '--outfile', default=None,
+                    help='write the table to this csv file')
+profiling.add_arguments(parser)
+
+def read_expfile(path):
+    '''
+    Blocks of an expfile as a list of dicts with keys gamma_index, gamma,
+    alphas and coeffs, in the order of their gamma index.
+    '''
+    blocks = {}
+    with open(path, 'r') as f:
+        for line in f:
+            words = line.split()
+            if not words or words[0].startswith('#') or len(words) < 3:
+                continue
+            index, key, data = int(words[0]), words[1], words[2]
+            block = blocks.setdefault(index, dict(gamma_index=index, gamma=np.nan, alphas=[], coeffs=[]))
+            if key == 'Gam':
+                block['gamma'] = float(data)
+            elif key == 'Exp':
+                block['alphas'] += [float(v) for v in data.split(',')]
+            elif key == 'Coe':
+                block['coeffs'] += [float(v) for v in data.split(',')]
+    return [blocks[i] for i in sorted(blocks)]
+
+def gamma_set_label(path):
+    '''expfile_1.00_1.40_1.20.txt -> 1.00_1.40_1.20, as in the gamma_set of the metadata.'''
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return stem.removeprefix('expfile_')
+
+def read_expfiles(paths):
+    '''
+    All blocks of `paths`: a DataFrame (file, gamma_set, gamma_index, gamma)
+    and arrays alphas, coeffs of shape (blocks, max number of Gaussians),
+    padded with zero coefficients.
+    '''
+    rows, alphas, coeffs = [], [], []
+    for path in paths:
+        for block in read_expfile(path):
+            if len(block['alphas']) != len(block['coeffs']):
+                raise ValueError(
+                    f"{path}: gamma index {block['gamma_index']} has "
+                    f"{len(block['alphas'])} exponents but {len(block['coeffs'])} coefficients"
+                )
+            rows.append(dict(file=path, gamma_set=gamma_set_label(path),
+                             gamma_index=block['gamma_index'], gamma=block['gamma']))
+            alphas.append(block['alphas'])
+            coeffs.append(block['coeffs'])
+
+    width = max((len(a) for a in alphas), default=0)
+    alpha_arr = np.zeros((len(alphas), width))
+    coeff_arr = np.zeros((len(coeffs), width))
+    for n, (a, c) in enumerate(zip(alphas, coeffs)):
+        alpha_arr[n, :len(a)] = a
+        coeff_arr[n, :len(c)] = c
+    return pd.DataFrame(rows), alpha_arr, coeff_arr
+
+def slater_target(gammas, x):
+    '''-(1/gamma) exp(-gamma r), shape (gammas, grid).'''
+    gammas = np.asarray(gammas)[:, None]
+    return -np.exp(-gammas * x) / gammas
+
+def fit_weights(gammas, x):
+    '''r exp(-0.5 (pi gamma^2)^(1/3) r), shape (gammas, grid).'''
+    gammas = np.asarray(gammas)[:, None]
+    return x * np.exp(-0.5 * (np.pi * gammas**2) ** (1 / 3) * x)
+
+def fit_quality(gammas, alphas, coeffs, x):
+    '''
+    Weighted residuals of every block on the grid `x`, in one broadcast
+    over (blocks, alphas, grid). Identical blocks (the same gamma appears
+    in many expfiles) are evaluated once.
+
+    Returns a dict of arrays of shape (blocks,):
+        rss        : sum of squared weighted residuals
+        rel_rss    : rss / sum of squared weighted target
+        max_abs    : max |weighted residual|
+        r_max_abs  : r12 at max_abs
+        err_r0     : unweighted error at r12 = x[0] (short range)
+    '''
+    params = np.column_stack([gammas, alphas, coeffs])
+    unique, inverse = np.unique(params, axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    u_gammas = unique[:, 0]
+    u_alphas, u_coeffs = np.split(unique[:, 1:], 2, axis=1)
+
+    gaussians = np.einsum('bk,bkx->bx', u_coeffs, np.exp(-u_alphas[:, :, None] * x**2))
+    target = slater_target(u_gammas, x)
+    weights = fit_weights(u_gammas, x)
+    residuals = weights * (gaussians - target)
+
+    rss = np.sum(residuals**2, axis=1)
+    imax = np.argmax(np.abs(residuals), axis=1)
+    quality = dict(
+        rss=rss,
+        rel_rss=rss / np.sum((weights * target)**2, axis=1),
+        max_abs=np.abs(residuals[np.arange(len(unique)), imax]),
+        r_max_abs=x[imax],
+        err_r0=gaussians[:, 0] - target[:, 0],
+    )
+    return {key: value[inverse] for key, value in quality.items()}
+
+def quality_table(paths, rmax=4.0, npoints=1000):
+    '''One row per expfile block with its fit quality (see `fit_quality`).'''
+    blocks, alphas, coeffs = read_expfiles(paths)
+    x = np.linspace(0, rmax, npoints)
+    quality = fit_quality(blocks['gamma'].to_numpy(), alphas, coeffs, x)
+    return blocks.assign(**quality)
+
+def per_gamma_set(table):
+    '''One row per gamma_set, with the quality of its worst block (largest rss).'''
+    worst = table.loc[table.groupby('gamma_set')['rss'].idxmax()]
+    total = table.groupby('gamma_set')['rss'].sum().rename('rss_total')
+    return worst.drop(columns=['gamma_index']).join(total, on='gamma_set')
+
+def main(args):
+    paths = args.expfiles or sorted(glob.glob(
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'expfile_*.txt')
+    ))
+    if not paths:
+        parser.error("No expfiles found")
+
+    table = quality_table(paths, rmax=args.rmax, npoints=args.npoints)
+    if args.per_set:
+        table = per_gamma_set(table)
+    table = table.sort_values(args.sort, ascending=False, ignore_index=True)
+    if args.outfile:
+        table.to_csv(args.outfile, index=False)
+    else:
+        shown = table if args.top is None else table.head(args.top)
+        print(shown.drop(columns=['file']).to_string())
+    return table
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    profiling.run(args, main, args)
@@ -0,0 +1,159 @@
+'''
+Scan Molpro outputs for failures and warnings before tabulating them.
+
+Every file is memory-mapped and searched for a set of byte patterns
+(errors, convergence warnings, termination markers, memory exhaustion),
+without reading it into Python strings. Files are scanned in
+parallel by a process pool, and the result is one row per file with a status and the number of
+matches of every pattern:
+
+    python output_scanner.py systems/cu_nh3/xg --problems
+    find . -name '*.out' -print0 | python output_scanner.py --stdin -0 --csv status.csv
+'''
+import os
+import sys
+import mmap
+import glob
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+import profiling
+
+parser = argparse.ArgumentParser(
+    description="""
+    Per-file status table (ok/incomplete/no_convergence/fit_failed/no_memory/error) of
+    Molpro outputs, found recursively in the given folders.
+    """
+)
+parser.add_argument('paths', nargs='*',
+                    help='output files and/or folders to search recursively')
+parser.add_argument('--ext', nargs='+', default=['out', 'xml'],
+                    help='extensions of the outputs searched in folders (default: out xml)')
+parser.add_argument('--stdin', action='store_true',
+                    help='read output files from stdin, one per line (or NUL separated with -0)')
+parser.add_argument('-0', '--null', action='store_true',
+                    help='file names on stdin are separated by NUL characters')
+parser.add_argument('--workers', '-j', type=int, default=None,
+                    help='number of processes (default: number of CPUs)')
+parser.add_argument('--problems', action='store_true',
+                    help='print only files whose status is not ok')
+parser.add_argument('--csv', default=None,
+                    help='write the status table to this csv file')
+profiling.add_arguments(parser)
+
+# name: literal byte strings, counted with mmap.find. For literals this is
+# about 4x faster than `re` (and more so than one alternation of them all).
+PATTERNS = {
+    'terminated': [b'Molpro calculation terminated', b'</molpro>'],
+    'geminal_fit': [b'NO CONVERGENCE IN GEMINAL FIT'],
+    'no_convergence': [b'NO CONVERGENCE', b'No convergence'],
+    'error': [b'? Error', b'GLOBAL ERROR', b'ERROR EXIT'],
+    'no_memory': [b'Insufficient memory', b'insufficient memory', b'INSUFFICIENT MEMORY',
+                  b'Not enough memory', b'not enough memory', b'Out of memory'],
+}
+
+# most severe first
+STATUSES = ['error', 'no_memory', 'fit_failed', 'no_convergence', 'incomplete', 'ok']
+
+def get_status(counts):
+    if counts['error']:
+        return 'error'
+    if counts['no_memory']:
+        return 'no_memory'
+    if counts['geminal_fit']:
+        return 'fit_failed'
+    # Molpro terminates normally after unconverged iterations
+    if counts['no_convergence']:
+        return 'no_convergence'
+    if not counts['terminated']:
+        return 'incomplete'
+    return 'ok'
+
+def _count(mm, literal):
+    """Number of occurrences of `literal` in `mm` and the position of the first."""
+    first = pos = mm.find(literal)
+    count = 0
+    while pos != -1:
+        count += 1
+        pos = mm.find(literal, pos + len(literal))
+    return count, first
+
+def _line_at(mm, pos):
+    start = mm.rfind(b'\n', 0, pos) + 1
+    end = mm.find(b'\n', pos)
+    return mm[start:end if end != -1 else len(mm)].decode(errors='replace').strip()
+
+def scan_file(path):
+    """
+    Scan one output. Returns a dict with the file, its size, status, the
+    number of matches per pattern and the first error/memory line (message).
+    """
+    counts = dict.fromkeys(PATTERNS, 0)
+    message = ''
+    try:
+        size = os.path.getsize(path)
+        if size:
+            with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for name, literals in PATTERNS.items():
+                    for literal in literals:
+                        count, first = _count(mm, literal)
+                        counts[name] += count
+                        if count and not message and name in ('error', 'no_memory'):
+                            message = _line_at(mm, first)
+        counts['no_convergence'] -= counts['geminal_fit']
+        status = get_status(counts)
+    except OSError as e:
+        size, status, message = 0, 'error', str(e)
+    return dict(file=path, size=size, status=status, **counts, message=message)
+
+def find_outputs(paths, extensions=('out', 'xml')):
+    """Files in `paths`, with folders searched recursively for the given extensions."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for ext in extensions:
+                files.extend(glob.glob(os.path.join(path, '**', f'*.{ext}'), recursive=True))
+        else:
+            files.append(path)
+    return sorted(set(files))
+
+def scan_files(files, workers=None, min_parallel=64):
+    """Status table (DataFrame) of `files`. Few files are scanned without starting a pool."""
+    if len(files) < min_parallel or workers == 1:
+        rows = [scan_file(f) for f in files]
+    else:
+        workers = workers or os.cpu_count()
+        chunksize = max(1, len(files) // (4 * workers))
+        # by module name, so the workers can unpickle it also when run via f12xg.py
+        import output_scanner
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            rows = list(pool.map(output_scanner.scan_file, files, chunksize=chunksize))
+    df = pd.DataFrame(rows, columns=['file', 'size', 'status', *PATTERNS, 'message'])
+    return df
+
+def main(args):
+    files = find_outputs(args.paths, args.ext)
+    if args.stdin:
+        from tabulate_outs import read_file_list
+        files += read_file_list(sys.stdin, null=args.null)
+    if not files:
+        parser.error("No output files found")
+
+    with profiling.stage('scan', label=f"{len(files)} files"):
+        df = scan_files(files, workers=args.workers)
+    counts = df['status'].value_counts()
+    summary = ', '.join(f"{status}: {counts[status]}" for status in STATUSES if status in counts)
+    if args.problems:
+        df = df[df['status'] != 'ok']
+    if args.csv:
+        df.to_csv(args.csv, index=False)
+    else:
+        print(df.to_string(index=False))
+    print(f"| {len(files)} files scanned. {summary}")
+    return df
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    profiling.run(args, main, args)
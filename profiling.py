@@ -0,0 +1,158 @@
+'''
+Lightweight timing of the hot stages of the scripts (parsing, globbing,
+template formatting, subprocesses), enabled with `--profile` on every entry
+point:
+
+    python tabulate_outs.py -x *.out --profile            # ranked summary on stderr
+    python tabulate_outs.py -x *.out --profile json --profile-out trace.json
+    python tabulate_outs.py -x *.out --cprofile run.prof  # view with `python -m pstats run.prof`
+
+Code is instrumented with
+
+    with profiling.stage('xml.parse', path=xmlfile):
+        tree = ET.parse(xmlfile)
+
+When profiling is disabled (the default) `stage` returns a shared no-op
+context manager, so the instrumentation costs a function call per stage.
+'''
+import os
+import sys
+import json
+import time
+import cProfile
+from contextlib import nullcontext
+
+_enabled = False
+_events = []  # (stage, label, start, seconds, nbytes)
+_t0 = time.perf_counter()
+_NULL = nullcontext()
+
+class _Stage:
+    __slots__ = ('name', 'label', 'nbytes', 'start')
+
+    def __init__(self, name, label, nbytes):
+        self.name = name
+        self.label = label
+        self.nbytes = nbytes
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        _events.append((self.name, self.label, self.start - _t0, end - self.start, self.nbytes))
+        return False
+
+def enable():
+    global _enabled, _t0
+    _enabled = True
+    _events.clear()
+    _t0 = time.perf_counter()
+
+def disable():
+    global _enabled
+    _enabled = False
+
+def is_enabled():
+    return _enabled
+
+def stage(name, path=None, label=None, nbytes=0):
+    """
+    Context manager timing one stage. With `path`, the size of the file is
+    counted as bytes read (and the path used as label).
+    """
+    if not _enabled:
+        return _NULL
+    if path is not None:
+        label = label or str(path)
+        try:
+            nbytes = os.path.getsize(path)
+        except (OSError, TypeError):
+            pass
+    return _Stage(name, label, nbytes)
+
+def events():
+    """The recorded stages as a list of dicts, in order of completion."""
+    return [
+        dict(stage=name, label=label, start_s=start, seconds=seconds, bytes=nbytes)
+        for name, label, start, seconds, nbytes in _events
+    ]
+
+def summary():
+    """Per-stage totals, ranked by total time."""
+    stages = {}
+    for name, _, _, seconds, nbytes in _events:
+        calls, total, longest, total_bytes = stages.get(name, (0, 0.0, 0.0, 0))
+        stages[name] = (calls + 1, total + seconds, max(longest, seconds), total_bytes + nbytes)
+    rows = [
+        dict(stage=name, calls=calls, total_s=total, mean_s=total / calls,
+             max_s=longest, bytes=total_bytes)
+        for name, (calls, total, longest, total_bytes) in stages.items()
+    ]
+    return sorted(rows, key=lambda row: row['total_s'], reverse=True)
+
+def print_summary(file=None):
+    file = file or sys.stderr
+    print(f"| PROFILE {'stage':28s} {'calls':>7s} {'total s':>10s} {'mean ms':>10s} "
+          f"{'max ms':>10s} {'MB':>9s} {'MB/s':>9s}", file=file)
+    for row in summary():
+        mb = row['bytes'] / 1024**2
+        rate = f"{mb / row['total_s']:9.1f}" if row['bytes'] and row['total_s'] > 0 else f"{'':9s}"
+        print(f"|         {row['stage']:28s} {row['calls']:7d} {row['total_s']:10.4f} "
+              f"{row['mean_s'] * 1e3:10.3f} {row['max_s'] * 1e3:10.3f} {mb:9.3f} {rate}", file=file)
+
+def write_trace(file=None):
+    """JSON trace with every recorded stage and the summary."""
+    json.dump(dict(events=events(), summary=summary()), file or sys.stderr, indent=1)
+
+def load_trace(path, prefix=''):
+    """Add the stages of a JSON trace (e.g. of a subprocess) with `prefix` prepended to their names."""
+    with open(path, 'r') as f:
+        trace = json.load(f)
+    for event in trace['events']:
+        _events.append((prefix + event['stage'], event['label'], event['start_s'],
+                        event['seconds'], event['bytes']))
+
+def report(fmt='summary', outfile=None):
+    if outfile is None:
+        write = print_summary if fmt == 'summary' else write_trace
+        write(sys.stderr)
+        return
+    with open(outfile, 'w') as f:
+        if fmt == 'summary':
+            print_summary(f)
+        else:
+            write_trace(f)
+
+def add_arguments(parser):
+    """Add --profile, --profile-out and --cprofile to an argparse parser."""
+    parser.add_argument('--profile', nargs='?', const='summary', choices=['summary', 'json'],
+                        help="time the stages of the run and print a ranked summary (default) "
+                             "or a JSON trace, to stderr unless --profile-out is given")
+    parser.add_argument('--profile-out', default=None,
+                        help='file to write the --profile report to')
+    parser.add_argument('--cprofile', default=None, metavar='FILE',
+                        help='also run under cProfile and dump the stats to FILE '
+                             '(view with `python -m pstats FILE`)')
+
+def run(args, func, *func_args, **func_kwargs):
+    """Call `func`, profiled as requested by the arguments of `add_arguments`."""
+    fmt = getattr(args, 'profile', None)
+    cprofile_file = getattr(args, 'cprofile', None)
+    if not (fmt or cprofile_file):
+        return func(*func_args, **func_kwargs)
+
+    enable()
+    profiler = cProfile.Profile() if cprofile_file else None
+    try:
+        with stage('total'):
+            if profiler is not None:
+                return profiler.runcall(func, *func_args, **func_kwargs)
+            return func(*func_args, **func_kwargs)
+    finally:
+        if profiler is not None:
+            profiler.dump_stats(cprofile_file)
+        if fmt:
+            report(fmt, getattr(args, 'profile_out', None))
+        disable()
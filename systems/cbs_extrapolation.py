@@ -0,0 +1,257 @@
+import os
+import re
+import sys
+import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from systems.interaction import get_energy_columns, get_group_columns
+import profiling
+
+parser = argparse.ArgumentParser(
+    description="Extrapolate energies to the complete basis set (CBS) limit"
+)
+parser.add_argument(
+    "folder",
+    help="System/method folder containing `metadata.json`, e.g. cu_nh3/nh3/standard"
+)
+parser.add_argument(
+    "--system",
+    help="Read `<basis>/table_<system>_<charge>_<basis>.csv` tables instead of `data.csv`",
+    default=None
+)
+parser.add_argument(
+    "--charge", type=int, default=0,
+    help="Charge used in the table file names"
+)
+parser.add_argument(
+    "--energy", default=None,
+    help="Correlation energy column to extrapolate, default is the one named like 'correlation energy'/CORR_ENER. "
+         "The HF part (total - correlation) is not extrapolated, the largest basis is used"
+)
+parser.add_argument(
+    "--total", default=None,
+    help="Total energy column, default is the one named like 'total energy'/TOT_ENER if present"
+)
+parser.add_argument(
+    "--exponent", type=float, default=None,
+    help="Exponent of the two-point X^-p formula for all pairs of bases. Default 3, or with --f12 "
+         "the one of each pair of bases in `CBS_F12_EXPONENTS`"
+)
+parser.add_argument(
+    "--f12",
+    help="Use the F12 exponents of each pair of cc-pVXZ-F12 bases (see `CBS_F12_EXPONENTS`)",
+    action='store_true'
+)
+parser.add_argument(
+    "--outfile",
+    help="output file to write data to, default is `cbs.csv` in `folder`"
+)
+parser.add_argument(
+    "--print_only",
+    help="print output only",
+    action='store_true'
+)
+profiling.add_arguments(parser)
+
+# Exponent p of E_X = E_CBS + A X^-p for the correlation energy.
+# Conventional methods converge as X^-3.
+CBS_EXPONENT = 3.0
+
+# F12 correlation energies: optimized p of the pairs (X, X+1) of cc-pVXZ-F12
+# bases, from Hill, Peterson, Knizia & Werner, JCP 131, 194105 (2009).
+# (X^-7 is the convergence of the pair energies in the partial wave L, not
+# in the cardinal number X.)
+CBS_F12_EXPONENTS = {
+    (2, 3): 3.09,
+    (3, 4): 4.35,
+}
+
+CARDINAL_REGEX = re.compile(r'V\(?([DTQ2-9])(?:\+D\))?Z', re.IGNORECASE)
+
+def basis_cardinal(basis: str) -> int:
+    '''
+    Cardinal number X of a correlation consistent basis from its `VXZ`,
+    e.g. cc-pVTZ, aug-cc-pVQZ, cc-pVDZ-F12, cc-pV(T+d)Z, avtz.
+    Raises ValueError if there is none.
+    '''
+    size_dict = {
+        'D' : 2, 'T' : 3, 'Q' : 4
+    }
+    match = CARDINAL_REGEX.search(basis)
+    if match is None:
+        raise ValueError(f"Unknown cardinal number of basis '{basis}'")
+    size_str = match.group(1).upper()
+    if size_str in size_dict:
+        return size_dict[size_str]
+    return int(size_str)
+
+def find_column(columns, *keywords) -> str | None:
+    """First column whose lowercased name contains all `keywords`, e.g. ('corr', 'ener')."""
+    for col in columns:
+        if all(k in col.lower() for k in keywords):
+            return col
+    return None
+
+def get_bases(meta: dict) -> list[str]:
+    """Bases from metadata, either a plain list or an iterable entry."""
+    bases = meta['bases']
+    if isinstance(bases, dict):
+        return bases['values']
+    return bases
+
+def read_basis_tables(folder: str, system: str, bases: list[str], charge: int = 0) -> pd.DataFrame:
+    """
+    Read `folder/<basis>/table_<system>_<charge>_<basis>.csv` for all `bases`
+    into one long-format DataFrame with a `bases` column.
+    """
+    fnames = [
+        os.path.join(folder, basis, f"table_{system}_{charge}_{basis.lower()}.csv")
+        for basis in bases
+    ]
+    with ThreadPoolExecutor() as pool:
+        tables = list(pool.map(
+            lambda f: pd.read_csv(f, skipinitialspace=True), fnames
+        ))
+    lengths = [len(t) for t in tables]
+    df = pd.concat(tables, ignore_index=True)
+    df.insert(0, 'bases', np.repeat(bases, lengths))
+    return df
+
+def pivot_bases(
+    df: pd.DataFrame,
+    energy_col: str,
+    index_cols: list[str] | None = None,
+    basis_col: str = 'bases',
+) -> pd.DataFrame:
+    """
+    Align the energies of all bases on `index_cols` (e.g. GEM_BETA,
+    distances) with a single pivot. Columns are ordered by basis cardinal
+    number. By default the index is every sweep parameter except the basis
+    (as `interaction.get_group_columns`). Raises ValueError if a basis has
+    several rows with the same index.
+    """
+    if index_cols is None:
+        index_cols = get_group_columns(df, get_energy_columns(df) + [energy_col, basis_col])
+    if not index_cols:
+        wide = df.assign(_all=0).pivot(index='_all', columns=basis_col, values=energy_col)
+        wide = wide.reset_index(drop=True)
+    else:
+        wide = df.pivot(index=index_cols, columns=basis_col, values=energy_col)
+    order = sorted(wide.columns, key=basis_cardinal)
+    wide = wide[order]
+    wide.columns.name = None
+    return wide
+
+def cbs_two_point(e_x, e_y, x, y, exponent=3.0):
+    """
+    Two-point extrapolation assuming E_X = E_CBS + A X^-p
+
+        E_CBS = (X^p E_X - Y^p E_Y) / (X^p - Y^p)
+
+    Works element-wise on arrays of energies.
+    """
+    xp = float(x) ** exponent
+    yp = float(y) ** exponent
+    return (xp * np.asarray(e_x) - yp * np.asarray(e_y)) / (xp - yp)
+
+def cbs_three_point(e_1, e_2, e_3):
+    """
+    Three-point exponential extrapolation (Feller) for consecutive cardinal
+    numbers, assuming E_X = E_CBS + B exp(-C X)
+
+        E_CBS = (E_1 E_3 - E_2^2) / (E_1 + E_3 - 2 E_2)
+
+    Works element-wise on arrays of energies.
+    """
+    e_1, e_2, e_3 = np.asarray(e_1), np.asarray(e_2), np.asarray(e_3)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (e_1 * e_3 - e_2**2) / (e_1 + e_3 - 2 * e_2)
+
+def extrapolate(wide: pd.DataFrame, exponent: float | dict = 3.0) -> pd.DataFrame:
+    """
+    Apply the two-point formula to every pair of consecutive bases and the
+    three-point formula to every triple, for all rows of `wide` (as returned
+    by `pivot_bases`) at once. `exponent` is the same for all pairs, or a
+    dict {(X, Y): p} by cardinal numbers (e.g. `CBS_F12_EXPONENTS`).
+    """
+    bases = list(wide.columns)
+    cardinals = [basis_cardinal(b) for b in bases]
+    values = wide.to_numpy(dtype=np.float64)
+
+    out = wide.copy()
+    for n in range(len(bases) - 1):
+        x, y = cardinals[n + 1], cardinals[n]
+        p = exponent
+        if isinstance(exponent, dict):
+            if (y, x) not in exponent:
+                raise ValueError(f"No exponent for the bases of cardinal numbers {y} and {x}, pass one")
+            p = exponent[(y, x)]
+        out[f"CBS_{y}{x}"] = cbs_two_point(values[:, n + 1], values[:, n], x, y, p)
+    for n in range(len(bases) - 2):
+        if cardinals[n + 2] - cardinals[n + 1] != 1 or cardinals[n + 1] - cardinals[n] != 1:
+            continue
+        label = ''.join(str(c) for c in cardinals[n:n + 3])
+        out[f"CBS_{label}"] = cbs_three_point(values[:, n], values[:, n + 1], values[:, n + 2])
+    return out
+
+def extrapolate_correlation(
+    df: pd.DataFrame,
+    corr_col: str,
+    total_col: str | None = None,
+    exponent: float | dict = 3.0,
+) -> pd.DataFrame:
+    """
+    Extrapolate the correlation energy `corr_col` (see `extrapolate`). With
+    `total_col`, the HF energy (total - correlation) of the largest basis
+    is added as `HF`, and every CBS column `c` gets a `c_total` = HF + c:
+    the HF energy converges exponentially and is not extrapolated.
+    """
+    if 'corr' not in corr_col.lower():
+        raise ValueError(
+            f"Only correlation energies are extrapolated with X^-p, '{corr_col}' "
+            f"does not look like one; pass the correlation energy column"
+        )
+    cbs = extrapolate(pivot_bases(df, corr_col), exponent=exponent)
+    if total_col is None:
+        return cbs
+
+    hf = pivot_bases(df.assign(_hf=df[total_col] - df[corr_col]), '_hf')
+    cbs['HF'] = hf[hf.columns[-1]]
+    for col in [c for c in cbs.columns if c.startswith('CBS_')]:
+        cbs[f"{col}_total"] = cbs['HF'] + cbs[col]
+    return cbs
+
+def main(args):
+    with open(os.path.join(args.folder, 'metadata.json'), 'r') as f:
+        meta = json.load(f)
+    bases = get_bases(meta)
+
+    if args.system:
+        df = read_basis_tables(args.folder, args.system, bases, charge=args.charge)
+    else:
+        df = pd.read_csv(os.path.join(args.folder, 'data.csv'), skipinitialspace=True)
+
+    corr_col = args.energy or find_column(df.columns, 'corr', 'ener')
+    if corr_col is None:
+        parser.error("No correlation energy column found, pass it with --energy")
+    total_col = args.total or find_column(df.columns, 'tot', 'ener')
+
+    exponent = args.exponent
+    if exponent is None:
+        exponent = CBS_F12_EXPONENTS if args.f12 else CBS_EXPONENT
+
+    cbs = extrapolate_correlation(df, corr_col, total_col, exponent=exponent).reset_index()
+    if args.print_only:
+        print(cbs.to_string())
+        return cbs
+    outfile = args.outfile or os.path.join(args.folder, 'cbs.csv')
+    cbs.to_csv(outfile, index=False)
+    return cbs
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    profiling.run(args, main, args)
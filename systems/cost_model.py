@@ -0,0 +1,292 @@
+'''
+Wall time and memory of pending inputs, predicted from the completed
+outputs of this and earlier sweeps.
+
+Every completed `.out` gives its wall time (the last `REAL TIME`), the memory
+Molpro allocates (`Total memory per node`, i.e. the `memory,` card of the
+input), the memory it reports it needs (`Minimum memory for incore
+algorithm`) and its disk use. A pending input gets the median over the
+completed jobs most similar to it, going from the most to the least specific
+key of `LEVELS` until one has samples:
+
+    (calc_type, basis, n_atoms, settings) -> (calc_type, basis, n_atoms)
+        -> (calc_type, basis) -> (basis,) -> all jobs
+
+where `settings` are the remaining sweep parameters (gammas, ...) except
+distances. The predicted memory is never less than the `memory,` card of the
+pending input itself, as Molpro allocates all of it at the start. E.g.
+
+    python cost_model.py cu_nh3/xg/metadata.json --history cu_nh3/standard/metadata.json --slots 8
+'''
+import os
+import re
+import sys
+import json
+import mmap
+import heapq
+import argparse
+from argparse import Namespace
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from systems import generate_inputs_and_folders as giaf
+from systems.output_index import OutputIndex
+import profiling
+
+parser = argparse.ArgumentParser(
+    description="Predict wall time and memory of the pending inputs of a sweep from completed outputs"
+)
+parser.add_argument(
+    "metadata_path",
+    help="Path to metadata"
+)
+parser.add_argument(
+    "--history", nargs="+", default=[],
+    help="metadata of other sweeps whose completed outputs are also learned from"
+)
+parser.add_argument(
+    "--slots", type=int, default=1,
+    help="number of jobs running at the same time, for the remaining time estimate (default 1)"
+)
+parser.add_argument(
+    "-o", "--outfile",
+    help="write the table of all inputs with their (predicted) costs to this csv file"
+)
+profiling.add_arguments(parser)
+
+BASIS_KEYS = ["bases", "basis"]
+REFERENCE_CALC_TYPE = "reference"
+
+# most specific first
+LEVELS = [
+    ("calc_type", "basis", "n_atoms", "settings"),
+    ("calc_type", "basis", "n_atoms"),
+    ("calc_type", "basis"),
+    ("basis",),
+    (),
+]
+
+MW_TO_GB = 8e6 / 1e9
+
+# memory,<n>[,<unit>] of a Molpro input, in words or k/m/g words
+MEMORY_CARD_REGEX = re.compile(rb"^\s*memory\s*,\s*([\d.]+)\s*(?:,\s*([kmg]))?", re.IGNORECASE | re.MULTILINE)
+WORD_UNITS_MW = {b"": 1e-6, b"k": 1e-3, b"m": 1.0, b"g": 1e3}
+
+def memory_card_mw(text):
+    """Memory of the first `memory,` card in `text` (bytes) in MW, NaN if there is none."""
+    m = MEMORY_CARD_REGEX.search(text)
+    if not m:
+        return np.nan
+    return float(m.group(1)) * WORD_UNITS_MW[(m.group(2) or b"").lower()]
+
+def input_memory_gb(file_path):
+    """Memory (GB) allocated by the `memory,` card of an input, NaN if it has none or does not exist."""
+    try:
+        with open(file_path, "rb") as f:
+            return memory_card_mw(f.read()) * MW_TO_GB
+    except OSError:
+        return np.nan
+
+def _values_after(mm, literal):
+    """First number after every occurrence of `literal` in `mm`."""
+    values = []
+    pos = mm.find(literal)
+    while pos != -1:
+        end = mm.find(b"\n", pos)
+        words = mm[pos + len(literal):end if end != -1 else len(mm)].split()
+        try:
+            values.append(float(words[0]))
+        except (IndexError, ValueError):
+            pass
+        pos = mm.find(literal, pos + len(literal))
+    return values
+
+def _count_atoms(mm):
+    """Number of rows of the first ATOMIC COORDINATES table, None if there is none."""
+    pos = mm.find(b" ATOMIC COORDINATES")
+    if pos == -1:
+        return None
+    n_atoms = 0
+    for line in mm[pos:pos + 100000].split(b"\n")[1:]:
+        words = line.split()
+        if words and words[0].isdigit():
+            n_atoms += 1
+        elif n_atoms:
+            break
+    return n_atoms
+
+def read_costs(outfile):
+    """
+    Costs of a completed Molpro output as a dict with wall_time (s),
+    memory_gb, needed_gb, disk_mb, n_atoms and basis, or None if the
+    output has not terminated. memory_gb is the memory Molpro allocated
+    per node (from the `memory,` card of the echoed input if it does not
+    print it), which it takes at the start whether it uses it or not.
+    Molpro does not print the peak memory, so needed_gb is what it
+    reports it needs for the in-core algorithms (times the number of
+    processes), NaN if it does not.
+    """
+    with open(outfile, "rb") as f:
+        if not os.fstat(f.fileno()).st_size:
+            return None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if mm.rfind(b"Molpro calculation terminated") == -1:
+                return None
+            real_time = _values_after(mm, b" REAL TIME  *")
+            disk = _values_after(mm, b" DISK USED  *")
+            per_process = _values_after(mm, b"Memory per process:")
+            per_node = _values_after(mm, b"Total memory per node:")
+            needed = _values_after(mm, b"Minimum memory for incore algorithm:")
+            card = memory_card_mw(mm[:mm.find(b"Memory per process:")]) if not per_node else np.nan
+            basis = mm.find(b"SETTING BASIS")
+            basis = mm[basis:mm.find(b"\n", basis)].split(b"=")[-1].strip().decode() if basis != -1 else None
+            n_atoms = _count_atoms(mm)
+
+    allocated = per_node[0] if per_node else card
+    processes = per_node[0] / per_process[0] if per_node and per_process else 1
+    return dict(
+        wall_time=real_time[-1] if real_time else np.nan,
+        memory_gb=allocated * MW_TO_GB,
+        needed_gb=max(needed) * processes * MW_TO_GB if needed else np.nan,
+        disk_mb=max(disk) if disk else np.nan,
+        n_atoms=n_atoms,
+        basis=basis,
+    )
+
+def input_features(kwargs, calc_type):
+    """calc_type, basis and settings (other parameters except distances) of an input."""
+    basis = next((str(kwargs[key]) for key in BASIS_KEYS if key in kwargs), None)
+    settings = {
+        k: v for k, v in kwargs.items()
+        if k not in BASIS_KEYS and k != "full_file_prefix" and "distance" not in k
+    }
+    return dict(calc_type=calc_type, basis=basis, settings=json.dumps(settings, sort_keys=True))
+
+def sweep_table(metadata_path, index=None):
+    """
+    One row per input of the sweep (references first, if any) with its
+    features, the memory allocated by its `memory,` card (input_memory_gb),
+    whether it is done and, for done ones, its costs. Pending inputs get the
+    most common n_atoms of the done ones of the sweep.
+    """
+    meta = giaf.read_metadata(metadata_path)
+    args_ns = Namespace(metadata_path=metadata_path, dry_run=False, output=None)
+    index = index or OutputIndex()
+
+    items = []
+    if meta.get("reference_template"):
+        items += [(item, REFERENCE_CALC_TYPE) for item in giaf.generate_reference_paths(args_ns, meta)]
+    items += [(item, meta.get("calc_type")) for item in giaf.generate_file_paths(args_ns, meta)]
+
+    rows = []
+    for (file_path, folder_path, _, kwargs), calc_type in items:
+        row = dict(input=file_path, folder=folder_path, **input_features(kwargs, calc_type),
+                   input_memory_gb=input_memory_gb(file_path))
+        base, _ = os.path.splitext(file_path)
+        outfiles = index.matches(base, "out")
+        costs = read_costs(outfiles[-1]) if outfiles else None
+        if costs:
+            # the basis of the parameters if any, as in the pending inputs
+            row.update({k: v for k, v in costs.items() if not (k == "basis" and row["basis"])})
+        rows.append(dict(row, done=costs is not None))
+
+    df = pd.DataFrame(rows)
+    for col in ("wall_time", "memory_gb", "needed_gb", "disk_mb", "n_atoms"):
+        if col not in df:
+            df[col] = np.nan
+    n_atoms = df.loc[df["done"], "n_atoms"].dropna()
+    if len(n_atoms):
+        df.loc[~df["done"], "n_atoms"] = n_atoms.mode()[0]
+    return df
+
+class CostModel:
+    """
+    Medians of wall_time, memory_gb, needed_gb and disk_mb of completed jobs
+    at every level of `LEVELS`. `predict` uses the most specific level with samples.
+    """
+    targets = ["wall_time", "memory_gb", "needed_gb", "disk_mb"]
+
+    def __init__(self, history):
+        history = history[history["done"]] if "done" in history else history
+        self.n_samples = len(history)
+        self.medians = []
+        for level in LEVELS:
+            if level:
+                medians = history.groupby(list(level), dropna=False)[self.targets].median()
+            else:
+                medians = history[self.targets].median().to_frame().T
+            self.medians.append(medians)
+
+    def predict(self, features):
+        """
+        Predicted wall_time, memory_gb, needed_gb and disk_mb for every row
+        of `features`, and the level (index into LEVELS) they come from
+        (NaN without any history). With an input_memory_gb column,
+        memory_gb is at least that.
+        """
+        prediction = pd.DataFrame(np.nan, index=features.index, columns=self.targets + ["level"])
+        for n, (level, medians) in enumerate(zip(LEVELS, self.medians)):
+            todo = prediction["level"].isna()
+            if not todo.any() or not self.n_samples:
+                break
+            if level:
+                keys = pd.MultiIndex.from_frame(features.loc[todo, list(level)])
+                found = medians.reindex(keys)
+                found.index = features.index[todo]
+            else:
+                found = pd.DataFrame([medians.iloc[0]] * todo.sum(), index=features.index[todo])
+            found = found.dropna(subset=["wall_time"])
+            prediction.loc[found.index, self.targets] = found[self.targets]
+            prediction.loc[found.index, "level"] = n
+        if "input_memory_gb" in features:
+            prediction["memory_gb"] = np.fmax(prediction["memory_gb"], features["input_memory_gb"])
+        return prediction
+
+def predict_sweep(metadata_path, history_paths=()):
+    """Table of `sweep_table` with predicted_* columns for all inputs, learned from all given sweeps."""
+    index = OutputIndex()
+    df = sweep_table(metadata_path, index=index)
+    history = pd.concat([df] + [sweep_table(path, index=index) for path in history_paths], ignore_index=True)
+    prediction = CostModel(history).predict(df)
+    return df.join(prediction.add_prefix("predicted_"))
+
+def remaining_time(wall_times, slots=1):
+    """
+    Time to run jobs of `wall_times` on `slots` parallel slots, started
+    longest first, each on the slot that frees up first.
+    """
+    loads = [0.0] * max(slots, 1)
+    for wall_time in sorted(wall_times, reverse=True):
+        heapq.heapreplace(loads, loads[0] + wall_time)
+    return max(loads)
+
+def format_duration(seconds):
+    hours, rest = divmod(int(round(seconds)), 3600)
+    return f"{hours}h{rest // 60:02d}m{rest % 60:02d}s"
+
+def main(args):
+    df = predict_sweep(args.metadata_path, args.history)
+    pending = df[~df["done"]]
+
+    summary = df.groupby(["calc_type", "basis"], dropna=False).agg(
+        done=("done", "sum"),
+        pending=("done", lambda done: (~done).sum()),
+        wall_time=("predicted_wall_time", "median"),
+        memory_gb=("predicted_memory_gb", "median"),
+    )
+    print(summary.to_string())
+
+    unknown = pending["predicted_wall_time"].isna().sum()
+    total = remaining_time(pending["predicted_wall_time"].dropna(), slots=args.slots)
+    print(f"| {len(pending)} of {len(df)} inputs pending, about {format_duration(total)} left "
+          f"on {args.slots} slot(s)" + (f", {unknown} without any history" if unknown else ""))
+
+    if args.outfile:
+        df.to_csv(args.outfile, index=False)
+    return df
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    profiling.run(args, main, args)
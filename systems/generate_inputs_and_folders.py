@@ -1,10 +1,11 @@
-import numpy as np
 import json
+import hashlib
 import argparse
 import itertools
 import os, sys
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import profiling
 
 parser = argparse.ArgumentParser(description="Generate folders and inputs")
 
@@ -24,6 +25,7 @@ parser.add_argument(
     help="File to write input script to",
     default=None, required=False,
 )
+profiling.add_arguments(parser)
 
 
 def safe_format(inp: str, d: dict) -> str:
@@ -52,11 +54,12 @@ def read_metadata(metadata_path: str) -> dict:
 def write_input(template_file, kwargs, inp=None):
     with open(template_file, 'r') as tinp:
         template = tinp.read()
-    input_script = safe_format(template, kwargs)
+    with profiling.stage('template.format', label=template_file):
+        input_script = safe_format(template, kwargs)
     if inp is None:
         print(input_script)
     else:
-        with open(inp, 'w') as out:
+        with profiling.stage('input.write', label=inp), open(inp, 'w') as out:
             
             out.write(input_script)
 
@@ -81,26 +84,100 @@ def generate_items(iterables):
         params = dict(zip(keys, combo))
         yield params
 
+BATCH_INDEX = "ibatch"
+DEFAULT_BATCH_COLUMNS = ["tot_ener", "corr_ener"]
+
+def get_iterables(meta, batched=None):
+    """
+    Iterables of the metadata. With batched=True/False only those that are
+    (not) marked `"batched": true`.
+    """
+    iterables = {k: v for k, v in meta.items() if isinstance(v, dict) and v.get("iterable")}
+    if batched is None:
+        return iterables
+    return {k: v for k, v in iterables.items() if bool(v.get("batched")) == batched}
+
+def batch_kwargs(meta, full_file_prefix):
+    """
+    Template keywords for the batched iterables of `meta`, looped over inside
+    a single Molpro input:
+
+    * {batch_do}    : the value arrays and `do ibatch=1,#<key>`
+    * {batch_enddo} : `enddo`
+    * {batch_table} : `table,<keys>,<batch_columns>;save,file='<full_file_prefix>.csv'`
+    * {<key>}       : `<key>(ibatch)` for every batched key
+    * {batch_index} : the loop variable, e.g. for `tot_ener({batch_index})=energy`
+
+    The cartesian product of the batched values is flattened into arrays of
+    equal length, so several batched iterables share one loop. Values must be
+    numeric since they become Molpro variables.
+    """
+    batched = get_iterables(meta, batched=True)
+    if not batched:
+        return {}
+
+    kwargs = {"batch_index": BATCH_INDEX}
+    combos = list(generate_items(batched))
+    lines = []
+    for key, conf in batched.items():
+        values = [params[key] for params in combos]
+        for value in values:
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise ValueError(
+                    f"Batched iterable '{key}' must have numeric values, got {value!r}"
+                )
+        lines.append(f"{key}=[" + ",".join(format_value(v, conf.get("format")) for v in values) + "]")
+        kwargs[key] = f"{key}({BATCH_INDEX})"
+    lines.append(f"do {BATCH_INDEX}=1,#{next(iter(batched))}")
+
+    columns = list(batched) + meta.get("batch_columns", DEFAULT_BATCH_COLUMNS)
+    kwargs["batch_do"] = "\n".join(lines)
+    kwargs["batch_enddo"] = "enddo"
+    kwargs["batch_table"] = f"table,{','.join(columns)};save,file='{full_file_prefix}.csv'"
+    return kwargs
+
+def unbatch_table(df, meta):
+    """
+    Map the rows of a table saved by a batched input back onto the sweep
+    parameters: Molpro upper-cases the variable names, so e.g. DISTANCES is
+    renamed to distances and formatted like the unbatched values ("01.900").
+    """
+    renames = {}
+    for key, conf in get_iterables(meta, batched=True).items():
+        for col in df.columns:
+            if col.strip().lower() == key.lower():
+                renames[col] = key
+                break
+    df = df.rename(columns=renames)
+    for key in renames.values():
+        fmt = get_iterables(meta)[key].get("format")
+        df[key] = [format_value(v, fmt) for v in df[key]]
+    return df
+
 clean_filename_dict = {
         "*" : ".",
         "(" : "_",
         ")" : "",
         "," : "-"
         }
+def clean_filename(prefix):
+    new_prefix = ''
+    for c in prefix:
+        if c in clean_filename_dict:
+            new_prefix += clean_filename_dict[c]
+        else:
+            new_prefix += c
+    return new_prefix
+
 def generate_file_paths(args, meta):
-    """Yield (file_path, folder_path, kwargs) tuples for each parameter combination."""
-    iterables = {k: v for k, v in meta.items() if isinstance(v, dict) and v.get("iterable")}
+    """
+    Yield (file_path, folder_path, template_file, kwargs) tuples for each parameter combination.
+    Batched iterables are looped over inside the input and do not appear in kwargs.
+    """
+    iterables = get_iterables(meta, batched=False)
     working_folder = os.path.dirname(args.metadata_path)
     template_file = os.path.join(working_folder, meta['template'])
     
-    def clean_filename(prefix):
-        new_prefix = ''
-        for c in prefix:
-            if c in clean_filename_dict:
-                new_prefix += clean_filename_dict[c]
-            else:
-                new_prefix += c
-        return new_prefix
     for params in generate_items(iterables):
         path_parts = [working_folder]
         file_prefix = meta["file_prefix"]
@@ -126,21 +203,115 @@ def generate_file_paths(args, meta):
         yield file_path, folder_path, template_file, kwargs
 
 
+def parse_shard(spec):
+    """'i/N' -> (i, N), the i-th (0-based) of N shards. For argparse `type=`."""
+    try:
+        i, n = (int(x) for x in spec.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"shard must be 'i/N', e.g. 0/4, got '{spec}'")
+    if not 0 <= i < n:
+        raise argparse.ArgumentTypeError(f"shard index must be in 0..{n - 1}, got '{spec}'")
+    return i, n
+
+def shard_of(kwargs, n_shards):
+    """
+    Shard (0..n_shards-1) of the input with parameters `kwargs`, from a
+    sha1 of the formatted parameters: the same on every machine and run.
+    """
+    params = sorted((k, str(v)) for k, v in kwargs.items() if k != "full_file_prefix")
+    digest = hashlib.sha1(json.dumps(params).encode()).hexdigest()
+    return int(digest, 16) % n_shards
+
+def filter_shard(items, shard):
+    """Only the (file_path, folder_path, template_file, kwargs, ...) `items` of `shard` = (i, N)."""
+    if shard is None:
+        yield from items
+        return
+    i, n = shard
+    for item in items:
+        if shard_of(item[3], n) == i:
+            yield item
+
+REFERENCE_FOLDER = "reference"
+
+def reference_meta(meta):
+    """
+    Metadata of the reference (HF/MP2) inputs: the `reference_template`
+    with the iterables marked `"f12_only": true` removed, since they do not
+    change the reference.
+    """
+    ref_meta = {k: v for k, v in meta.items() if not (isinstance(v, dict) and v.get("f12_only"))}
+    ref_meta["template"] = meta["reference_template"]
+    if get_iterables(ref_meta, batched=True):
+        raise ValueError("Batched iterables must be f12_only when a reference_template is used")
+    return ref_meta
+
+def generate_reference_paths(args, meta):
+    """
+    Yield (file_path, folder_path, template_file, kwargs) of the reference
+    inputs, one per combination of the iterables that are not f12_only,
+    written to a `reference/` subfolder of their parameter folders.
+    """
+    for file_path, folder_path, template_file, kwargs in generate_file_paths(args, reference_meta(meta)):
+        folder_path = os.path.join(folder_path, REFERENCE_FOLDER)
+        file_path = os.path.join(folder_path, os.path.basename(file_path))
+        yield file_path, folder_path, template_file, kwargs
+
+def wfu_name(file_path):
+    """Wavefunction file of an input, 'path/name.inp' -> 'name.wfu' (relative to its folder)."""
+    return os.path.splitext(os.path.basename(file_path))[0] + ".wfu"
+
+def reference_lookup(args, meta):
+    """
+    Maps the (formatted) values of the iterables that are not f12_only to
+    the reference input they belong to. See `get_reference_file`.
+    """
+    keys = list(get_iterables(reference_meta(meta)))
+    return {
+        tuple(kwargs[key] for key in keys): file_path
+        for file_path, _, _, kwargs in generate_reference_paths(args, meta)
+    }, keys
+
+def get_reference_file(kwargs, lookup):
+    """The reference input of the input with parameters `kwargs`."""
+    references, keys = lookup
+    return references[tuple(kwargs[key] for key in keys)]
+
+def _write_input_file(args, file_path, folder_path, template_file, kwargs):
+    if args.dry_run:
+        print(f"Dry-run, would write to {file_path}:")
+        write_input(template_file, kwargs)
+    else:
+        os.makedirs(folder_path, exist_ok=True)
+        if args.output is not None:
+            inpfile = os.path.join(os.path.dirname(file_path), args.output)
+        else:
+            inpfile = file_path
+        write_input(template_file, kwargs, inp=inpfile)
+
 def write_generated_files(args, meta):
-    """Write input files based on generated file paths."""
+    """
+    Write input files based on generated file paths.
+
+    With a `reference_template` in the metadata, the reference (HF/MP2)
+    inputs are written as well. Both get `{reference_wfu}`, the name of
+    their own wavefunction file: the reference saves it, and the runner
+    copies it to every dependent input before running it.
+    """
     non_iterables = {k: v for k, v in meta.items() if not (isinstance(v, dict) and v.get("iterable"))}
+    use_reference = bool(meta.get("reference_template"))
+    if use_reference:
+        for file_path, folder_path, template_file, kwargs in generate_reference_paths(args, meta):
+            kwargs.update(non_iterables)
+            kwargs["reference_wfu"] = wfu_name(file_path)
+            _write_input_file(args, file_path, folder_path, template_file, kwargs)
+
     for file_path, folder_path, template_file, kwargs in generate_file_paths(args, meta):
         kwargs.update(non_iterables)
-        if args.dry_run:
-            print(f"Dry-run, would write to {file_path}:")
-            write_input(template_file, kwargs)
-        else:
-            os.makedirs(folder_path, exist_ok=True)
-            if args.output is not None:
-                inpfile = os.path.join(os.path.dirname(file_path), args.output)
-            else:
-                inpfile = file_path
-            write_input(template_file, kwargs, inp=inpfile)
+        kwargs.update(batch_kwargs(meta, kwargs["full_file_prefix"]))
+        if use_reference:
+            kwargs["reference_wfu"] = wfu_name(file_path)
+        _write_input_file(args, file_path, folder_path, template_file, kwargs)
 
 
 def generate_files(args, meta):
@@ -150,6 +321,6 @@ def generate_files(args, meta):
 if __name__ == "__main__":
     args = parser.parse_args()
     metadata = read_metadata(args.metadata_path)
-    generate_files(args, metadata)
+    profiling.run(args, generate_files, args, metadata)
     
         
@@ -6,8 +6,14 @@ import re
 from io import StringIO
 import argparse
 import json
-import glob
 import ast
+import tempfile
+import os, sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from systems import result_store as rs
+from systems.output_index import OutputIndex
+import profiling
 
 parser = argparse.ArgumentParser(description="Get table of energies")
 parser.add_argument(
@@ -34,6 +40,22 @@ parser.add_argument(
     help="Dry run",
    action="store_true", required=False
 )
+parser.add_argument(
+    "--outformat",
+    help="format of the written table: csv (default) or parquet (columnar result store)",
+    choices=["csv", "parquet"],
+    default="csv"
+)
+parser.add_argument(
+    "--store",
+    help="root of the parquet result store, default is `result_store/` next to the system folders"
+)
+parser.add_argument(
+    "--append",
+    help="append to the parquet partition instead of replacing it",
+    action='store_true'
+)
+profiling.add_arguments(parser)
 
 def parse_output_to_df(output_str: str) -> pd.DataFrame:
     """
@@ -79,47 +101,53 @@ def read_metadata(metadata_path: str) -> dict:
         return json.load(f)
 
 
-def get_cmd_from_metadata(metadata: dict, outputs_path: str):
+def get_files_from_metadata(metadata: dict, outputs_path: str) -> list[str]:
     """
-    Constructs the command string to run the appropriate tabulate script with the list of output files
-    based on the metadata and outputs path.
-
-    Args:
-        metadata (dict): Metadata dictionary containing calc_type, distance_file, prefix, etc.
-        outputs_path (str): Path to the directory containing output files.
-        tabulate_script_path (str): Absolute path to tabulate_outs.py
-
-    Returns:
-        str: The command string to run, e.g.
-             'python /abs/path/tabulate_outs.py --xgouts file1.out file2.out ...'
+    Returns the output files in `outputs_path` for all distances in the metadata.
+    The folder is listed once; if a distance has several outputs, the latest
+    is used (with a warning).
     """
-
-    # Read distances
     distances_list = metadata['distances']
-
     file_ext = 'out' if metadata['calc_type'] == 'xg' else 'xml'
-    cmd_arg = '--xgouts' if metadata['calc_type'] == 'xg' else '--outs'
+    index = OutputIndex()
 
     files = []
     for d in distances_list:
         formatted_d = format(d, metadata['distance_format'])
         filename = metadata['prefix'].format(distance=formatted_d)
-        search_pattern = os.path.join(outputs_path, f"{filename}.*.{file_ext}")
-        matched_files = glob.glob(search_pattern)
-        if not matched_files:
-            print("Empty array")
-            print(matched_files)
+        # not os.path.splitext: the prefix itself contains dots (e.g. r_01.900)
+        inpfile = os.path.join(outputs_path, filename) + '.inp'
+        try:
+            files.append(index.latest(inpfile, file_ext))
+        except FileNotFoundError:
+            search_pattern = os.path.join(outputs_path, f"{filename}.*.{file_ext}")
             raise ValueError(f"No matches found for {search_pattern}")
-        files.extend(matched_files)
+    return files
+
+def get_cmd_from_metadata(metadata: dict, outputs_path: str):
+    """
+    Constructs the command string to run the appropriate tabulate script, and the
+    list of output files (based on the metadata and outputs path) to pass to it on stdin.
+    The files are NUL separated, so there is no limit on their number or names.
+
+    Args:
+        metadata (dict): Metadata dictionary containing calc_type, distance_file, prefix, etc.
+        outputs_path (str): Path to the directory containing output files.
+
+    Returns:
+        (str, str): The command string to run, e.g.
+             'python /abs/path/tabulate_outs.py --stdin xg -0'
+             and the input for its stdin.
+    """
+    files = get_files_from_metadata(metadata, outputs_path)
+    out_type = 'xg' if metadata['calc_type'] == 'xg' else 'std'
 
-    # Join all files as one space-separated string
     script_dir = os.path.dirname(os.path.abspath(__file__))
     tabulate_script = os.path.join(script_dir, "..", "tabulate_outs.py")
     tabulate_script = os.path.abspath(tabulate_script)  # Get absolute path
     
-    files_str = ' '.join(files)
-    cmd = f"python {tabulate_script} {cmd_arg} {files_str}"
-    return cmd
+    cmd = f"python {tabulate_script} --stdin {out_type} -0"
+    return cmd, '\0'.join(files)
 
 def get_default_output_fname(metadata, ext='csv', suffix='all'):
     fname = "{prefix}.{ext}".format(**metadata, ext=ext).format(distance = suffix)
@@ -131,15 +159,29 @@ def main(args):
     metadata = read_metadata(metadata_path)
     metadata_dir = os.path.dirname(os.path.abspath(metadata_path))
     
-    cmd = get_cmd_from_metadata(metadata, args.outputs_path,)
-    result = subprocess.run(
-        cmd,
-        shell=True,
-        executable="/bin/bash",
-        capture_output=True,
-        text=True,
-        check=True
-    )
+    cmd, files_input = get_cmd_from_metadata(metadata, args.outputs_path,)
+    trace = None
+    if profiling.is_enabled():
+        # the parsing happens in the subprocess: collect its stages as well
+        trace = tempfile.NamedTemporaryFile(suffix='.json', delete=False)
+        trace.close()
+        cmd += f" --profile json --profile-out {trace.name}"
+    try:
+        with profiling.stage('table.subprocess', label=cmd):
+            result = subprocess.run(
+                cmd,
+                input=files_input,
+                shell=True,
+                executable="/bin/bash",
+                capture_output=True,
+                text=True,
+                check=True
+            )
+        if trace is not None:
+            profiling.load_trace(trace.name, prefix='tabulate_outs:')
+    finally:
+        if trace is not None and os.path.exists(trace.name):
+            os.remove(trace.name)
    
     output_str = result.stdout
     df = parse_output_to_df(output_str)
@@ -156,9 +198,17 @@ def main(args):
         print(f"Dry-run, would write to `{fname}`:")
         print(df.to_string())
         return None
+    if args.outformat == 'parquet':
+        rs.write_store(
+            df, args.store or rs.default_store_path(metadata_path),
+            system=rs.system_from_metadata_path(metadata_path),
+            calc_type=metadata['calc_type'],
+            append=args.append
+        )
+        return None
     df.to_csv(fname, index=False)
     #print(df.to_csv(fname, index=False))
     
 if __name__ == "__main__":
     args = parser.parse_args()
-    main(args)
\ No newline at end of file
+    profiling.run(args, main, args)
\ No newline at end of file
@@ -0,0 +1,180 @@
+import os
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import profiling
+
+parser = argparse.ArgumentParser(
+    description="Compute interaction energies from tables written by `tabulate_outputs_and_folders.py`"
+)
+parser.add_argument(
+    "data_files", nargs="+",
+    help="One or more `data.csv` files, e.g. cu_nh3/xg/data.csv"
+)
+parser.add_argument(
+    "--unit", default="mH",
+    help="Energy unit of the results (a key of `hartree_to`), default mH"
+)
+parser.add_argument(
+    "--refdist", type=float, default=None,
+    help="Reference (monomer) distance. Default is the largest distance of each group, e.g. 9999.0"
+)
+parser.add_argument(
+    "--distance_col", default="distances",
+    help="Name of the distance column"
+)
+parser.add_argument(
+    "-o", "--outfile",
+    help="output file to write data to, default is `interaction.csv` in same folder as the first data file"
+)
+parser.add_argument(
+    "--print_only",
+    help="print output only",
+    action='store_true'
+)
+profiling.add_arguments(parser)
+
+#Energy Conversion Table
+hartree_to = {
+    'hartree' : 1,
+    'mH' : 10**3,
+    'eV' : 27.2107,
+    'cm-1': 219474.63,
+    'kcal/mol': 627.503,
+    'kJ/mol': 2625.5,
+    'K' : 315777,
+}
+
+def get_energy_columns(df: pd.DataFrame) -> list[str]:
+    """Columns holding energies, e.g. TOT_ENER or 'total energy'."""
+    return [col for col in df.columns if 'ENER' in col or 'nergy' in col]
+
+def get_group_columns(df: pd.DataFrame, exclude: list[str]) -> list[str]:
+    """Sweep parameter columns, i.e. everything except `exclude` and file columns."""
+    return [col for col in df.columns if col not in exclude and 'file' not in col]
+
+def interaction_energies(
+    df: pd.DataFrame,
+    unit: str = 'hartree',
+    refdist: float | None = None,
+    distance_col: str = 'distances',
+    energy_cols: list[str] | None = None,
+    group_cols: list[str] | None = None,
+) -> pd.DataFrame:
+    """
+    Compute interaction energies for every group of a tabulated sweep at once.
+
+    Rows are grouped by all parameter columns except the distance (e.g.
+    bases x gamma_set x GEM_BETA), and within each group the energy at the
+    reference distance is subtracted from every row. By default the reference
+    is the largest distance of the group, i.e. the 9999.0 "infinite distance"
+    row used as the monomer reference.
+
+    Arguments:
+        df : DataFrame as returned by `tabulate_outputs_and_folders.main`
+        unit : key of `hartree_to` to convert energies to
+        refdist : reference distance; the nearest distance in each group is used
+        distance_col : name of the distance column
+        energy_cols : energy columns, detected from their names by default
+        group_cols : columns defining a group, by default all remaining
+            parameter columns
+
+    Returns:
+        DataFrame with the group columns, distance, energies (in `unit`) and
+        one `Eint_<energy>` column per energy column.
+    """
+    if energy_cols is None:
+        energy_cols = get_energy_columns(df)
+    if group_cols is None:
+        group_cols = get_group_columns(df, [distance_col] + energy_cols)
+
+    out = df[group_cols + [distance_col]].reset_index(drop=True)
+    out[distance_col] = pd.to_numeric(out[distance_col])
+    energies = df[energy_cols].to_numpy(dtype=np.float64) * hartree_to[unit]
+
+    if refdist is None:
+        ref_score = -out[distance_col]
+    else:
+        # refdist doesn't have to exist in the distances, the nearest is used
+        ref_score = (out[distance_col] - refdist).abs()
+
+    if group_cols:
+        ref_idx = ref_score.groupby(
+            [out[col] for col in group_cols], sort=False, dropna=False
+        ).transform('idxmin').to_numpy()
+    else:
+        ref_idx = np.full(len(out), ref_score.idxmin())
+
+    eint = energies - energies[ref_idx]
+    for n, col in enumerate(energy_cols):
+        out[col] = energies[:, n]
+    for n, col in enumerate(energy_cols):
+        out[f"Eint_{col}"] = eint[:, n]
+    return out
+
+def fragment_interaction(
+    df_ab: pd.DataFrame,
+    df_a: pd.DataFrame,
+    df_b: pd.DataFrame,
+    on: list[str],
+    unit: str = 'hartree',
+    energy_cols: list[str] | None = None,
+) -> pd.DataFrame:
+    """
+    Compute Eint = E(AB) - E(A) - E(B) for every row of `df_ab`.
+
+    Fragment energies are matched to the dimer rows on the columns `on`
+    (e.g. ['bases', 'GEM_BETA']) with a single merge. If `df_a` and `df_b` were
+    computed in the full dimer basis (ghost atoms), this is the
+    counterpoise-corrected interaction energy.
+    """
+    if energy_cols is None:
+        energy_cols = get_energy_columns(df_ab)
+
+    fragments = df_a[on + energy_cols].merge(
+        df_b[on + energy_cols], on=on, how='inner', suffixes=('_A', '_B')
+    )
+    merged = df_ab.merge(fragments, on=on, how='inner')
+
+    conv_fac = hartree_to[unit]
+    for col in energy_cols:
+        e_ab = merged[col].to_numpy(dtype=np.float64)
+        e_a = merged[f"{col}_A"].to_numpy(dtype=np.float64)
+        e_b = merged[f"{col}_B"].to_numpy(dtype=np.float64)
+        merged[f"Eint_{col}"] = conv_fac * (e_ab - e_a - e_b)
+    return merged
+
+def write_incremental(df: pd.DataFrame, outfile: str, first: bool) -> None:
+    """Write `df` to `outfile`, appending (without header) unless `first`."""
+    df.to_csv(outfile, mode='w' if first else 'a', header=first, index=False)
+
+def main(args):
+    if args.outfile:
+        outfile = args.outfile
+    else:
+        outfile = os.path.join(os.path.dirname(args.data_files[0]), 'interaction.csv')
+
+    columns = None
+    for n, data_file in enumerate(args.data_files):
+        df = pd.read_csv(data_file, skipinitialspace=True)
+        eint = interaction_energies(
+            df, unit=args.unit, refdist=args.refdist, distance_col=args.distance_col
+        )
+        eint.insert(0, 'source', data_file)
+        if args.print_only:
+            print(eint.to_string())
+            continue
+        if columns is None:
+            columns = list(eint.columns)
+        elif list(eint.columns) != columns:
+            raise ValueError(
+                f"{data_file} has columns {list(eint.columns)}, expected {columns}"
+            )
+        write_incremental(eint, outfile, first=(n == 0))
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    profiling.run(args, main, args)
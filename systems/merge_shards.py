@@ -0,0 +1,210 @@
+'''
+Merge the per-shard tables written by
+
+    python tabulate_outputs_and_folders.py metadata.json --shard i/N
+
+(`data.shard-<i>-of-<N>.csv`) into the usual `data.csv`, checking that no
+shard file is missing, no input appears twice and every input of the
+sweep is present.
+
+Shards written with `--outformat parquet` already add up to one partition of
+the result store; `--outformat parquet` checks that partition the same way.
+'''
+import os
+import re
+import sys
+import glob
+import argparse
+from argparse import Namespace
+
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from systems import generate_inputs_and_folders as giaf
+from systems import result_store as rs
+import profiling
+
+parser = argparse.ArgumentParser(
+    description="Merge per-shard tables of tabulate_outputs_and_folders.py --shard into one table"
+)
+parser.add_argument(
+    "metadata_path",
+    help="Path to metadata"
+)
+parser.add_argument(
+    "shard_files", nargs="*",
+    help="shard tables, default data.shard-*-of-*.csv in the folder of metadata_path"
+)
+parser.add_argument(
+    "-o", "--outfile",
+    help="output file, default is `data.csv` in same folder as metadata_path"
+)
+parser.add_argument(
+    "--allow-missing",
+    help="write the table even if inputs or shard files are missing (they are still reported)",
+    action="store_true"
+)
+parser.add_argument(
+    "--drop-duplicates",
+    help="keep the first of duplicated inputs instead of failing",
+    action="store_true"
+)
+parser.add_argument(
+    "--print_only",
+    help="print the merged table instead of writing it",
+    action="store_true"
+)
+parser.add_argument(
+    "--outformat",
+    help="format the shards were written in: csv (default) or parquet, whose result store partition "
+         "is only checked (nothing is written)",
+    choices=["csv", "parquet"],
+    default="csv"
+)
+parser.add_argument(
+    "--store",
+    help="root of the parquet result store, default is `result_store/` next to the system folders"
+)
+profiling.add_arguments(parser)
+
+SHARD_REGEX = re.compile(r"\.shard-(\d+)-of-(\d+)\.csv$")
+
+def find_shard_files(folder):
+    return sorted(glob.glob(os.path.join(folder, "data.shard-*-of-*.csv")))
+
+def missing_shards(files=(), shards=None):
+    """
+    Shard indices missing from `files` (named `*.shard-<i>-of-<N>.csv`), or
+    from the (i, N) `shards` if given (None entries are ignored).
+    Raises ValueError if the files come from different N.
+    """
+    if shards is None:
+        shards = [tuple(int(x) for x in m.groups()) for m in map(SHARD_REGEX.search, files) if m]
+    shards = [shard for shard in shards if shard is not None]
+    counts = {n for _, n in shards}
+    if len(counts) > 1:
+        raise ValueError(f"Shard files of different shard counts: {sorted(counts)}")
+    if not counts:
+        return []
+    n = counts.pop()
+    return sorted(set(range(n)) - {i for i, _ in shards})
+
+def expected_params(meta, metadata_path):
+    """Parameter names and the list of parameter tuples of all inputs, in sweep order."""
+    args_ns = Namespace(metadata_path=metadata_path, dry_run=False, output=None)
+    keys = list(giaf.get_iterables(meta, batched=False))
+    params = [
+        tuple(kwargs[key] for key in keys)
+        for _, _, _, kwargs in giaf.generate_file_paths(args_ns, meta)
+    ]
+    return keys, params
+
+def read_shards(files, keys):
+    """Concatenate the shard tables, reading the parameter columns as formatted strings."""
+    tables = []
+    for f in files:
+        try:
+            tables.append(pd.read_csv(f, dtype={key: str for key in keys}))
+        except pd.errors.EmptyDataError:
+            # shard without inputs
+            continue
+    if not tables:
+        return pd.DataFrame(columns=keys)
+    return pd.concat(tables, ignore_index=True)
+
+def row_keys(df, meta, keys):
+    """Columns identifying a row: the parameters plus the batched parameters and `jobstep` if present."""
+    return keys + [
+        col for col in list(giaf.get_iterables(meta, batched=True)) + ["jobstep"]
+        if col in df.columns
+    ]
+
+def merge(df, meta, keys, params):
+    """
+    Returns (merged, duplicates, missing): the table sorted in sweep order,
+    the rows of inputs present more than once and the parameter tuples of
+    inputs not present at all (see `row_keys`).
+    """
+    duplicates = df[df.duplicated(row_keys(df, meta, keys), keep=False)]
+
+    present = set(df[keys].itertuples(index=False, name=None))
+    missing = [p for p in params if p not in present]
+
+    order = {p: n for n, p in enumerate(params)}
+    position = [order.get(p, len(order)) for p in df[keys].itertuples(index=False, name=None)]
+    merged = df.assign(_order=position).sort_values("_order", kind="stable").drop(columns="_order")
+    return merged.reset_index(drop=True), duplicates, missing
+
+def read_partition(args, meta, keys):
+    """
+    The result store partition of the sweep, with the parameter columns as
+    strings, and the (i, N) shard of each of its files (see `rs.partition_shards`).
+    """
+    root = args.store or rs.default_store_path(args.metadata_path)
+    system = rs.system_from_metadata_path(args.metadata_path)
+    shards = rs.partition_shards(root, system, meta['calc_type'])
+    if not shards:
+        raise FileNotFoundError(f"No parquet files in '{rs.partition_path(root, system, meta['calc_type'])}'")
+    df = rs.read_store(root, system=system, calc_type=meta['calc_type'])
+    absent = [key for key in keys if key not in df]
+    if absent:
+        raise ValueError(f"Parameter columns {absent} are not in the partition of {system}/{meta['calc_type']}")
+    df = df.drop(columns=rs.PARTITION_COLS).astype({key: str for key in keys})
+    return df, shards
+
+def main(args):
+    meta = giaf.read_metadata(args.metadata_path)
+    folder = os.path.dirname(args.metadata_path)
+    keys, params = expected_params(meta, args.metadata_path)
+    if args.outformat == 'parquet':
+        table, shards = read_partition(args, meta, keys)
+        files = [shard for shard in shards if shard]
+        lost_shards = missing_shards(shards=shards)
+    else:
+        files = args.shard_files or find_shard_files(folder)
+        if not files:
+            raise FileNotFoundError(f"No shard tables found in '{folder or '.'}'")
+        lost_shards = missing_shards(files)
+        table = read_shards(files, keys)
+
+    problems = False
+    if lost_shards:
+        print(f"❌ Missing shard files for shards {lost_shards}")
+        problems = True
+
+    df, duplicates, missing = merge(table, meta, keys, params)
+
+    if len(duplicates):
+        print(f"❌ {len(duplicates)} rows of duplicated inputs:")
+        print(duplicates.to_string())
+        if args.drop_duplicates:
+            df = df.drop_duplicates(row_keys(df, meta, keys), ignore_index=True)
+        else:
+            return 1
+    if missing:
+        print(f"❌ {len(missing)} of {len(params)} inputs missing:")
+        for p in missing:
+            print("   " + ", ".join(f"{k}={v}" for k, v in zip(keys, p)))
+        problems = True
+
+    if args.outformat == 'parquet' and not args.print_only:
+        # the shards already are the partition, there is nothing to write
+        if not problems:
+            print(f"✅ Partition complete: {len(df)} rows from {len(files)} shard files")
+        return int(problems)
+
+    if problems and not args.allow_missing:
+        print("Not writing the merged table (use --allow-missing to write it anyway)")
+        return 1
+
+    if args.print_only:
+        print(df.to_string())
+        return 0
+    outfile = args.outfile or os.path.join(folder, "data.csv")
+    df.to_csv(outfile, index=False)
+    print(f"Merged {len(files)} shard tables ({len(df)} rows) into {outfile}")
+    return 0
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    sys.exit(profiling.run(args, main, args))
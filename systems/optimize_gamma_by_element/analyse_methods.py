@@ -1,6 +1,14 @@
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 import pandas as pd
 
+TABLE_FNAME_REGEX = re.compile(
+    r"^table_(?P<atom>[A-Za-z]+)_(?P<charge>[+-]?\d+)_(?P<basis>.+)\.csv$"
+)
+
 def get_evsgamma(atom, basis, charge=0, names=None):
     fname = f"outputs/table_{atom}_{charge}_{basis}.csv"
     try:
@@ -36,6 +44,100 @@ def min_gamma_for_cols(df: pd.DataFrame, cols: list[str] | None = None) -> pd.Se
     """
     if cols is None:
         cols = df.columns[1:]  # everything except the first column
-        
+
     min_indices = df[cols].idxmin()
-    return pd.Series({col: df.loc[min_indices[col], "GEM_BETA"] for col in cols})
\ No newline at end of file
+    return pd.Series({col: df.loc[min_indices[col], "GEM_BETA"] for col in cols})
+
+def _read_table(fname: str, names=None) -> pd.DataFrame:
+    return pd.read_csv(fname, names=names, skipinitialspace=True)
+
+def read_all_tables(folder: str = './outputs/', names=None, max_workers: int | None = None) -> pd.DataFrame:
+    """
+    Read every `table_{atom}_{charge}_{basis}.csv` in `folder` into one
+    long-format DataFrame with columns atom, charge, basis, GEM_BETA, E, ...
+
+    Files are read concurrently with a thread pool, and atom/charge/basis
+    are parsed from the file names with `TABLE_FNAME_REGEX`. Files that do
+    not match the naming scheme are ignored.
+    """
+    keys = []
+    fnames = []
+    for f in sorted(os.listdir(folder)):
+        match = TABLE_FNAME_REGEX.match(f)
+        if match is None: continue
+        keys.append(match.groupdict())
+        fnames.append(os.path.join(folder, f))
+
+    if not fnames:
+        raise FileNotFoundError(f"No table_{{atom}}_{{charge}}_{{basis}}.csv files found in {folder}")
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        tables = list(pool.map(lambda f: _read_table(f, names=names), fnames))
+
+    lengths = np.array([len(t) for t in tables])
+    data = pd.concat(tables, ignore_index=True)
+    data.insert(0, 'basis', np.repeat([k['basis'] for k in keys], lengths))
+    data.insert(0, 'charge', np.repeat([int(k['charge']) for k in keys], lengths))
+    data.insert(0, 'atom', np.repeat([k['atom'].lower() for k in keys], lengths))
+    return data
+
+def optimal_gammas(
+    data: pd.DataFrame,
+    energy_col: str = 'E',
+    gamma_col: str = 'GEM_BETA',
+    group_cols: list[str] | None = None,
+) -> pd.DataFrame:
+    """
+    Find the optimal gamma for every group in `data` (as returned by
+    `read_all_tables`) in a single groupby pass.
+
+    The grid minimum is refined by fitting a parabola through it and its two
+    neighbours. Minima at the edge of the gamma grid are not interpolated and
+    are flagged in the `at_edge` column.
+
+    Returns a DataFrame indexed by `group_cols` with columns
+    gamma_grid, E_grid, gamma_opt, E_opt, at_edge.
+    """
+    if group_cols is None:
+        group_cols = ['atom', 'charge', 'basis']
+
+    data = data.dropna(subset=[energy_col]).sort_values(group_cols + [gamma_col])
+    data = data.reset_index(drop=True)
+    groups = data.groupby(group_cols, sort=True)
+
+    gid = groups.ngroup().to_numpy()
+    x = data[gamma_col].to_numpy(dtype=float)
+    y = data[energy_col].to_numpy(dtype=float)
+
+    imin = groups[energy_col].idxmin().to_numpy()
+    ileft = np.maximum(imin - 1, 0)
+    iright = np.minimum(imin + 1, len(data) - 1)
+    interior = (gid[ileft] == gid[imin]) & (gid[iright] == gid[imin]) \
+        & (ileft != imin) & (iright != imin)
+
+    x0, x1, x2 = x[ileft], x[imin], x[iright]
+    y0, y1, y2 = y[ileft], y[imin], y[iright]
+    num = (x1 - x0)**2 * (y1 - y2) - (x1 - x2)**2 * (y1 - y0)
+    den = (x1 - x0) * (y1 - y2) - (x1 - x2) * (y1 - y0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_opt = x1 - 0.5 * num / den
+    interior &= np.isfinite(x_opt)
+    x_opt = np.where(interior, x_opt, x1)
+
+    # Evaluate the parabola at its vertex (Lagrange form)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        y_opt = (
+            y0 * (x_opt - x1) * (x_opt - x2) / ((x0 - x1) * (x0 - x2))
+            + y1 * (x_opt - x0) * (x_opt - x2) / ((x1 - x0) * (x1 - x2))
+            + y2 * (x_opt - x0) * (x_opt - x1) / ((x2 - x0) * (x2 - x1))
+        )
+    y_opt = np.where(interior, y_opt, y1)
+
+    index = groups[energy_col].idxmin().index
+    return pd.DataFrame({
+        'gamma_grid': x1,
+        'E_grid': y1,
+        'gamma_opt': x_opt,
+        'E_opt': y_opt,
+        'at_edge': ~interior,
+    }, index=index)
@@ -0,0 +1,101 @@
+'''
+Resolve inputs to their outputs with one directory listing per folder.
+
+Molpro outputs of `path/to/name.inp` are `path/to/name.<n>.out` (or
+`.xml`). Instead of a glob (a full listing of the folder) per input, each
+folder is listed once with `os.scandir`, and its outputs are grouped by
+prefix (`name`) and sorted by modification time:
+
+    index = OutputIndex()
+    outfile = index.latest('path/to/name.inp', ext='out')
+    outfiles = index.matches('path/to/name', ext='out')
+'''
+import os
+import warnings
+
+def output_prefix(filename, ext):
+    """'name.1.out' -> 'name' for ext 'out', None if the file is not such an output."""
+    suffix = '.' + ext
+    if not filename.endswith(suffix):
+        return None
+    stem = filename[:-len(suffix)]
+    if '.' not in stem:
+        return None
+    return stem.rsplit('.', 1)[0]
+
+def scan_folder(folder, ext):
+    """
+    Map prefix -> [(mtime, path), ...] (oldest first) of the outputs with
+    extension `ext` in `folder`. A missing folder gives an empty map.
+    """
+    prefixes = {}
+    try:
+        entries = os.scandir(folder or '.')
+    except FileNotFoundError:
+        return prefixes
+    with entries:
+        for entry in entries:
+            prefix = output_prefix(entry.name, ext)
+            if prefix is None:
+                continue
+            try:
+                if not entry.is_file():
+                    continue
+                mtime = entry.stat().st_mtime
+            except OSError:
+                # removed while listing
+                continue
+            # joined like glob does, so relative folders give relative paths
+            prefixes.setdefault(prefix, []).append((mtime, os.path.join(folder, entry.name)))
+    for outputs in prefixes.values():
+        outputs.sort()
+    return prefixes
+
+class OutputIndex:
+    """
+    Outputs of the folders looked up so far, each folder scanned once.
+    Call `refresh()` to pick up new outputs (e.g. once per poll).
+    """
+    def __init__(self):
+        self._folders = {}
+        self._mtimes = {}
+
+    def refresh(self):
+        self._folders.clear()
+        self._mtimes.clear()
+
+    def _outputs(self, base, ext):
+        folder, prefix = os.path.split(base)
+        key = (os.path.abspath(folder or '.'), ext)
+        if key not in self._folders:
+            self._folders[key] = scan_folder(folder, ext)
+            for outputs in self._folders[key].values():
+                self._mtimes.update((path, mtime) for mtime, path in outputs)
+        return self._folders[key].get(prefix, [])
+
+    def matches(self, base, ext):
+        """Paths of all outputs `<base>.*.<ext>`, oldest first. `base` has no extension."""
+        return [path for _, path in self._outputs(base, ext)]
+
+    def getmtime(self, path):
+        """Modification time of `path`, from the listing if it was indexed."""
+        if path in self._mtimes:
+            return self._mtimes[path]
+        return os.path.getmtime(path)
+
+    def latest(self, infile, ext):
+        """
+        The latest output of `infile`. If there are several, warns and
+        returns the latest one. Raises FileNotFoundError if there is none.
+        """
+        base, _ = os.path.splitext(infile)
+        matches = self.matches(base, ext)
+        if not matches:
+            raise FileNotFoundError(f"No matching output files found for pattern: {base}.*.{ext}")
+        if len(matches) > 1:
+            warnings.warn(
+                f"Multiple output files found for {infile}:\n"
+                + "\n".join(matches)
+                + f"\nUsing latest: {matches[-1]}"
+            )
+        return matches[-1]
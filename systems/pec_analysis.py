@@ -0,0 +1,283 @@
+'''
+Equilibrium distance Re, well depth De and curvature of every potential
+energy curve of one or more tabulated sweeps.
+
+Interaction energies (see `interaction.py`) of every group (e.g. source x
+bases x gamma_set x energy column) are interpolated by natural cubic
+splines, and the minimum is located analytically on every spline interval.
+All groups with the same distances are solved together, with one linear
+solve for the spline coefficients of all of them. From the curvature
+k = E''(Re), the Morse parameter a = sqrt(k / 2De) is reported, and with
+--morse a least-squares Morse fit of all groups at once, started from it.
+
+The two Morse a differ: `morse_a` only uses the spline curvature at the
+minimum, which a natural spline through a coarse grid gets wrong (with
+distance steps of 0.5/a or more, k can be off by a factor of 2-4 from
+2 De a^2 of the curve, a by up to 2). `morse_a_fit` fits all points and
+is the one to use:
+
+    python pec_analysis.py cu_nh3/xg/data.csv cu_nh3/standard/data.csv --unit kcal/mol --morse
+'''
+import os
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from systems.interaction import interaction_energies, get_energy_columns, get_group_columns
+import profiling
+
+parser = argparse.ArgumentParser(
+    description="Re, De and curvature of every potential energy curve in tables written by `tabulate_outputs_and_folders.py`"
+)
+parser.add_argument(
+    "data_files", nargs="+",
+    help="One or more `data.csv` files, e.g. cu_nh3/xg/data.csv"
+)
+parser.add_argument(
+    "--unit", default="mH",
+    help="Energy unit of the results (a key of `interaction.hartree_to`), default mH"
+)
+parser.add_argument(
+    "--refdist", type=float, default=None,
+    help="Reference (monomer) distance. Default is the largest distance of each group, e.g. 9999.0"
+)
+parser.add_argument(
+    "--max-distance", type=float, default=100.0,
+    help="Distances above this (e.g. the 9999.0 reference) are not part of the curves, default 100"
+)
+parser.add_argument(
+    "--distance_col", default="distances",
+    help="Name of the distance column"
+)
+parser.add_argument(
+    "--morse", action="store_true",
+    help="Also fit Morse curves De [(1 - exp(-a (r - Re)))^2 - 1] by least squares"
+)
+parser.add_argument(
+    "-o", "--outfile",
+    help="output file to write data to, default is `pec.csv` in same folder as the first data file"
+)
+parser.add_argument(
+    "--print_only",
+    help="print output only",
+    action='store_true'
+)
+profiling.add_arguments(parser)
+
+def natural_spline_coefficients(x: np.ndarray, y: np.ndarray) -> tuple[np.ndarray, ...]:
+    """
+    Natural cubic splines through (x, y[g]) for all curves g at once.
+
+    Arguments:
+        x : (n,) increasing distances, shared by all curves
+        y : (G, n) energies
+
+    Returns:
+        a, b, c, d : (G, n-1) coefficients of
+            S(x) = a + b t + c t^2 + d t^3, t = x - x[i] on [x[i], x[i+1]]
+    """
+    n = len(x)
+    h = np.diff(x)
+    slopes = np.diff(y, axis=1) / h
+
+    # second derivatives M, with M[0] = M[n-1] = 0
+    M = np.zeros_like(y)
+    if n > 2:
+        A = np.zeros((n - 2, n - 2))
+        i = np.arange(n - 2)
+        A[i, i] = 2 * (h[:-1] + h[1:])
+        A[i[1:], i[:-1]] = h[1:-1]
+        A[i[:-1], i[1:]] = h[1:-1]
+        rhs = 6 * np.diff(slopes, axis=1)
+        M[:, 1:-1] = np.linalg.solve(A, rhs.T).T
+
+    a = y[:, :-1]
+    b = slopes - h * (2 * M[:, :-1] + M[:, 1:]) / 6
+    c = M[:, :-1] / 2
+    d = np.diff(M, axis=1) / (6 * h)
+    return a, b, c, d
+
+def spline_minima(x: np.ndarray, y: np.ndarray) -> dict[str, np.ndarray]:
+    """
+    Lowest local minimum of the natural cubic spline of every curve, from
+    the roots of S'(t) = b + 2c t + 3d t^2 on every interval.
+
+    Returns a dict of (G,) arrays Re, Emin and k = S''(Re), NaN for curves
+    without a minimum inside the distance range (e.g. purely repulsive).
+    """
+    a, b, c, d = natural_spline_coefficients(x, y)
+    h = np.diff(x)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        disc = np.sqrt(4 * c**2 - 12 * d * b)
+        cubic = np.abs(d) * h > 1e-12 * (np.abs(c) + np.abs(b) / h)
+        roots = np.stack([
+            np.where(cubic, (-2 * c + disc) / (6 * d), -b / (2 * c)),
+            np.where(cubic, (-2 * c - disc) / (6 * d), np.nan),
+        ])
+        curvature = 2 * c + 6 * d * roots
+        energy = a + b * roots + c * roots**2 + d * roots**3
+    valid = (roots >= 0) & (roots <= h) & (curvature > 0)
+    energy = np.where(valid, energy, np.inf)
+
+    # (2, G, n-1) -> best of every curve
+    flat = energy.transpose(1, 0, 2).reshape(len(y), -1)
+    best = np.argmin(flat, axis=1)
+    found = np.isfinite(flat[np.arange(len(y)), best])
+    root, interval = np.divmod(best, len(h))
+    g = np.arange(len(y))
+    return dict(
+        Re=np.where(found, x[interval] + roots[root, g, interval], np.nan),
+        Emin=np.where(found, energy[root, g, interval], np.nan),
+        k=np.where(found, curvature[root, g, interval], np.nan),
+    )
+
+def morse(x: np.ndarray, De: np.ndarray, a: np.ndarray, Re: np.ndarray) -> np.ndarray:
+    """Morse curves De [(1 - exp(-a (x - Re)))^2 - 1], (G,) parameters -> (G, n)."""
+    e = np.exp(-a[:, None] * (x - Re[:, None]))
+    return De[:, None] * ((1 - e)**2 - 1)
+
+def fit_morse(x, y, De, a, Re, iterations=50, tol=1e-12):
+    """
+    Least-squares Morse fit of all curves at once (Levenberg-Marquardt,
+    one batched 3x3 solve per iteration), started from (De, a, Re).
+
+    Returns (De, a, Re, rms) arrays of shape (G,).
+    """
+    params = np.stack([De, a, Re], axis=1).astype(np.float64)
+    lam = np.full(len(y), 1e-3)
+
+    def residuals(p):
+        return morse(x, p[:, 0], p[:, 1], p[:, 2]) - y
+
+    cost = np.sum(residuals(params)**2, axis=1)
+    for _ in range(iterations):
+        De_, a_, Re_ = params.T
+        dx = x - Re_[:, None]
+        e = np.exp(-a_[:, None] * dx)
+        jac = np.stack([
+            (1 - e)**2 - 1,
+            2 * De_[:, None] * (1 - e) * e * dx,
+            -2 * De_[:, None] * (1 - e) * e * a_[:, None],
+        ], axis=2)
+        r = residuals(params)
+        jtj = np.einsum('gni,gnj->gij', jac, jac)
+        jtr = np.einsum('gni,gn->gi', jac, r)
+        damped = jtj + lam[:, None, None] * np.eye(3) * np.diagonal(jtj, axis1=1, axis2=2)[:, :, None]
+        step = np.linalg.solve(damped, -jtr[:, :, None])[:, :, 0]
+
+        trial = params + step
+        trial_cost = np.sum(residuals(trial)**2, axis=1)
+        better = trial_cost < cost
+        converged = better & (cost - trial_cost <= tol * cost)
+        params = np.where(better[:, None], trial, params)
+        cost = np.where(better, trial_cost, cost)
+        lam = np.where(better, lam / 10, lam * 10)
+        if converged.all():
+            break
+
+    return params[:, 0], params[:, 1], params[:, 2], np.sqrt(cost / len(x))
+
+def pec_table(
+    df: pd.DataFrame,
+    unit: str = 'mH',
+    refdist: float | None = None,
+    max_distance: float = 100.0,
+    distance_col: str = 'distances',
+    morse_fit: bool = False,
+) -> pd.DataFrame:
+    """
+    Re, De (= -E(Re)), curvature k and Morse a of the interaction energy
+    curve of every group and energy column of a tabulated sweep.
+
+    Curves are grouped as in `interaction_energies`, plus one curve per
+    energy column. Curves with the same distances (after dropping those
+    above `max_distance` and missing energies) are solved together.
+
+    Returns:
+        DataFrame with the group columns, `energy` (the energy column),
+        npoints, Re, De, k, morse_a and, with `morse_fit`, morse_De,
+        morse_Re, morse_a_fit and morse_rms. Energies are in `unit`.
+        morse_a = sqrt(k / 2De) is only as good as the spline curvature
+        (see the module docstring), morse_a_fit is the least-squares one.
+    """
+    energy_cols = get_energy_columns(df)
+    group_cols = get_group_columns(df, [distance_col] + energy_cols)
+    eint = interaction_energies(
+        df, unit=unit, refdist=refdist, distance_col=distance_col,
+        energy_cols=energy_cols, group_cols=group_cols,
+    )
+    eint = eint[eint[distance_col] <= max_distance]
+
+    long = eint.melt(
+        id_vars=group_cols + [distance_col],
+        value_vars=[f"Eint_{col}" for col in energy_cols],
+        var_name='energy', value_name='Eint',
+    )
+    long['energy'] = long['energy'].str.removeprefix('Eint_')
+    curve_cols = group_cols + ['energy']
+    wide = long.pivot_table(
+        index=curve_cols, columns=distance_col, values='Eint', aggfunc='first', dropna=False
+    )
+    wide = wide.dropna(how='all')
+    x_all = wide.columns.to_numpy(dtype=np.float64)
+    y_all = wide.to_numpy(dtype=np.float64)
+
+    columns = ['npoints', 'Re', 'De', 'k', 'morse_a']
+    if morse_fit:
+        columns += ['morse_De', 'morse_Re', 'morse_a_fit', 'morse_rms']
+    result = pd.DataFrame(np.nan, index=wide.index, columns=columns)
+
+    # curves with the same distances are solved together
+    masks, inverse = np.unique(~np.isnan(y_all), axis=0, return_inverse=True)
+    for n, mask in enumerate(masks):
+        rows = np.flatnonzero(inverse.ravel() == n)
+        x, y = x_all[mask], y_all[np.ix_(rows, mask)]
+        result.iloc[rows, 0] = len(x)
+        if len(x) < 3:
+            continue
+        minima = spline_minima(x, y)
+        De = -minima['Emin']
+        with np.errstate(invalid='ignore'):
+            a = np.sqrt(minima['k'] / (2 * De))
+        result.iloc[rows, 1:5] = np.column_stack([minima['Re'], De, minima['k'], a])
+
+        if morse_fit:
+            ok = np.isfinite(a) & (De > 0)
+            if ok.any() and len(x) > 3:
+                fit = fit_morse(x, y[ok], De[ok], a[ok], minima['Re'][ok])
+                result.iloc[rows[ok], 5:9] = np.column_stack([fit[0], fit[2], fit[1], fit[3]])
+
+    result['npoints'] = result['npoints'].astype(int)
+    return result.reset_index()
+
+def main(args):
+    if args.outfile:
+        outfile = args.outfile
+    else:
+        outfile = os.path.join(os.path.dirname(args.data_files[0]), 'pec.csv')
+
+    tables = []
+    for data_file in args.data_files:
+        df = pd.read_csv(data_file, skipinitialspace=True)
+        df.insert(0, 'source', data_file)
+        tables.append(df)
+    # columns missing in some tables (e.g. gamma_set for standard) become NaN groups
+    df = pd.concat(tables, ignore_index=True)
+
+    pec = pec_table(
+        df, unit=args.unit, refdist=args.refdist, max_distance=args.max_distance,
+        distance_col=args.distance_col, morse_fit=args.morse,
+    )
+    if args.print_only:
+        print(pec.to_string())
+        return pec
+    pec.to_csv(outfile, index=False)
+    print(f"Wrote {len(pec)} curves to {outfile}")
+    return pec
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    profiling.run(args, main, args)
@@ -0,0 +1,154 @@
+"""
+Columnar (Parquet) store for tabulated sweep data.
+
+The store is a directory of Parquet files partitioned by system and calc_type
+(hive style, e.g. `<root>/system=cu_nh3/calc_type=xg/part-<id>-0.parquet`).
+Parameter columns (bases, gamma_set, outfile, ...) are dictionary encoded and
+energy columns are stored as float64, so readers can load just the columns
+and partitions they need.
+
+A sweep tabulated in N shards writes one set of files per shard into the
+same partition (`shard-<i>-of-<N>-<id>-0.parquet`), so the shards do not
+replace each other's rows.
+
+Requires `pyarrow`, which is only imported when the store is used.
+"""
+import os
+import re
+import glob
+import uuid
+import pandas as pd
+
+PARTITION_COLS = ['system', 'calc_type']
+SHARD_REGEX = re.compile(r'^shard-(\d+)-of-(\d+)-')
+
+def _import_pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+    except ImportError as e:
+        raise ImportError(
+            "The columnar result store requires `pyarrow` (pip install pyarrow)"
+        ) from e
+    return pa, ds
+
+def default_store_path(metadata_path: str) -> str:
+    """`result_store/` next to the system folders, e.g. systems/result_store"""
+    system_dir = os.path.dirname(os.path.dirname(os.path.abspath(metadata_path)))
+    return os.path.join(os.path.dirname(system_dir), 'result_store')
+
+def system_from_metadata_path(metadata_path: str) -> str:
+    """Name of the system folder, e.g. 'cu_nh3' for cu_nh3/xg/metadata.json"""
+    return os.path.basename(os.path.dirname(os.path.dirname(os.path.abspath(metadata_path))))
+
+def partition_path(root: str, system: str, calc_type: str) -> str:
+    return os.path.join(root, f'system={system}', f'calc_type={calc_type}')
+
+def partition_shards(root: str, system: str, calc_type: str) -> list[tuple[int, int] | None]:
+    """(i, N) of the shard that wrote each file of a partition, None for unsharded writes."""
+    shards = []
+    for path in sorted(glob.glob(os.path.join(partition_path(root, system, calc_type), '*.parquet'))):
+        m = SHARD_REGEX.match(os.path.basename(path))
+        shards.append(tuple(int(x) for x in m.groups()) if m else None)
+    return shards
+
+def _remove_replaced(root: str, system: str, calc_type: str, shard: tuple[int, int]) -> None:
+    """Files of a partition replaced by a write of `shard`: its own and all not written by a shard of the same N."""
+    for path in glob.glob(os.path.join(partition_path(root, system, calc_type), '*.parquet')):
+        m = SHARD_REGEX.match(os.path.basename(path))
+        if not m or int(m.group(2)) != shard[1] or int(m.group(1)) == shard[0]:
+            os.remove(path)
+
+def to_columnar(df: pd.DataFrame, energy_cols: list[str] | None = None) -> pd.DataFrame:
+    """
+    Cast energy columns to float64 and all other text columns to categoricals,
+    which pyarrow writes as dictionary-encoded columns.
+    """
+    if energy_cols is None:
+        energy_cols = [col for col in df.columns if 'ENER' in col or 'nergy' in col]
+    df = df.copy()
+    for col in df.columns:
+        if col in energy_cols:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype('float64')
+        elif df[col].dtype == object or pd.api.types.is_string_dtype(df[col]):
+            df[col] = df[col].astype('category')
+    return df
+
+def write_store(
+    df: pd.DataFrame,
+    root: str,
+    system: str,
+    calc_type: str,
+    append: bool = False,
+    shard: tuple[int, int] | None = None,
+) -> None:
+    """
+    Write `df` into the `system`/`calc_type` partition of the store at `root`.
+
+    By default the partition is replaced, so re-tabulating a sweep does not
+    duplicate rows. With `append` a new file is added to the partition and
+    existing files are kept, for incremental results from new runs.
+
+    With `shard` (i, N), `df` is the i-th of N shards of the sweep and only
+    replaces the files of that shard (and those not written by any shard of
+    N), so the shards of one sweep add up to the whole partition.
+    """
+    pa, ds = _import_pyarrow()
+    df = to_columnar(df.drop(columns=PARTITION_COLS, errors='ignore'))
+    df = df.assign(system=system, calc_type=calc_type)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    # Use the same index width in every file, so partitions can be read together
+    schema = pa.schema([
+        field.with_type(pa.dictionary(pa.int32(), field.type.value_type))
+        if pa.types.is_dictionary(field.type) else field
+        for field in table.schema
+    ])
+    table = table.cast(schema)
+    prefix = 'part'
+    if shard is not None:
+        prefix = 'shard-{}-of-{}'.format(*shard)
+        if not append:
+            _remove_replaced(root, system, calc_type, shard)
+            append = True
+    ds.write_dataset(
+        table, root,
+        format='parquet',
+        partitioning=PARTITION_COLS,
+        partitioning_flavor='hive',
+        basename_template=f"{prefix}-{uuid.uuid4().hex}-{{i}}.parquet",
+        existing_data_behavior='overwrite_or_ignore' if append else 'delete_matching',
+    )
+
+def read_store(
+    root: str,
+    columns: list[str] | None = None,
+    system: str | list[str] | None = None,
+    calc_type: str | list[str] | None = None,
+) -> pd.DataFrame:
+    """
+    Read `columns` (all by default) of the store at `root`, optionally only
+    from the given systems and calc_types. Partitions that do not match are
+    never opened. Partitions may have different columns (e.g. gamma_set only
+    for xg), the result has the union of those of the matching partitions.
+    """
+    pa, ds = _import_pyarrow()
+    dataset = ds.dataset(root, format='parquet', partitioning='hive')
+
+    expr = None
+    for name, value in (('system', system), ('calc_type', calc_type)):
+        if value is None:
+            continue
+        values = [value] if isinstance(value, str) else list(value)
+        cond = ds.field(name).isin(values)
+        expr = cond if expr is None else expr & cond
+
+    # the dataset schema is that of the first file only
+    schemas = [fragment.physical_schema for fragment in dataset.get_fragments(filter=expr)]
+    if schemas:
+        schema = pa.unify_schemas(schemas, promote_options='permissive')
+        partitions = [field for field in dataset.schema if field.name in PARTITION_COLS]
+        schema = pa.schema(list(schema) + [f for f in partitions if f.name not in schema.names])
+        dataset = ds.dataset(root, schema=schema, format='parquet', partitioning='hive')
+
+    table = dataset.to_table(columns=columns, filter=expr)
+    return table.to_pandas()
@@ -1,12 +1,20 @@
 import os
+import re
+import glob
 import json
 import argparse
+import shutil
+import time
 import subprocess
 from datetime import datetime
+import numpy as np
 from argparse import Namespace
 import os, sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 from systems import generate_inputs_and_folders as giaf 
+from systems.output_index import OutputIndex
+import output_scanner
+import profiling
 
 
 def get_completed_files(log_path):
@@ -25,60 +33,143 @@ def log_completed_run(log_path, base_name):
         logf.write(f"{timestamp},{base_name}\n")
 
 
-def main():
-    parser = argparse.ArgumentParser(
-        description="Run inputs generated by `generate_inputs_and_folders.py`"
-    )
+parser = argparse.ArgumentParser(
+    description="Run inputs generated by `generate_inputs_and_folders.py`"
+)
 
-    parser.add_argument(
-        "metadata_path",
-        help="Path to metadata"
-    )
+parser.add_argument(
+    "metadata_path",
+    help="Path to metadata"
+)
 
-    parser.add_argument(
-        "-M", "--memory",
-        default=45,
-        required=False,
-        help="Memory in GB for qmolpro job"
-    )
+parser.add_argument(
+    "-M", "--memory",
+    type=int, default=45,
+    required=False,
+    help="Memory in GB for qmolpro job"
+)
 
-    parser.add_argument(
-        "--dry-run",
-        action="store_true",
-        help="Print commands instead of executing them"
-    )
+parser.add_argument(
+    "--dry-run",
+    action="store_true",
+    help="Print commands instead of executing them"
+)
 
-    parser.add_argument("--qmolpro-path", default="~/q-scripts/qmolpro-generic")
+parser.add_argument("--qmolpro-path", default="~/q-scripts/qmolpro-generic")
 
+parser.add_argument(
+    "--shard",
+    type=giaf.parse_shard, default=None,
+    help="Run only the i-th of N disjoint slices of the sweep, 'i/N' with i in 0..N-1"
+)
 
-    args = parser.parse_args()
-    meta = giaf.read_metadata(args.metadata_path)
+parser.add_argument(
+    "--wait",
+    action="store_true",
+    help="With a reference_template: keep waiting for references still running instead of leaving their dependents for a later call"
+)
 
-    # Prepare args for generate_file_paths
-    args_dict = {
-        "metadata_path": args.metadata_path,
-        "dry_run": False,
-        "output": None,
-    }
-    args_ns = Namespace(**args_dict)
+parser.add_argument(
+    "--wait-interval",
+    type=float, default=60,
+    help="Seconds between checks for reference wavefunctions with --wait (default 60)"
+)
 
-    for file_path, folder_path, _, _ in giaf.generate_file_paths(args_ns, meta):
-        log_path = os.path.join(folder_path, "runs.log")
-        completed_files = get_completed_files(log_path)
+parser.add_argument(
+    "--pack",
+    action="store_true",
+    help="Submit the pending inputs as one array job per group (see --pack-by) instead of one qmolpro call each"
+)
 
-        base_name = os.path.basename(file_path)
-        if base_name in completed_files:
-            print(f"✅ Skipping already completed: {file_path}")
-            continue
+parser.add_argument(
+    "--pack-by",
+    nargs="+", default=["bases"],
+    help="Iterables whose values (plus the memory) define the groups of --pack (default: bases)"
+)
 
-        cmd = f"{args.qmolpro_path} -M {args.memory} {base_name}"
+parser.add_argument(
+    "--pack-size",
+    type=int, default=0,
+    help="Maximum number of inputs per array job with --pack (default: no limit)"
+)
 
-        if args.dry_run:
-            print(f"[DRY-RUN] Would run: {cmd} in {folder_path}")
-            continue
+parser.add_argument(
+    "--submit-cmd",
+    default="local",
+    help="Command submitting one array job with --pack, formatted with {script}, {manifest}, {ntasks}, {memory} "
+         "(GB) and {name}, e.g. 'sbatch --array=1-{ntasks} --mem={memory}G -J {name} {script} {manifest}'. "
+         "'local' (default) runs the tasks one after another in this shell"
+)
+
+parser.add_argument(
+    "--task-cmd",
+    default="molpro -W . -m {memory_mw}m {input}",
+    help="Command running one input inside an array task, formatted with {input}, {memory} (GB) and "
+         "{memory_mw} (the same in megawords, as Molpro's -m takes it) "
+         "(default: 'molpro -W . -m {memory_mw}m {input}', -W . keeps the wavefunctions next to the input)"
+)
+
+parser.add_argument(
+    "--resubmit",
+    action="store_true",
+    help="With --pack: also submit inputs of earlier submissions (packs/*/submitted.log) that have not completed"
+)
 
-        print(f"🚀 Running: {cmd} in {folder_path}")
-        try:
+parser.add_argument(
+    "--auto-memory",
+    action="store_true",
+    help="Request the memory predicted from completed outputs (systems/cost_model.py), at least the "
+         "memory card of the input, instead of -M, which stays the default for inputs without either"
+)
+
+parser.add_argument(
+    "--memory-margin",
+    type=float, default=1.5,
+    help="Factor applied to the predicted memory Molpro needs (incore minimum) with --auto-memory (default 1.5)"
+)
+
+parser.add_argument(
+    "--longest-first",
+    action="store_true",
+    help="Run/submit the inputs with the longest predicted wall time first"
+)
+
+parser.add_argument(
+    "--history",
+    nargs="+", default=[],
+    help="metadata of other sweeps whose completed outputs are also used for the predictions"
+)
+profiling.add_arguments(parser)
+
+
+def is_completed(file_path, folder_path):
+    log_path = os.path.join(folder_path, "runs.log")
+    return os.path.basename(file_path) in get_completed_files(log_path)
+
+def run_input(file_path, folder_path, args, memory=None, wfu_dir=None):
+    """
+    Run one input, unless runs.log lists it as completed. Returns True if it is completed.
+    `memory` (GB) overrides -M/--memory. With `wfu_dir`, Molpro is passed
+    `-W wfu_dir` to keep its wavefunction files there instead of in ~/wfu.
+    """
+    log_path = os.path.join(folder_path, "runs.log")
+    base_name = os.path.basename(file_path)
+    if is_completed(file_path, folder_path):
+        print(f"✅ Skipping already completed: {file_path}")
+        return True
+
+    cmd = f"{args.qmolpro_path} -M {memory or args.memory}"
+    if wfu_dir:
+        cmd += f" -W {wfu_dir}"
+    cmd += f" {base_name}"
+
+    if args.dry_run:
+        print(f"[DRY-RUN] Would run: {cmd} in {folder_path}")
+        return False
+
+    print(f"🚀 Running: {cmd} in {folder_path}")
+    try:
+        with profiling.stage('run.submit', label=file_path):
             subprocess.run(
                 cmd,
                 shell=True,
@@ -86,14 +177,351 @@ def main():
                 cwd=folder_path,
                 executable="/bin/bash"
             )
-        except subprocess.CalledProcessError as e:
-            print(f"❌ Error running {cmd}: {e}")
+    except subprocess.CalledProcessError as e:
+        print(f"❌ Error running {cmd}: {e}")
+        return False
+
+    log_completed_run(log_path, base_name)
+    print(f"📝 Logged run: {base_name}")
+    return True
+
+PACK_FOLDER = "packs"
+SUBMITTED_LOG = "submitted.log"
+
+TASK_SCRIPT = """#!/bin/bash
+# Runs task TASK_ID (from 1) of a manifest written by run_inputs_and_folders.py --pack
+# and logs the input to runs.log of its folder if it succeeds.
+# usage: run_task.sh MANIFEST [TASK_ID]   (default TASK_ID from the scheduler)
+manifest=$1
+task=${{2:-${{SLURM_ARRAY_TASK_ID:-${{SGE_TASK_ID:-${{PBS_ARRAY_INDEX:-$LSB_JOBINDEX}}}}}}}}
+IFS=$'\\t' read -r folder input memory < <(sed -n "${{task}}p" "$manifest")
+cd "$folder" || exit 1
+{task_cmd}
+status=$?
+if [ $status -eq 0 ]; then
+    echo "$(date '+%Y-%m-%d %H:%M:%S'),$input" >> runs.log
+else
+    echo "failed ($status): $folder/$input" >&2
+fi
+exit $status
+"""
+
+def load_predictions(args):
+    """
+    Predicted costs of all inputs of the sweep (see systems/cost_model.py),
+    indexed by input, if --auto-memory or --longest-first is used, else None.
+    """
+    if not (getattr(args, 'auto_memory', False) or getattr(args, 'longest_first', False)):
+        return None
+    from systems import cost_model
+    return cost_model.predict_sweep(args.metadata_path, args.history).set_index("input")
+
+def plan_inputs(items, predictions, args):
+    """
+    Returns the `items` (longest predicted wall time first with
+    --longest-first) and {file_path: memory GB} with --auto-memory, and
+    prints the predicted serial wall time of the pending ones.
+    """
+    items = list(items)
+    if predictions is None:
+        return items, {}
+    from systems import cost_model
+
+    predicted = predictions.reindex([file_path for file_path, *_ in items])
+    pending = predicted[~predicted["done"].fillna(False).astype(bool)]
+    wall_times = pending["predicted_wall_time"].dropna()
+    print(f"⏱️ {len(pending)} pending inputs, predicted {cost_model.format_duration(wall_times.sum())} "
+          f"wall time in total" + (f" ({len(pending) - len(wall_times)} without history)"
+                                   if len(wall_times) < len(pending) else ""))
+
+    if args.longest_first:
+        # unknown first, they may be the longest
+        order = np.argsort(-predicted["predicted_wall_time"].fillna(np.inf).to_numpy(), kind="stable")
+        items = [items[n] for n in order]
+    memories = {}
+    if args.auto_memory:
+        # Molpro allocates the memory of the input (predicted_memory_gb) whether it
+        # needs it or not, so the margin only goes on the memory it needs
+        needed = predicted["predicted_needed_gb"] * args.memory_margin
+        for file_path, memory in np.fmax(predicted["predicted_memory_gb"], needed).dropna().items():
+            memories[file_path] = max(1, int(np.ceil(memory)))
+    return items, memories
+
+def input_memory(kwargs, meta, args):
+    """
+    Memory (GB) of an input: `"memory"` of the metadata maps values of the
+    --pack-by iterables (e.g. a basis) to GB, the default is -M/--memory.
+    """
+    memory = meta.get("memory", {})
+    for key in args.pack_by:
+        if str(kwargs.get(key)) in memory:
+            return int(np.ceil(memory[str(kwargs[key])]))
+    return args.memory
+
+def submitted_inputs(metadata_path):
+    """
+    (absolute folder, input name) of every task of the manifests recorded in
+    packs/*/submitted.log of the sweep, i.e. queued, running or finished.
+    """
+    submitted = set()
+    pattern = os.path.join(os.path.dirname(os.path.abspath(metadata_path)), PACK_FOLDER, "*", SUBMITTED_LOG)
+    for log_path in glob.glob(pattern):
+        with open(log_path) as logf:
+            manifests = [line.strip().split(",")[1] for line in logf if line.strip()]
+        for manifest in manifests:
+            with open(manifest) as f:
+                submitted.update(tuple(line.split("\t")[:2]) for line in f if line.strip())
+    return submitted
+
+def pack_groups(items, meta, args, memories=None):
+    """
+    Pending `items` (file_path, folder_path, template_file, kwargs) grouped by
+    the values of the --pack-by iterables and their memory (from `memories`
+    {file_path: GB} if given, else `input_memory`), as
+    {(values, memory): [(file_path, folder_path), ...]}. runs.log of every
+    folder is read once. Inputs of earlier submissions (see
+    `submitted_inputs`) are left out, unless --resubmit.
+    """
+    memories = memories or {}
+    completed = {}
+    submitted = set() if getattr(args, 'resubmit', False) else submitted_inputs(args.metadata_path)
+    groups = {}
+    skipped = 0
+    for file_path, folder_path, _, kwargs in items:
+        if folder_path not in completed:
+            completed[folder_path] = get_completed_files(os.path.join(folder_path, "runs.log"))
+        if os.path.basename(file_path) in completed[folder_path]:
+            continue
+        if (os.path.abspath(folder_path), os.path.basename(file_path)) in submitted:
+            skipped += 1
             continue
+        values = tuple(str(kwargs[key]) for key in args.pack_by if key in kwargs)
+        key = (values, memories.get(file_path) or input_memory(kwargs, meta, args))
+        groups.setdefault(key, []).append((file_path, folder_path))
+    if skipped:
+        print(f"⏳ {skipped} inputs were submitted before and have not completed yet, not submitting them "
+              f"again (use --resubmit if they failed)")
+    return groups
+
+def write_packs(groups, pack_dir, args):
+    """
+    Write a manifest (folder, input, memory per line) per group, split into
+    chunks of --pack-size, and the task script into `pack_dir`.
+    Returns the script and a list of (manifest, ntasks, memory, name).
+    """
+    os.makedirs(pack_dir, exist_ok=True)
+    script = os.path.join(pack_dir, "run_task.sh")
+    task_cmd = args.task_cmd.format(input='"$input"', memory='"$memory"', memory_mw='"$((memory * 125))"')
+    with open(script, "w") as f:
+        f.write(TASK_SCRIPT.format(task_cmd=task_cmd))
+    os.chmod(script, 0o755)
+
+    packs = []
+    for (values, memory), inputs in groups.items():
+        size = args.pack_size or len(inputs)
+        for n, start in enumerate(range(0, len(inputs), size)):
+            chunk = inputs[start:start + size]
+            name = giaf.clean_filename("_".join(values + (f"{memory}G", f"{n:03d}")))
+            manifest = os.path.join(pack_dir, name + ".manifest")
+            with open(manifest, "w") as f:
+                for file_path, folder_path in chunk:
+                    f.write(f"{os.path.abspath(folder_path)}\t{os.path.basename(file_path)}\t{memory}\n")
+            packs.append((manifest, len(chunk), memory, name))
+    return script, packs
+
+def log_submission(manifest, output):
+    """
+    Append the manifest and the job id (the last number printed by
+    --submit-cmd, e.g. of sbatch's 'Submitted batch job 123') to
+    submitted.log next to it.
+    """
+    job_ids = re.findall(r"\d+", output)
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with open(os.path.join(os.path.dirname(manifest), SUBMITTED_LOG), "a") as logf:
+        logf.write(f"{timestamp},{manifest},{job_ids[-1] if job_ids else ''}\n")
+
+def submit_pack(script, manifest, ntasks, memory, name, args):
+    """
+    Submit one manifest with --submit-cmd and record it with `log_submission`,
+    or run its tasks here for 'local'.
+    """
+    if args.submit_cmd == "local":
+        print(f"🚀 Running {ntasks} tasks of {manifest} locally")
+        failed = 0
+        for task in range(1, ntasks + 1):
+            failed += subprocess.run(["bash", script, manifest, str(task)]).returncode != 0
+        if failed:
+            print(f"❌ {failed} of {ntasks} tasks of {manifest} failed")
+        return
+
+    cmd = args.submit_cmd.format(script=script, manifest=manifest, ntasks=ntasks, memory=memory, name=name)
+    print(f"🚀 Submitting {ntasks} inputs: {cmd}")
+    try:
+        with profiling.stage('run.submit', label=manifest):
+            result = subprocess.run(cmd, shell=True, check=True, executable="/bin/bash",
+                                    stdout=subprocess.PIPE, text=True)
+    except subprocess.CalledProcessError as e:
+        print(f"❌ Error submitting {cmd}: {e}")
+        return
+    print(result.stdout, end="")
+    log_submission(manifest, result.stdout)
 
-        log_completed_run(log_path, base_name)
-        print(f"📝 Logged run: {base_name}")
+def run_packed(items, meta, args, memories=None):
+    """Submit the pending `items` as one array job per group (--pack)."""
+    groups = pack_groups(items, meta, args, memories)
+    if not groups:
+        print("✅ No pending inputs")
+        return
+    if args.dry_run:
+        for (values, memory), inputs in groups.items():
+            print(f"[DRY-RUN] Would submit {len(inputs)} inputs of {values} with {memory} GB")
+        return
+
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    pack_dir = os.path.abspath(os.path.join(os.path.dirname(args.metadata_path), PACK_FOLDER, stamp))
+    script, packs = write_packs(groups, pack_dir, args)
+    for pack in packs:
+        submit_pack(script, *pack, args)
+
+def reference_state(reference_file, index):
+    """
+    'done' if the latest `.out` of `reference_file` terminated normally
+    (status ok, see `output_scanner.get_status`), 'running' if it has no
+    output yet or it has not terminated, else 'failed'.
+    """
+    outfiles = index.matches(os.path.splitext(reference_file)[0], "out")
+    if not outfiles:
+        return 'running'
+    status = output_scanner.scan_file(outfiles[-1])['status']
+    if status == 'ok':
+        return 'done'
+    return 'running' if status == 'incomplete' else 'failed'
+
+def copy_reference_wfu(reference_file, file_path, folder_path, dry_run=False):
+    """
+    Copy the wavefunction saved by `reference_file` to the `{reference_wfu}`
+    of `file_path` (each job gets its own copy, as Molpro opens it for
+    writing). A copy older than the wavefunction of the reference (e.g. of
+    a reference that was rerun) is replaced. Returns False if the reference
+    has not written it. Only call it once the reference is done (see
+    `reference_state`), the wavefunction is written while it runs.
+    """
+    src = os.path.join(os.path.dirname(reference_file), giaf.wfu_name(reference_file))
+    dst = os.path.join(folder_path, giaf.wfu_name(file_path))
+    if dry_run:
+        print(f"[DRY-RUN] Would copy {src} to {dst}")
+        return True
+    if not os.path.exists(src):
+        return False
+    if os.path.exists(dst) and os.path.getmtime(dst) >= os.path.getmtime(src):
+        return True
+    os.makedirs(folder_path, exist_ok=True)
+    shutil.copyfile(src, dst)
+    return True
+
+def run_with_references(args, meta, args_ns, predictions=None):
+    """
+    Run the reference (HF/MP2) inputs first, then every dependent input
+    once its reference has terminated normally and its wavefunction is
+    copied. Dependents whose reference is still running are left for a
+    later call, or waited for with --wait. Dependents of failed references
+    (see `reference_state`), or of references that wrote no wavefunction,
+    are reported and skipped. With --pack, references and the dependents
+    that are ready are submitted as array jobs. With --shard, references and
+    dependents are sharded independently, so a dependent may wait for a
+    reference run elsewhere.
+
+    All inputs are run with `-W .`, so Molpro writes the wavefunction of a
+    reference into its folder and reads the copy of a dependent from its
+    folder (by default both are in ~/wfu).
+    """
+    shard = getattr(args, 'shard', None)
+    packed = getattr(args, 'pack', False)
+    references, memories = plan_inputs(
+        giaf.filter_shard(giaf.generate_reference_paths(args_ns, meta), shard), predictions, args
+    )
+    if packed:
+        run_packed(references, meta, args, memories)
+    else:
+        for file_path, folder_path, _, _ in references:
+            run_input(file_path, folder_path, args, memories.get(file_path), wfu_dir=".")
+
+    lookup = giaf.reference_lookup(args_ns, meta)
+    pending, memories = plan_inputs(
+        giaf.filter_shard(giaf.generate_file_paths(args_ns, meta), shard), predictions, args
+    )
+    failed = {}
+    while True:
+        waiting, ready = [], []
+        index, states = OutputIndex(), {}
+        for file_path, folder_path, template_file, kwargs in pending:
+            reference_file = giaf.get_reference_file(kwargs, lookup)
+            if is_completed(file_path, folder_path):
+                pass
+            elif args.dry_run:
+                copy_reference_wfu(reference_file, file_path, folder_path, dry_run=True)
+            else:
+                if reference_file not in states:
+                    states[reference_file] = reference_state(reference_file, index)
+                state = states[reference_file]
+                if state == 'running':
+                    waiting.append((file_path, folder_path, template_file, kwargs))
+                    continue
+                if state == 'done' and not copy_reference_wfu(reference_file, file_path, folder_path):
+                    state = f"wrote no {giaf.wfu_name(reference_file)} next to it"
+                if state != 'done':
+                    failed.setdefault((reference_file, state), []).append(file_path)
+                    continue
+            if packed:
+                ready.append((file_path, folder_path, template_file, kwargs))
+            else:
+                run_input(file_path, folder_path, args, memories.get(file_path), wfu_dir=".")
+        if ready:
+            run_packed(ready, meta, args, memories)
+
+        if not waiting or not args.wait:
+            break
+        print(f"⏳ {len(waiting)} inputs wait for their reference wavefunction, "
+              f"checking again in {args.wait_interval} s")
+        time.sleep(args.wait_interval)
+        pending = waiting
+
+    for (reference_file, reason), dependents in failed.items():
+        print(f"❌ Reference {reference_file} {reason}, skipped {len(dependents)} inputs depending on it")
+    if waiting:
+        print(f"⏳ {len(waiting)} inputs still wait for their reference wavefunction, "
+              f"run again once the references have finished (or use --wait)")
+
+def main(args=None):
+    if args is None:
+        args = parser.parse_args()
+    meta = giaf.read_metadata(args.metadata_path)
+
+    # Prepare args for generate_file_paths
+    args_dict = {
+        "metadata_path": args.metadata_path,
+        "dry_run": False,
+        "output": None,
+    }
+    args_ns = Namespace(**args_dict)
+
+    predictions = load_predictions(args)
+    if meta.get("reference_template"):
+        run_with_references(args, meta, args_ns, predictions)
+        return
+
+    items, memories = plan_inputs(
+        giaf.filter_shard(giaf.generate_file_paths(args_ns, meta), getattr(args, 'shard', None)),
+        predictions, args
+    )
+    if getattr(args, 'pack', False):
+        run_packed(items, meta, args, memories)
+        return
+    for file_path, folder_path, _, _ in items:
+        run_input(file_path, folder_path, args, memories.get(file_path))
 
 
 if __name__ == "__main__":
-    main()
+    args = parser.parse_args()
+    profiling.run(args, main, args)
 
@@ -1,10 +1,11 @@
-import numpy as np
 import json
 import argparse
 import itertools
 import os, sys
-import warnings
+import time
+import numpy as np
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from argparse import Namespace
 
 # Add parent directory (project root) to sys.path
@@ -12,10 +13,13 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 from systems import generate_inputs_and_folders as giaf
 from systems import run_inputs_and_folders as riaf
+from systems import result_store as rs
+from systems.output_index import OutputIndex
 
 import xml_output_parser as xo
 import tabulate_outs as to
-import glob
+import output_scanner
+import profiling
 
 parser = argparse.ArgumentParser(
     description="Tabulates ouptputs using metadata"
@@ -46,6 +50,49 @@ parser.add_argument(
     "--outfile",
     help="output file to write data to, default is `data.csv` in same folder as metadata_path"
 )
+parser.add_argument(
+    "--multijob",
+    help="outputs contain multiple jobs (e.g. a do-loop): one row per jobstep, with its loop variables",
+    action='store_true'
+)
+parser.add_argument(
+    "--watch",
+    help="keep running, re-tabulating only new or modified outputs every --interval seconds",
+    action='store_true'
+)
+parser.add_argument(
+    "--interval",
+    help="seconds between polls in --watch mode (default 30)",
+    type=float, default=30
+)
+parser.add_argument(
+    "--until_done",
+    help="in --watch mode, stop once every input has a finished (done or failed) output",
+    action='store_true'
+)
+parser.add_argument(
+    "--shard",
+    help="tabulate only the i-th of N disjoint slices of the sweep, 'i/N' with i in 0..N-1; "
+         "written to data.shard-<i>-of-<N>.csv by default, combine them with merge_shards.py. "
+         "With --outformat parquet every shard replaces only its own files of the partition",
+    type=giaf.parse_shard, default=None
+)
+parser.add_argument(
+    "--outformat",
+    help="format of the written table: csv (default) or parquet (columnar result store)",
+    choices=["csv", "parquet"],
+    default="csv"
+)
+parser.add_argument(
+    "--store",
+    help="root of the parquet result store, default is `result_store/` next to the system folders"
+)
+parser.add_argument(
+    "--append",
+    help="append to the parquet partition instead of replacing it",
+    action='store_true'
+)
+profiling.add_arguments(parser)
     
 def _print_nested_dict(d, prefix=""):
     for key, val in d.items():
@@ -55,36 +102,19 @@ def _print_nested_dict(d, prefix=""):
             continue
         print(f"{prefix}{key:20s} {val}")
 
-def get_outfile(infile, calctype='xg'):
+def get_outfile(infile, calctype='xg', index=None):
     """
     Given an input file path (e.g. 'path/to/file.inp'),
     find all matching output files ('path/to/file.*.out').
     If multiple exist, issue a warning but return the latest one.
-    """
-    # Split path and base filename (without extension)
-    base, _ = os.path.splitext(infile)
-    if calctype == 'xg':
-        pattern = f"{base}.*.out"
-    else:
-        pattern = f"{base}.*.xml"
-
-    # Find matching files
-    matches = glob.glob(pattern)
-
-    if not matches:
-        raise FileNotFoundError(f"No matching output files found for pattern: {pattern}")
-
-    # Sort by modification time (latest last)
-    matches.sort(key=os.path.getmtime)
-
-    if len(matches) > 1:
-        warnings.warn(
-            f"Multiple output files found for {infile}:\n"
-            + "\n".join(matches)
-            + f"\nUsing latest: {matches[-1]}"
-        )
 
-    return matches[-1]
+    `index` (an OutputIndex) lists each folder once for all inputs;
+    without it the folder of `infile` is listed for this call only.
+    """
+    ext = 'out' if calctype == 'xg' else 'xml'
+    index = index or OutputIndex()
+    with profiling.stage('outfile.resolve', label=infile):
+        return index.latest(infile, ext)
     
 def update_dict(df_dict, kwargs):
     for key, val in kwargs.items():
@@ -92,17 +122,58 @@ def update_dict(df_dict, kwargs):
             df_dict[key] = []
         df_dict[key].append(val)
 
-def df_from_csv(csvfile, energy_types):
+def df_from_csv(csvfile, energy_types=None):
+    """
+    Read a table saved by Molpro (`table,...;save,file=...`) with the C parser.
+    Column names are stripped of the padding Molpro writes around them.
+    """
     if csvfile.endswith('.csv'):
         sep = ','
     else:
         sep = r'\s+'
         
-    df = pd.read_csv(
-        csvfile, skipinitialspace=True, sep=sep, engine="python"
-    )#, usecols=energy_types)
+    with profiling.stage('csv.read', path=csvfile):
+        df = pd.read_csv(
+            csvfile, skipinitialspace=True, sep=sep, engine="c"
+        )#, usecols=energy_types)
+    df.columns = df.columns.str.strip()
     return df
 
+def check_csv_collisions(sources):
+    """
+    Molpro truncates saved file names to 32 characters, so different inputs
+    can write to the same table. `sources` is a list of (infile, csvfile);
+    raises ValueError listing every table claimed by more than one input.
+    """
+    claimed = {}
+    for infile, csvfile in sources:
+        claimed.setdefault(csvfile, []).append(infile)
+    collisions = {csv: infiles for csv, infiles in claimed.items() if len(infiles) > 1}
+    if collisions:
+        lines = [f"  {csv} <- " + ", ".join(infiles) for csv, infiles in collisions.items()]
+        raise ValueError(
+            "Table names collide after truncation to 32 characters:\n"
+            + "\n".join(lines)
+            + "\nShorten file_prefix or the iterable prefixes in the metadata."
+        )
+
+def read_tables(sources, kwargs_list, meta, max_workers=None):
+    """
+    Read the Molpro tables `sources` concurrently and return them as one
+    DataFrame, with the parameters of `kwargs_list` (one dict per table)
+    repeated over the rows of their table and an `outfile` column.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        tables = list(pool.map(df_from_csv, sources))
+
+    counts = np.array([len(t) for t in tables])
+    df = giaf.unbatch_table(pd.concat(tables, ignore_index=True), meta)
+    params = {}
+    for key in kwargs_list[0]:
+        params[key] = np.repeat(np.array([kw[key] for kw in kwargs_list], dtype=object), counts)
+    params['outfile'] = np.repeat(np.array(sources, dtype=object), counts)
+    return df.assign(**params)
+
 def dict_from_out(outfile, energy_types, kwargs, calctype):
 
     for enertype in energy_types:
@@ -112,6 +183,58 @@ def dict_from_out(outfile, energy_types, kwargs, calctype):
                 )
     
     
+def get_csvfile(folder_path, kwargs):
+    csv_basename = kwargs['full_file_prefix'] + '.csv'
+    csv_basename = csv_basename[:32] # Molpro allows only upto 32 chars :@
+    return os.path.join(folder_path, csv_basename)
+
+def get_source_file(infile, folder_path, kwargs, args, meta, index=None):
+    """The file energies are read from for `infile`: the Molpro table (csv) or the output."""
+    if args.outtype == 'csv':
+        return get_csvfile(folder_path, kwargs)
+    return get_outfile(infile, calctype=meta['calc_type'], index=index)
+
+def tabulate_input(source, kwargs, args, meta):
+    """
+    Returns a DataFrame with the parameters in `kwargs` and the energies
+    read from `source` (as returned by `get_source_file`). For batched
+    sweeps each row of the saved table is one point of the batched iterables.
+    """
+    kwargs = dict(kwargs)
+    if args.outtype == 'csv':
+        energy_types = args.enertypes or ["TOT_ENER", "CORR_ENER"]
+        df = df_from_csv(source, energy_types)
+        df = giaf.unbatch_table(df, meta)
+        kwargs['outfile'] = source
+        return df.assign(**kwargs)
+
+    if meta['calc_type'] == 'xg':
+        calctype = 'xg'
+    else:
+        calctype = 'std'
+    energy_types = args.enertypes or ["total energy", "correlation energy"]
+    kwargs['outfile'] = source
+    if getattr(args, 'multijob', False):
+        steps = to.get_eners_all(source, energy_types, out_type=calctype)
+        return giaf.unbatch_table(pd.DataFrame(steps), meta).assign(**kwargs)
+    dict_from_out(source, energy_types, kwargs, calctype)
+    return pd.DataFrame([kwargs])
+
+def combine_tables(data_frames, kwargs, meta=None):
+    """Concatenate per-input tables: parameters first, then energies, then the outfile."""
+    full_df = pd.concat(
+        data_frames,
+        ignore_index=True
+    )
+    if meta is not None:
+        # batched parameters come from the tables, place them with the others
+        kwargs = {**kwargs, **giaf.get_iterables(meta, batched=True)}
+    columns = [key for key in kwargs if 'file' not in key and key in full_df.columns]
+    columns += [c for c in full_df.columns if c not in kwargs and c != 'outfile']
+    columns += ['outfile']
+    
+    return full_df[columns]
+
 def main(args):
     print ('| ARGUMENTS PROVIDED')
     _print_nested_dict(vars(args))
@@ -124,65 +247,201 @@ def main(args):
     }
     args_ns = Namespace(**args_dict)
 
+    shard = getattr(args, 'shard', None)
     data_frames = []
-    
-    for infile, folder_path, _, kwargs in giaf.generate_file_paths(args_ns, meta):
-
-        if args.outtype == 'csv':
-            csv_basename = kwargs['full_file_prefix'] + '.csv'
-            csv_basename = csv_basename[:32] # Molpro allows only upto 32 chars :@
-            csvfile = os.path.join(
-                folder_path,
-                csv_basename
-            ) 
-            energy_types = args.enertypes or ["TOT_ENER", "CORR_ENER"]
-            df = df_from_csv(csvfile, energy_types)
-            kwargs['outfile'] = csvfile
-            data_frames.append(df.assign(**kwargs))
-            
-            #print(csvfile)
-            #print(df.columns)
-            
-            
-            
-        else:     
-            if meta['calc_type'] == 'xg':
-                calctype = 'xg'
+    if args.outtype == 'csv':
+        # all tables are known up front: check names, then read them in bulk
+        items = list(giaf.generate_file_paths(args_ns, meta))
+        check_csv_collisions([
+            (infile, get_csvfile(folder_path, kwargs)) for infile, folder_path, _, kwargs in items
+        ])
+        items = list(giaf.filter_shard(items, shard))
+        if not items:
+            return pd.DataFrame()
+        sources = [get_csvfile(folder_path, kwargs) for _, folder_path, _, kwargs in items]
+        kwargs_list = [item[3] for item in items]
+        data_frames.append(read_tables(sources, kwargs_list, meta))
+        return combine_tables(data_frames, kwargs_list[-1], meta)
+
+    index = OutputIndex()
+    for infile, folder_path, _, kwargs in giaf.filter_shard(giaf.generate_file_paths(args_ns, meta), shard):
+        source = get_source_file(infile, folder_path, kwargs, args, meta, index)
+        data_frames.append(tabulate_input(source, kwargs, args, meta))
+
+    if not data_frames:
+        # e.g. an empty shard
+        return pd.DataFrame()
+    return combine_tables(data_frames, kwargs, meta)
+
+def _group_name(folder_path, args):
+    return os.path.relpath(folder_path, os.path.dirname(os.path.abspath(args.metadata_path)))
+
+STATES = ['done', 'running', 'failed', 'missing']
+
+def output_status(infile, index, scans, source=None):
+    """
+    Status (see `output_scanner.get_status`) of `source` if it is an
+    output, else of the latest `.out` of `infile`, None if there is none.
+    `scans` maps every output scanned so far to (mtime, status), an output
+    is only scanned again when its mtime changed.
+    """
+    if source is None or os.path.splitext(source)[1] not in ('.out', '.xml'):
+        outfiles = index.matches(os.path.splitext(infile)[0], 'out')
+        if not outfiles:
+            return None
+        source = outfiles[-1]
+    mtime = index.getmtime(source)
+    if source not in scans or scans[source][0] != mtime:
+        scans[source] = (mtime, output_scanner.scan_file(source)['status'])
+    return scans[source][1]
+
+def output_state(infile, index, scans, source=None):
+    """
+    'running' or 'failed' for an input whose energies could not be read,
+    from its `output_status`. Outputs that terminated (or stopped with an
+    error) without energies are 'failed', unterminated ones 'running'.
+    'missing' if there is no output at all.
+    """
+    status = output_status(infile, index, scans, source)
+    if status is None:
+        return 'missing'
+    return 'running' if status == 'incomplete' else 'failed'
+
+def poll(args, meta, state, scans=None):
+    """
+    One refresh of the watch mode.
+
+    `state` maps each input file to (source file, mtime, table or None,
+    kwargs, state) and is updated in place. Only sources that are new or
+    whose mtime changed are parsed, and only outputs that are new or whose
+    mtime changed are scanned (`scans`, see `output_status`, also updated
+    in place). An input is 'done' when its energies could be read and its
+    output (if any) has no error, 'running' when its output exists but has
+    not terminated, 'failed' when its output stopped with an error (see
+    `output_scanner.get_status`) or terminated without energies, and
+    'missing' otherwise. Failed inputs have no table.
+
+    Returns (changed, progress) where progress maps each parameter group
+    (subfolder) to a dict of counts of every state in STATES.
+    """
+    args_ns = Namespace(metadata_path=args.metadata_path, dry_run=False, output=None)
+    scans = {} if scans is None else scans
+    changed = False
+    progress = {}
+    index = OutputIndex()  # fresh listing of every folder once per poll
+    items = giaf.filter_shard(giaf.generate_file_paths(args_ns, meta), getattr(args, 'shard', None))
+    for infile, folder_path, _, kwargs in items:
+        counts = progress.setdefault(_group_name(folder_path, args), dict.fromkeys(STATES, 0))
+        try:
+            source = get_source_file(infile, folder_path, kwargs, args, meta, index)
+            mtime = index.getmtime(source)
+        except (FileNotFoundError, OSError):
+            if state.pop(infile, None) is not None:
+                changed = True
+            # e.g. no table saved because the job crashed
+            counts[output_state(infile, index, scans)] += 1
+            continue
+
+        cached = state.get(infile)
+        if cached is None or cached[0] != source or cached[1] != mtime:
+            try:
+                table = tabulate_input(source, kwargs, args, meta)
+                energies = table.drop(columns=list(kwargs) + ['outfile'], errors='ignore')
+                if energies.isna().all(axis=None):
+                    table = None
+            except Exception:
+                # e.g. truncated XML of a job still running
+                table = None
+            status = output_status(infile, index, scans, source)
+            if table is None or status not in (None, 'ok', 'incomplete'):
+                # energies of an output that stopped with an error are not used
+                table = None
+                status = output_state(infile, index, scans, source)
             else:
-                calctype = 'std'
-            outfile = get_outfile(infile, calctype=meta['calc_type'])
-            energy_types = args.enertypes or ["total energy", "correlation energy"]
-            kwargs['outfile'] = outfile
-            dict_from_out(outfile, energy_types, kwargs, calctype)
-            data_frames.append(pd.DataFrame([kwargs]))
-            
+                status = 'done'
+            state[infile] = (source, mtime, table, kwargs, status)
+            changed = True
 
+        counts[state[infile][4]] += 1
+    return changed, progress
 
-    full_df = pd.concat(
-        data_frames,
-        ignore_index=True
-    )
-    columns = [key for key in kwargs if 'file' not in key]
-    columns += [c for c in full_df.columns if c not in kwargs]
-    columns += [key for key in kwargs if key == 'outfile']
-    
-    return full_df[columns]
+def print_progress(progress):
+    total = dict.fromkeys(STATES, 0)
+    print(f"| {time.strftime('%H:%M:%S')} {'group':40s}" + "".join(f" {key:>8s}" for key in STATES))
+    for group, counts in progress.items():
+        print(f"|          {group:40s}" + "".join(f" {counts[key]:8d}" for key in STATES))
+        for key in total:
+            total[key] += counts[key]
+    print(f"|          {'TOTAL':40s}" + "".join(f" {total[key]:8d}" for key in STATES))
+    return total
+
+def watch(args):
+    """
+    Poll the sweep folders and keep the written table up to date, parsing
+    only outputs that are new or have changed since the last poll.
+    """
+    meta = giaf.read_metadata(args.metadata_path)
+    if args.outtype == 'csv':
+        args_ns = Namespace(metadata_path=args.metadata_path, dry_run=False, output=None)
+        check_csv_collisions([
+            (infile, get_csvfile(folder_path, kwargs))
+            for infile, folder_path, _, kwargs in giaf.generate_file_paths(args_ns, meta)
+        ])
+    state, scans = {}, {}
+    while True:
+        changed, progress = poll(args, meta, state, scans)
+        total = print_progress(progress)
+        tables = [entry[2] for entry in state.values() if entry[2] is not None]
+        if changed and tables:
+            df = combine_tables(tables, next(iter(state.values()))[3], meta)
+            if args.print_only:
+                print(df.to_string())
+            elif args.outformat == 'parquet':
+                # the whole table is written on every change, so replace the partition
+                write_to_store(df, args, append=False)
+            else:
+                write_to_csv(df, args)
+        if args.until_done and total['running'] == 0 and total['missing'] == 0:
+            if total['failed']:
+                print(f"❌ {total['failed']} inputs failed (see `python output_scanner.py --problems`)")
+            return
+        time.sleep(args.interval)
 
 def write_to_csv(df, args):
     if args.outfile:
         outfile = args.outfile
+    elif getattr(args, 'shard', None):
+        outfile = os.path.join(
+            os.path.dirname(args.metadata_path), 'data.shard-{}-of-{}.csv'.format(*args.shard)
+        )
     else:
         outfile = os.path.join(
             os.path.dirname(args.metadata_path), 'data.csv'
         )
     df.to_csv(outfile ,index=False)
+
+def write_to_store(df, args, append=None):
+    """Write `df` (of --shard, if given) to the result store; `append` defaults to --append."""
+    meta = giaf.read_metadata(args.metadata_path)
+    root = args.store or rs.default_store_path(args.metadata_path)
+    rs.write_store(
+        df, root,
+        system=rs.system_from_metadata_path(args.metadata_path),
+        calc_type=meta['calc_type'],
+        append=args.append if append is None else append,
+        shard=getattr(args, 'shard', None)
+    )
     
 if __name__ == '__main__':
     args = parser.parse_args()
-    df = main(args)
+    if args.watch:
+        profiling.run(args, watch, args)
+        sys.exit(0)
+    df = profiling.run(args, main, args)
     if args.print_only:
         print(df.to_string())
+    elif args.outformat == 'parquet':
+        write_to_store(df, args)
     else:
-        
         write_to_csv(df, args)
         
\ No newline at end of file
@@ -1,12 +1,10 @@
-import numpy as np
-import matplotlib.pyplot as pp
 import argparse as ap
-import subprocess as sp
 import sys
 import pandas as pd
 import os
 
 import xml_output_parser as xop 
+import profiling
 from typing import Optional, Any
 
 parser = ap.ArgumentParser(
@@ -15,7 +13,8 @@ parser = ap.ArgumentParser(
     table (pandas.DataFrame) of energies per output file. 
 
     RESTRICTIONS:
-    * Output files MUST only be for a single point energy.
+    * Output files MUST only be for a single point energy,
+      unless --multijob is given.
     * For standard and default, must be XML output.
     """,
     fromfile_prefix_chars='@'
@@ -33,6 +32,39 @@ parser.add_argument(
 parser.add_argument('--input_csv', '-i', type=str,
                     help='Path to CSV file with outputs and labels'
                     )
+parser.add_argument('--stdin', nargs='?', const='auto', choices=['auto', 'std', 'xg'],
+                    help="""Read output files from stdin, one per line (or NUL separated with -0).
+                    With 'auto' (default) *.xml files are read as standard/default outputs
+                    and all others as XG outputs."""
+                    )
+parser.add_argument('--multijob', '-m', action='store_true',
+                    help="""Outputs contain multiple jobs (e.g. a do-loop): write one row per
+                    jobstep, with its index and loop variables, instead of one row per file."""
+                    )
+parser.add_argument('-0', '--null', action='store_true',
+                    help='File names on stdin are separated by NUL characters, e.g. from `find -print0`'
+                    )
+profiling.add_arguments(parser)
+
+def read_file_list(stream, null=False):
+    """Read a newline (or NUL) separated list of file names from `stream`."""
+    content = stream.read()
+    if null:
+        files = content.split('\0')
+    else:
+        files = [f.rstrip('\r') for f in content.split('\n')]
+    return [f for f in files if f]
+
+def add_stdin_files(args, stream=None):
+    """Extend args.outs/args.xgouts with the file names given on stdin."""
+    files = read_file_list(stream or sys.stdin, null=args.null)
+    outs, xgouts = list(args.outs or []), list(args.xgouts or [])
+    for f in files:
+        if args.stdin == 'std' or (args.stdin == 'auto' and f.endswith('.xml')):
+            outs.append(f)
+        else:
+            xgouts.append(f)
+    args.outs, args.xgouts = outs, xgouts
 
 def ener_not_found_error(outfile):
     print(f"No energy found! Output file: {outfile}")
@@ -43,7 +75,7 @@ def get_xg_energy_lines(outfile):
     printing = False
     last_line = None
     output_lines = []
-    with open(outfile, "r") as f:
+    with profiling.stage('xg.read', path=outfile), open(outfile, "r") as f:
         for line in f:
             last_line = line
             if start_marker in line:
@@ -77,6 +109,37 @@ def get_ener(outfile, enertype='total energy', method='DF-MP2-F12', out_type="st
 
     return None
 
+def get_xg_energies_all(outfile, energy_types, method='DF-MP2-F12'):
+    """
+    Energies of every "Printing Energies step by step" section of an XG
+    output, in order. Returns an empty list if the calculation did not terminate.
+    """
+    out = get_xg_energy_lines(outfile)
+    if 'Molpro calculation terminated' not in out:
+        ener_not_found_error(outfile)
+        return []
+
+    stripped_method = method.lstrip('DF-')
+    steps = []
+    for section in out.split("Printing Energies step by step")[1:]:
+        step = {'jobstep': len(steps)}
+        for etype in energy_types:
+            step[etype] = None
+            for line in section.split('\n')[-1::-1]:
+                if stripped_method in line and etype in line:
+                    step[etype] = float(line.split()[-1])
+                    break
+        steps.append(step)
+    return steps
+
+def get_eners_all(outfile, energy_types, method='DF-MP2-F12', out_type="std"):
+    """One dict of energies (and loop variables for XML) per jobstep of a multi-job output."""
+    if out_type == "std":
+        return xop.get_xmlener_all(outfile, command=method, enertypes=energy_types)
+    if out_type == "xg":
+        return get_xg_energies_all(outfile, energy_types, method=method)
+    return []
+
 def parse_inputcsv(args):
     std_basis = []
     xg_basis = []
@@ -114,7 +177,24 @@ def process_files(outfiles: list[str], energy_types, data, out_type: str = "std"
         update(outfile, data, **energies)
 
 
+def process_files_multijob(outfiles: list[str], energy_types, rows: list[dict], out_type: str = "std") -> None:
+    for outfile in outfiles:
+        label = os.path.basename(outfile).removesuffix(".out")
+        for step in get_eners_all(outfile, energy_types, out_type=out_type):
+            rows.append({"labels": label, **step})
+
+def main_multijob(args, energy_types):
+    rows: list[dict] = []
+    if args.outs:
+        process_files_multijob(args.outs, energy_types, rows, out_type="std")
+    if args.xgouts:
+        process_files_multijob(args.xgouts, energy_types, rows, out_type="xg")
+    return pd.DataFrame(rows)
+
 def main(args):    
+    if getattr(args, 'stdin', None):
+        add_stdin_files(args)
+
     data: dict[str, list[Optional[float]]] = {"labels": []}
     if args.input_csv:
         df = parse_inputcsv(args)
@@ -130,11 +210,14 @@ def main(args):
         data[etype] = []   # use energy type name directly as column header
 
 
-    if len(sys.argv) <= 1:
+    if not (args.outs or args.xgouts or args.input_csv):
         print("At least one output file must be provided\n")
         parser.print_help()
         sys.exit(1)
 
+    if getattr(args, 'multijob', False):
+        return main_multijob(args, energy_types)
+
 
     if args.outs:
         process_files(args.outs, energy_types, data, out_type="std")
@@ -154,5 +237,5 @@ def main(args):
 if __name__ == "__main__":
     args = parser.parse_args()
     # Dynamic data container
-    df = main(args)
+    df = profiling.run(args, main, args)
     print(df.to_string())
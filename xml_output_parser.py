@@ -1,6 +1,8 @@
 import xml.etree.ElementTree as ET
 import re
 
+import profiling
+
 def get_clean_tree(xmlfile):
     """
     Strips all tags of the url. 
@@ -10,15 +12,17 @@ def get_clean_tree(xmlfile):
     using '}' as a delimiter.
     """
     try:
-        tree = ET.parse(xmlfile)
+        with profiling.stage('xml.parse', path=xmlfile):
+            tree = ET.parse(xmlfile)
     except ET.ParseError:
         raise ValueError("Must provide a valid XML file")
     except Exception as e:
         # Handles cases like file not found, permission error, etc.
         raise ValueError("Must provide a valid XML file") from e
     
-    for elem in tree.iter():
-        elem.tag = elem.tag.split("}")[1]
+    with profiling.stage('xml.strip_ns', label=xmlfile):
+        for elem in tree.iter():
+            elem.tag = elem.tag.split("}")[1]
     return tree
 
 def find_by_attrib(nodes, key, value):
@@ -71,3 +75,77 @@ def get_xmlener(xmlfile, command='DF-MP2-F12', enertype='total energy', verbose=
 
     return float(ener)
 
+
+def _strip_ns(tag):
+    return tag.split("}")[-1]
+
+def get_xmlener_all(xmlfile, command='DF-MP2-F12',
+                    enertypes=('total energy', 'correlation energy'),
+                    loop_variables=None):
+    """
+    Get energies of every `command` jobstep from a xml file containing
+    multiple jobs (e.g. a do-loop over gem_beta or distances), in order.
+
+    The file is read in a single pass (iterparse), and each jobstep is
+    discarded once its energies are read, so memory does not grow with
+    the number of jobsteps.
+
+    Loop variables are taken from the <variables> section: array variables
+    with one value per matching jobstep (e.g. GEM_BETA) are assigned to the
+    jobsteps element-wise. `loop_variables` restricts them to the given names.
+
+    Arguments:
+        xmlfile : path to xml file
+        command : jobstep command, e.g. 'DF-MP2-F12'
+        enertypes : property names to read from each jobstep
+        loop_variables : names of variables to attach, default all arrays
+            of matching length
+
+    Returns:
+        list of dicts, one per jobstep, with keys 'jobstep' (0-based index
+        among the matching jobsteps), the enertypes (None if missing) and
+        the loop variables
+    """
+    steps = []
+    variables = {}
+    with profiling.stage('xml.iterparse', path=xmlfile):
+        try:
+            for _, elem in ET.iterparse(xmlfile, events=('end',)):
+                tag = _strip_ns(elem.tag)
+                if tag == 'jobstep':
+                    if elem.attrib.get('command') == command:
+                        step = {'jobstep': len(steps)}
+                        for enertype in enertypes:
+                            props = [
+                                node for node in elem
+                                if _strip_ns(node.tag) == 'property'
+                                and node.attrib.get('name') == enertype
+                            ]
+                            # prefer the property of the requested method
+                            preferred = [p for p in props if p.attrib.get('method') == command]
+                            props = preferred or props
+                            step[enertype] = float(props[0].attrib['value']) if props else None
+                        steps.append(step)
+                    elem.clear()
+                elif tag == 'variable':
+                    values = [
+                        node.text for node in elem if _strip_ns(node.tag) == 'value'
+                    ]
+                    variables[elem.attrib.get('name')] = values
+                    elem.clear()
+        except ET.ParseError as e:
+            raise ValueError(f"{xmlfile} is not a valid (complete) XML file") from e
+        except OSError as e:
+            raise ValueError("Must provide a valid XML file") from e
+
+    for name, values in variables.items():
+        if loop_variables is not None and name not in loop_variables:
+            continue
+        if len(values) != len(steps) or len(steps) < 2:
+            continue
+        for step, value in zip(steps, values):
+            try:
+                step[name] = float(value)
+            except (TypeError, ValueError):
+                step[name] = value
+    return steps